@@ -27,6 +27,8 @@ scheduler = BackgroundScheduler(
     {
         "apscheduler.job_defaults.max_instances": 50, 
         "apscheduler.job_defaults.misfire_grace_time": 300,
+        # jobs of the "local" jobstore run in every worker, the other ones only on the controller
+        "apscheduler.jobstores.local": {"type": "memory"},
         "apscheduler.executors.default": {
             "class": "apscheduler.executors.pool:ThreadPoolExecutor",
             "max_workers": 20
@@ -43,6 +45,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+from app.utils.controller import controller  # noqa
 from app import dashboard, jobs, routers, telegram  # noqa
 from app.routers import api_router  # noqa
 
@@ -66,12 +69,24 @@ def on_startup():
         raise ValueError(
             f"you can't use /{XRAY_SUBSCRIPTION_PATH}/ as subscription path it reserved for {app.title}"
         )
+    if not controller.elect():
+        for job in scheduler.get_jobs(jobstore="default"):
+            job.pause()
     scheduler.start()
 
 
+@controller.on_elected
+def resume_jobs():
+    # a worker taking over from the controller runs the jobs it paused on startup
+    if scheduler.running:
+        for job in scheduler.get_jobs(jobstore="default"):
+            job.resume()
+
+
 @app.on_event("shutdown")
 def on_shutdown():
     scheduler.shutdown()
+    controller.close()
 
 
 @app.exception_handler(RequestValidationError)
@@ -1,7 +1,12 @@
+from typing import Callable, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from .base import Base, SessionLocal, engine  # noqa
+from .base import AsyncSessionLocal, Base, SessionLocal, async_engine, engine  # noqa
+
+T = TypeVar("T")
 
 
 class GetDB:  # Context Manager
@@ -23,6 +28,28 @@ def get_db():  # Dependency
         yield db
 
 
+async def run_db(func: Callable[[Session], T]) -> T:
+    """
+    Runs `func` with a session from an async endpoint.
+
+    With the async engine `func` gets the sync facade of an async session, so the
+    crud functions and lazy loads work without a thread, otherwise it's run
+    on a regular session in the threadpool.
+    """
+    if AsyncSessionLocal is None:
+        def run():
+            with GetDB() as db:
+                return func(db)
+        return await run_in_threadpool(run)
+
+    async with AsyncSessionLocal() as db:
+        try:
+            return await db.run_sync(func)
+        except SQLAlchemyError:
+            await db.rollback()
+            raise
+
+
 from .crud import (create_admin, create_notification_reminder,  # noqa
                    create_user, delete_notification_reminder, get_admin,
                    get_admins, get_jwt_secret_key, get_notification_reminder,
@@ -30,7 +57,7 @@ from .crud import (create_admin, create_notification_reminder,  # noqa
                    get_tls_certificate, get_user, get_user_by_id, get_users,
                    get_users_count, remove_admin, remove_user, revoke_user_sub,
                    set_owner, update_admin, update_user, update_user_status, reset_user_by_next,
-                   update_user_sub, start_user_expire, get_admin_by_id,
+                   update_user_sub, update_users_sub, start_user_expire, get_admin_by_id,
                    get_admin_by_telegram_id)
 
 from .models import JWT, System, User  # noqa
@@ -47,6 +74,7 @@ __all__ = [
     "update_user_status",
     "start_user_expire",
     "update_user_sub",
+    "update_users_sub",
     "reset_user_by_next",
     "revoke_user_sub",
     "set_owner",
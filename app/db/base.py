@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from config import (
+    SQLALCHEMY_ASYNC_DATABASE_URL,
     SQLALCHEMY_DATABASE_URL,
     SQLALCHEMY_POOL_SIZE,
     SQLIALCHEMY_MAX_OVERFLOW,
@@ -24,6 +26,24 @@ else:
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# optional engine of the async endpoints, on the same database through an async driver
+if not SQLALCHEMY_ASYNC_DATABASE_URL:
+    async_engine = None
+elif SQLALCHEMY_ASYNC_DATABASE_URL.startswith('sqlite'):
+    async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL)
+else:
+    async_engine = create_async_engine(
+        SQLALCHEMY_ASYNC_DATABASE_URL,
+        pool_size=SQLALCHEMY_POOL_SIZE,
+        max_overflow=SQLIALCHEMY_MAX_OVERFLOW,
+        pool_recycle=3600,
+        pool_timeout=10
+    )
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autocommit=False, autoflush=False, expire_on_commit=False
+) if async_engine else None
+
 
 class Base(DeclarativeBase):
     pass
@@ -6,7 +6,7 @@ from datetime import datetime, timedelta
 from enum import Enum
 from typing import Dict, List, Optional, Tuple, Union
 
-from sqlalchemy import and_, delete, func, or_
+from sqlalchemy import Row, and_, bindparam, delete, func, or_, update
 from sqlalchemy.orm import Query, Session, joinedload
 from sqlalchemy.sql.functions import coalesce
 
@@ -17,6 +17,7 @@ from app.db.models import (
     AdminUsageLogs,
     NextPlan,
     Node,
+    NodeGroup,
     NodeUsage,
     NodeUserUsage,
     NotificationReminder,
@@ -33,7 +34,14 @@ from app.db.models import (
     TelegramUser,
 )
 from app.models.admin import AdminCreate, AdminModify, AdminPartialModify
-from app.models.node import NodeCreate, NodeModify, NodeStatus, NodeUsageResponse
+from app.models.node import (
+    NodeCreate,
+    NodeGroupCreate,
+    NodeGroupModify,
+    NodeModify,
+    NodeStatus,
+    NodeUsageResponse,
+)
 from app.models.proxy import ProxyHost as ProxyHostModify
 from app.models.user import (
     ReminderType,
@@ -45,7 +53,10 @@ from app.models.user import (
     UserUsageResponse,
 )
 from app.models.user_template import UserTemplateCreate, UserTemplateModify
-from app.utils.helpers import calculate_expiration_days, calculate_usage_percent
+from app.utils.helpers import calculate_expiration_days, calculate_usage_percent, chunks
+from app.utils.deadlines import user_deadlines
+from app.utils.directory import user_directory
+from app.utils.sub_lookup import sub_users
 from config import NOTIFY_DAYS_LEFT, NOTIFY_REACHED_USAGE_PERCENT, USERS_AUTODELETE_DAYS
 import croniter
 import logging
@@ -126,7 +137,8 @@ def add_host(db: Session, inbound_tag: str, host: ProxyHostModify) -> List[Proxy
             inbound=inbound,
             security=host.security,
             alpn=host.alpn,
-            fingerprint=host.fingerprint
+            fingerprint=host.fingerprint,
+            node_group_id=host.node_group_id
         )
     )
     db.commit()
@@ -166,6 +178,7 @@ def update_hosts(db: Session, inbound_tag: str, modified_hosts: List[ProxyHostMo
             noise_setting=host.noise_setting,
             random_user_agent=host.random_user_agent,
             use_sni_as_host=host.use_sni_as_host,
+            node_group_id=host.node_group_id,
         ) for host in modified_hosts
     ]
     db.commit()
@@ -232,6 +245,7 @@ def get_users(db: Session,
               offset: Optional[int] = None,
               limit: Optional[int] = None,
               usernames: Optional[List[str]] = None,
+              user_ids: Optional[List[int]] = None,
               search: Optional[str] = None,
               status: Optional[Union[UserStatus, list]] = None,
               sort: Optional[List[UsersSortingOptions]] = None,
@@ -247,6 +261,7 @@ def get_users(db: Session,
         offset (Optional[int]): Number of records to skip.
         limit (Optional[int]): Number of records to retrieve.
         usernames (Optional[List[str]]): List of usernames to filter by.
+        user_ids (Optional[List[int]]): List of user IDs to filter by.
         search (Optional[str]): Search term to filter by username or note.
         status (Optional[Union[UserStatus, list]]): User status or list of statuses to filter by.
         sort (Optional[List[UsersSortingOptions]]): Sorting options.
@@ -266,6 +281,9 @@ def get_users(db: Session,
     if usernames:
         query = query.filter(User.username.in_(usernames))
 
+    if user_ids:
+        query = query.filter(User.id.in_(user_ids))
+
     if status:
         if isinstance(status, list):
             query = query.filter(User.status.in_(status))
@@ -397,6 +415,7 @@ def create_user(db: Session, user: UserCreate, admin: Admin = None) -> User:
         on_hold_expire_duration=(user.on_hold_expire_duration or None),
         on_hold_timeout=(user.on_hold_timeout or None),
         auto_delete_in_days=user.auto_delete_in_days,
+        node_group_id=(user.node_group_id or None),
         next_plan=NextPlan(
             data_limit=user.next_plan.data_limit,
             expire=user.next_plan.expire,
@@ -406,7 +425,10 @@ def create_user(db: Session, user: UserCreate, admin: Admin = None) -> User:
     )
     db.add(dbuser)
     db.commit()
+    sub_users.invalidate(dbuser.username)
     db.refresh(dbuser)
+    user_directory.track(dbuser)
+    user_deadlines.track(dbuser)
     return dbuser
 
 
@@ -423,6 +445,9 @@ def remove_user(db: Session, dbuser: User) -> User:
     """
     db.delete(dbuser)
     db.commit()
+    sub_users.invalidate(dbuser.username)
+    user_directory.discard(dbuser.id)
+    user_deadlines.discard(dbuser.id)
     return dbuser
 
 
@@ -437,6 +462,10 @@ def remove_users(db: Session, dbusers: List[User]):
     for dbuser in dbusers:
         db.delete(dbuser)
     db.commit()
+    for dbuser in dbusers:
+        sub_users.invalidate(dbuser.username)
+        user_directory.discard(dbuser.id)
+        user_deadlines.discard(dbuser.id)
     return
 
 
@@ -513,6 +542,9 @@ def update_user(db: Session, dbuser: User, modify: UserModify) -> User:
     if modify.note is not None:
         dbuser.note = modify.note or None
 
+    if modify.node_group_id is not None:
+        dbuser.node_group_id = modify.node_group_id or None
+
     if modify.data_limit_reset_strategy is not None:
         dbuser.data_limit_reset_strategy = modify.data_limit_reset_strategy.value
 
@@ -535,7 +567,10 @@ def update_user(db: Session, dbuser: User, modify: UserModify) -> User:
     dbuser.edit_at = datetime.utcnow()
 
     db.commit()
+    sub_users.invalidate(dbuser.username)
     db.refresh(dbuser)
+    user_directory.track(dbuser)
+    user_deadlines.track(dbuser)
     return dbuser
 
 
@@ -567,7 +602,10 @@ def reset_user_data_usage(db: Session, dbuser: User) -> User:
     db.add(dbuser)
 
     db.commit()
+    sub_users.invalidate(dbuser.username)
     db.refresh(dbuser)
+    user_directory.track(dbuser)
+    user_deadlines.track(dbuser)
     return dbuser
 
 
@@ -605,7 +643,10 @@ def reset_user_by_next(db: Session, dbuser: User) -> User:
     db.add(dbuser)
 
     db.commit()
+    sub_users.invalidate(dbuser.username)
     db.refresh(dbuser)
+    user_directory.track(dbuser)
+    user_deadlines.track(dbuser)
     return dbuser
 
 
@@ -653,6 +694,33 @@ def update_user_sub(db: Session, dbuser: User, user_agent: str) -> User:
     return dbuser
 
 
+def update_users_sub(db: Session, updates: Dict[int, Tuple[datetime, str]]) -> int:
+    """
+    Writes buffered subscription updates in one batch.
+
+    Args:
+        db (Session): Database session.
+        updates (Dict[int, Tuple[datetime, str]]): Subscription update time and user agent by user id.
+
+    Returns:
+        int: Number of written updates.
+    """
+    if not updates:
+        return 0
+
+    stmt = update(User). \
+        where(User.id == bindparam('uid')). \
+        values(sub_updated_at=bindparam('updated_at'), sub_last_user_agent=bindparam('user_agent'))
+    params = [
+        {"uid": user_id, "updated_at": updated_at, "user_agent": user_agent}
+        for user_id, (updated_at, user_agent) in updates.items()
+    ]
+
+    db.connection().execute(stmt, params)
+    db.commit()
+    return len(params)
+
+
 def reset_all_users_data_usage(db: Session, admin: Optional[Admin] = None):
     """
     Resets the data usage for all users or users under a specific admin.
@@ -678,6 +746,9 @@ def reset_all_users_data_usage(db: Session, admin: Optional[Admin] = None):
         db.add(dbuser)
 
     db.commit()
+    sub_users.clear()
+    user_directory.invalidate()
+    user_deadlines.invalidate()
 
 
 def disable_all_active_users(db: Session, admin: Optional[Admin] = None):
@@ -695,6 +766,9 @@ def disable_all_active_users(db: Session, admin: Optional[Admin] = None):
     query.update({User.status: UserStatus.disabled, User.last_status_change: datetime.utcnow()}, synchronize_session=False)
 
     db.commit()
+    sub_users.clear()
+    user_directory.invalidate()
+    user_deadlines.invalidate()
 
 
 def activate_all_disabled_users(db: Session, admin: Optional[Admin] = None):
@@ -721,6 +795,9 @@ def activate_all_disabled_users(db: Session, admin: Optional[Admin] = None):
         {User.status: UserStatus.active, User.last_status_change: datetime.utcnow()}, synchronize_session=False)
 
     db.commit()
+    sub_users.clear()
+    user_directory.invalidate()
+    user_deadlines.invalidate()
 
 
 def autodelete_expired_users(db: Session,
@@ -827,10 +904,173 @@ def update_user_status(db: Session, dbuser: User, status: UserStatus) -> User:
     dbuser.status = status
     dbuser.last_status_change = datetime.utcnow()
     db.commit()
+    sub_users.invalidate(dbuser.username)
     db.refresh(dbuser)
+    user_directory.track(dbuser)
+    user_deadlines.track(dbuser)
     return dbuser
 
 
+def _limited_condition():
+    return and_(User.data_limit > 0, User.used_traffic >= User.data_limit)
+
+
+def _expired_condition(now: datetime):
+    return and_(User.expire > 0, User.expire <= now.timestamp())
+
+
+def get_user_directory_rows(db: Session, user_ids: Optional[List[int]] = None) -> List[Row]:
+    """
+    Retrieves the fields of users which are kept in the user directory.
+
+    Args:
+        db (Session): Database session.
+        user_ids (Optional[List[int]]): List of user IDs to filter by.
+
+    Returns:
+        List[Row]: Rows of user id, status, used traffic, data limit, expire, admin id,
+            online at, on hold timeout, edit at and created at.
+    """
+    query = db.query(
+        User.id,
+        User.status,
+        User.used_traffic,
+        User.data_limit,
+        User.expire,
+        User.admin_id,
+        User.online_at,
+        User.on_hold_timeout,
+        User.edit_at,
+        User.created_at,
+    )
+
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+
+    return query.all()
+
+
+def get_users_reaching_limits(db: Session, now: datetime, user_ids: Optional[List[int]] = None) -> List[Row]:
+    """
+    Retrieves active users which reached their data limit or expire time.
+
+    Args:
+        db (Session): Database session.
+        now (datetime): Time to check the expire time against.
+        user_ids (Optional[List[int]]): List of user IDs to filter by.
+
+    Returns:
+        List[Row]: Rows of user id, whether it's limited, whether it's expired,
+            its next plan id and whether the next plan fires on either.
+    """
+    limited, expired = _limited_condition(), _expired_condition(now)
+    query = db.query(
+        User.id,
+        limited.label('limited'),
+        expired.label('expired'),
+        NextPlan.id.label('next_plan_id'),
+        NextPlan.fire_on_either,
+    ).outerjoin(
+        NextPlan, NextPlan.user_id == User.id
+    ).filter(
+        User.status == UserStatus.active,
+        or_(limited, expired),
+    )
+
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+
+    return query.all()
+
+
+def get_on_hold_user_ids_to_activate(db: Session, now: datetime, user_ids: Optional[List[int]] = None) -> List[int]:
+    """
+    Retrieves on hold users which connected after their last change or whose timeout has passed.
+
+    Args:
+        db (Session): Database session.
+        now (datetime): Time to check the on hold timeout against.
+        user_ids (Optional[List[int]]): List of user IDs to filter by.
+
+    Returns:
+        List[int]: IDs of the users.
+    """
+    base_time = coalesce(User.edit_at, User.created_at)
+    query = db.query(User.id).filter(
+        User.status == UserStatus.on_hold,
+        or_(
+            and_(User.online_at.isnot(None), User.online_at >= base_time),
+            and_(User.on_hold_timeout.isnot(None), User.on_hold_timeout <= now),
+        )
+    )
+
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+
+    return [row.id for row in query]
+
+
+def update_users_status(db: Session, user_ids: List[int], status: UserStatus, now: datetime) -> int:
+    """
+    Changes status of active users in bulk, users which don't reach the limit
+    of the new status anymore are skipped.
+
+    Args:
+        db (Session): Database session.
+        user_ids (List[int]): IDs of the users.
+        status (UserStatus): The new status, either limited or expired.
+        now (datetime): Time of the change.
+
+    Returns:
+        int: Number of updated users.
+    """
+    condition = _limited_condition() if status == UserStatus.limited else _expired_condition(now)
+
+    count = 0
+    for chunk in chunks(user_ids):
+        count += db.query(User).filter(
+            User.id.in_(chunk),
+            User.status == UserStatus.active,
+            condition,
+        ).update({User.status: status, User.last_status_change: now}, synchronize_session=False)
+    db.commit()
+    sub_users.invalidate_ids(user_ids)
+    user_directory.invalidate_ids(user_ids)
+    return count
+
+
+def activate_on_hold_users(db: Session, user_ids: List[int], now: datetime) -> int:
+    """
+    Activates on hold users in bulk and starts their expiration timer.
+
+    Args:
+        db (Session): Database session.
+        user_ids (List[int]): IDs of the users.
+        now (datetime): Time of the change.
+
+    Returns:
+        int: Number of activated users.
+    """
+    count = 0
+    for chunk in chunks(user_ids):
+        # ordered, MySQL evaluates assignments left to right
+        stmt = update(User).where(
+            User.id.in_(chunk),
+            User.status == UserStatus.on_hold,
+        ).ordered_values(
+            (User.expire, int(now.timestamp()) + User.on_hold_expire_duration),
+            (User.on_hold_expire_duration, None),
+            (User.on_hold_timeout, None),
+            (User.status, UserStatus.active),
+            (User.last_status_change, now),
+        ).execution_options(synchronize_session=False)
+        count += db.execute(stmt).rowcount
+    db.commit()
+    sub_users.invalidate_ids(user_ids)
+    user_directory.invalidate_ids(user_ids)
+    return count
+
+
 def set_owner(db: Session, dbuser: User, admin: Admin) -> User:
     """
     Sets the owner (admin) of a user.
@@ -845,7 +1085,10 @@ def set_owner(db: Session, dbuser: User, admin: Admin) -> User:
     """
     dbuser.admin = admin
     db.commit()
+    sub_users.invalidate(dbuser.username)
     db.refresh(dbuser)
+    user_directory.track(dbuser)
+    user_deadlines.track(dbuser)
     return dbuser
 
 
@@ -865,7 +1108,10 @@ def start_user_expire(db: Session, dbuser: User) -> User:
     dbuser.on_hold_expire_duration = None
     dbuser.on_hold_timeout = None
     db.commit()
+    sub_users.invalidate(dbuser.username)
     db.refresh(dbuser)
+    user_directory.track(dbuser)
+    user_deadlines.track(dbuser)
     return dbuser
 
 
@@ -1013,6 +1259,8 @@ def remove_admin(db: Session, dbadmin: Admin) -> Admin:
     """
     db.delete(dbadmin)
     db.commit()
+    sub_users.clear()
+    user_directory.invalidate()
     return dbadmin
 
 
@@ -1114,6 +1362,7 @@ def create_user_template(db: Session, user_template: UserTemplateCreate) -> User
         expire_duration=user_template.expire_duration,
         username_prefix=user_template.username_prefix,
         username_suffix=user_template.username_suffix,
+        node_group_id=(user_template.node_group_id or None),
         inbounds=db.query(ProxyInbound).filter(ProxyInbound.tag.in_(inbound_tags)).all()
     )
     db.add(dbuser_template)
@@ -1145,6 +1394,8 @@ def update_user_template(
         dbuser_template.username_prefix = modified_user_template.username_prefix
     if modified_user_template.username_suffix is not None:
         dbuser_template.username_suffix = modified_user_template.username_suffix
+    if modified_user_template.node_group_id is not None:
+        dbuser_template.node_group_id = modified_user_template.node_group_id or None
 
     if modified_user_template.inbounds:
         inbound_tags: List[str] = []
@@ -1205,6 +1456,93 @@ def get_user_templates(
     return dbuser_templates.all()
 
 
+def get_node_group(db: Session, node_group_id: int) -> Optional[NodeGroup]:
+    """
+    Retrieves a node group by its ID.
+
+    Args:
+        db (Session): The database session.
+        node_group_id (int): The ID of the node group to retrieve.
+
+    Returns:
+        Optional[NodeGroup]: The NodeGroup object if found, None otherwise.
+    """
+    return db.query(NodeGroup).filter(NodeGroup.id == node_group_id).first()
+
+
+def get_node_groups(db: Session) -> List[NodeGroup]:
+    """
+    Retrieves all node groups.
+
+    Args:
+        db (Session): The database session.
+
+    Returns:
+        List[NodeGroup]: A list of all NodeGroup objects.
+    """
+    return db.query(NodeGroup).all()
+
+
+def create_node_group(db: Session, node_group: NodeGroupCreate) -> NodeGroup:
+    """
+    Creates a new node group in the database.
+
+    Args:
+        db (Session): The database session.
+        node_group (NodeGroupCreate): The node group creation model.
+
+    Returns:
+        NodeGroup: The newly created NodeGroup object.
+    """
+    dbnode_group = NodeGroup(name=node_group.name)
+    db.add(dbnode_group)
+    db.commit()
+    db.refresh(dbnode_group)
+    return dbnode_group
+
+
+def update_node_group(db: Session, dbnode_group: NodeGroup, modify: NodeGroupModify) -> NodeGroup:
+    """
+    Updates the name of a node group.
+
+    Args:
+        db (Session): The database session.
+        dbnode_group (NodeGroup): The NodeGroup object to be updated.
+        modify (NodeGroupModify): The modification model containing the new name.
+
+    Returns:
+        NodeGroup: The updated NodeGroup object.
+    """
+    dbnode_group.name = modify.name
+    db.commit()
+    db.refresh(dbnode_group)
+    return dbnode_group
+
+
+def remove_node_group(db: Session, dbnode_group: NodeGroup) -> NodeGroup:
+    """
+    Removes a node group, its nodes, users, templates and hosts are left without a group.
+
+    Args:
+        db (Session): The database session.
+        dbnode_group (NodeGroup): The NodeGroup object to be removed.
+
+    Returns:
+        NodeGroup: The removed NodeGroup object.
+    """
+    for model in (Node, User, UserTemplate, ProxyHost):
+        db.execute(
+            update(model)
+            .where(model.node_group_id == dbnode_group.id)
+            .values(node_group_id=None)
+            .execution_options(synchronize_session=False)
+        )
+    db.delete(dbnode_group)
+    db.commit()
+    sub_users.clear()
+    return dbnode_group
+
+
 def get_node(db: Session, name: str) -> Optional[Node]:
     """
     Retrieves a node by its name.
@@ -1314,7 +1652,8 @@ def create_node(db: Session, node: NodeCreate) -> Node:
     dbnode = Node(name=node.name,
                   address=node.address,
                   port=node.port,
-                  api_port=node.api_port)
+                  api_port=node.api_port,
+                  node_group_id=(node.node_group_id or None))
 
     db.add(dbnode)
     db.commit()
@@ -1372,6 +1711,9 @@ def update_node(db: Session, dbnode: Node, modify: NodeModify) -> Node:
     if modify.usage_coefficient:
         dbnode.usage_coefficient = modify.usage_coefficient
 
+    if modify.node_group_id is not None:
+        dbnode.node_group_id = modify.node_group_id or None
+
     db.commit()
     db.refresh(dbnode)
     return dbnode
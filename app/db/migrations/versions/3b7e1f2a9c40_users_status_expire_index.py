@@ -0,0 +1,23 @@
+"""users status expire index
+
+Revision ID: 3b7e1f2a9c40
+Revises: dd1234567894
+Create Date: 2026-10-17 10:12:31.418206
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e1f2a9c40'
+down_revision = 'dd1234567894'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_status_expire', 'users', ['status', 'expire'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_status_expire', table_name='users')
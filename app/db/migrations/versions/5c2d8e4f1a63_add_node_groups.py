@@ -0,0 +1,51 @@
+"""add node groups
+
+Revision ID: 5c2d8e4f1a63
+Revises: 3b7e1f2a9c40
+Create Date: 2026-10-17 15:40:12.503914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2d8e4f1a63'
+down_revision = '3b7e1f2a9c40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'node_groups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('node_group_id', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_users_node_group_id', ['node_group_id'], unique=False)
+        batch_op.create_foreign_key('fk_users_node_group_id', 'node_groups', ['node_group_id'], ['id'])
+
+    for table in ('nodes', 'hosts', 'user_templates'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('node_group_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(f'fk_{table}_node_group_id', 'node_groups', ['node_group_id'], ['id'])
+
+
+def downgrade() -> None:
+    for table in ('nodes', 'hosts', 'user_templates'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(f'fk_{table}_node_group_id', type_='foreignkey')
+            batch_op.drop_column('node_group_id')
+
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_constraint('fk_users_node_group_id', type_='foreignkey')
+        batch_op.drop_index('ix_users_node_group_id')
+        batch_op.drop_column('node_group_id')
+
+    op.drop_table('node_groups')
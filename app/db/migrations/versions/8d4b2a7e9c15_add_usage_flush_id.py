@@ -0,0 +1,24 @@
+"""add usage flush id to system
+
+Revision ID: 8d4b2a7e9c15
+Revises: 5c2d8e4f1a63
+Create Date: 2026-10-17 18:20:41.127305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4b2a7e9c15'
+down_revision = '5c2d8e4f1a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('system', sa.Column('usage_flush_id', sa.String(32), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('system', 'usage_flush_id')
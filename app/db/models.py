@@ -10,6 +10,7 @@ from sqlalchemy import (
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
@@ -87,6 +88,9 @@ class TelegramUser(Base):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index('ix_users_status_expire', 'status', 'expire'),
+    )
 
     id = Column(Integer, primary_key=True)
     username = Column(String(34, collation='NOCASE'), unique=True, index=True)
@@ -126,6 +130,11 @@ class User(Base):
     telegram_user_id = Column(Integer, ForeignKey("telegram_users.id"), nullable=True, index=True)
     telegram_user = relationship("TelegramUser", back_populates="marzban_users")
 
+    # NULL: the user is on the main core and the nodes without a group only,
+    # which carry every user regardless of its group, see NodeGroup
+    node_group_id = Column(Integer, ForeignKey("node_groups.id"), nullable=True, index=True)
+    node_group = relationship("NodeGroup", back_populates="users")
+
     next_plan = relationship(
         "NextPlan",
         uselist=False,
@@ -213,6 +222,7 @@ class UserTemplate(Base):
     expire_duration = Column(BigInteger, default=0)  # in seconds
     username_prefix = Column(String(20), nullable=True)
     username_suffix = Column(String(20), nullable=True)
+    node_group_id = Column(Integer, ForeignKey("node_groups.id"), nullable=True)
 
     inbounds = relationship(
         "ProxyInbound", secondary=template_inbounds_association
@@ -295,6 +305,8 @@ class ProxyHost(Base):
     noise_setting = Column(String(2000), nullable=True)
     random_user_agent = Column(Boolean, nullable=False, default=False, server_default='0')
     use_sni_as_host = Column(Boolean, nullable=False, default=False, server_default="0")
+    # NULL: given to every user
+    node_group_id = Column(Integer, ForeignKey("node_groups.id"), nullable=True)
 
 
 class System(Base):
@@ -303,6 +315,8 @@ class System(Base):
     id = Column(Integer, primary_key=True)
     uplink = Column(BigInteger, default=0)
     downlink = Column(BigInteger, default=0)
+    # flush_id of the last flush of users usage, written along with the usage, see UsageSnapshot
+    usage_flush_id = Column(String(32), nullable=True)
 
 
 class JWT(Base):
@@ -322,6 +336,21 @@ class TLS(Base):
     certificate = Column(String(2048), nullable=False)
 
 
+class NodeGroup(Base):
+    """
+    A share of the users and the nodes which serve them. The nodes of a group carry only the users
+    of the group, the nodes without a group and the main core carry every user,
+    and the hosts of a group are given to the users of the group only.
+    """
+    __tablename__ = "node_groups"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), nullable=False, unique=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    nodes = relationship("Node", back_populates="node_group")
+    users = relationship("User", back_populates="node_group")
+
+
 class Node(Base):
     __tablename__ = "nodes"
 
@@ -340,6 +369,8 @@ class Node(Base):
     user_usages = relationship("NodeUserUsage", back_populates="node", cascade="all, delete-orphan")
     usages = relationship("NodeUsage", back_populates="node", cascade="all, delete-orphan")
     usage_coefficient = Column(Float, nullable=False, server_default=text("1.0"), default=1)
+    node_group_id = Column(Integer, ForeignKey("node_groups.id"), nullable=True)
+    node_group = relationship("NodeGroup", back_populates="nodes")
 
 
 class NodeUserUsage(Base):
@@ -1,11 +1,11 @@
 from typing import Optional, Union
 from app.models.admin import AdminInDB, AdminValidationResult, Admin
 from app.models.user import UserResponse, UserStatus
-from app.db import Session, crud, get_db
+from app.db import Session, crud, get_db, run_db
 from config import SUDOERS
 from fastapi import Depends, HTTPException
 from datetime import datetime, timezone, timedelta
-from app.utils.jwt import get_subscription_payload
+from app.utils.sub_lookup import SubscriptionUser, sub_users, token_payloads
 
 
 def validate_admin(db: Session, username: str, password: str) -> Optional[AdminValidationResult]:
@@ -36,6 +36,20 @@ def get_dbnode(node_id: int, db: Session = Depends(get_db)):
     return dbnode
 
 
+def get_node_group(node_group_id: int, db: Session = Depends(get_db)):
+    """Fetch a node group by its ID from the database, raising a 404 error if not found."""
+    dbnode_group = crud.get_node_group(db, node_group_id)
+    if not dbnode_group:
+        raise HTTPException(status_code=404, detail="Node group not found")
+    return dbnode_group
+
+
+def validate_node_group(db: Session, node_group_id: Optional[int]):
+    """Raise a 400 error if a node group is given which doesn't exist, 0 and None mean no group."""
+    if node_group_id and not crud.get_node_group(db, node_group_id):
+        raise HTTPException(status_code=400, detail=f"Node group {node_group_id} doesn't exist")
+
+
 def validate_dates(start: Optional[Union[str, datetime]], end: Optional[Union[str, datetime]]) -> (datetime, datetime):
     """Validate if start and end dates are correct and if end is after start."""
     try:
@@ -68,18 +82,42 @@ def get_validated_sub(
         token: str,
         db: Session = Depends(get_db)
 ) -> UserResponse:
-    sub = get_subscription_payload(token)
+    sub = token_payloads.get(token)
     if not sub:
         raise HTTPException(status_code=404, detail="Not Found")
 
     dbuser = crud.get_user(db, sub['username'])
-    if not dbuser or dbuser.created_at > sub['created_at']:
+    _validate_sub(dbuser, sub)
+    return dbuser
+
+
+async def get_validated_sub_user(token: str) -> SubscriptionUser:
+    """Same as get_validated_sub for async endpoints, the user may come from the subscription users cache"""
+    sub = token_payloads.get(token)
+    if not sub:
         raise HTTPException(status_code=404, detail="Not Found")
 
-    if dbuser.sub_revoked_at and dbuser.sub_revoked_at > sub['created_at']:
+    sub_user, generation = sub_users.lookup(sub['username'])
+    if sub_user is None:
+        sub_user = await run_db(lambda db: _load_sub_user(db, sub['username']))
+        if sub_user:
+            sub_users.store(sub_user, generation)
+
+    _validate_sub(sub_user, sub)
+    return sub_user
+
+
+def _load_sub_user(db: Session, username: str) -> Optional[SubscriptionUser]:
+    dbuser = crud.get_user(db, username)
+    return SubscriptionUser(dbuser) if dbuser else None
+
+
+def _validate_sub(user: Union[UserResponse, SubscriptionUser, None], sub: dict):
+    if not user or user.created_at > sub['created_at']:
         raise HTTPException(status_code=404, detail="Not Found")
 
-    return dbuser
+    if user.sub_revoked_at and user.sub_revoked_at > sub['created_at']:
+        raise HTTPException(status_code=404, detail="Not Found")
 
 
 def get_validated_user(
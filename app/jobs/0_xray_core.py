@@ -1,40 +1,123 @@
+import asyncio
+import random
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
 
 from app import app, logger, scheduler, xray
 from app.db import GetDB, crud
 from app.models.node import NodeStatus
-from config import JOB_CORE_HEALTH_CHECK_INTERVAL
+from app.utils.concurrency import jobs_loop, run_in_executor
+from app.utils.controller import controller
+from app.utils.metrics import metrics
+from app.xray.node import XRayNode
+from config import (
+    JOB_CORE_HEALTH_CHECK_INTERVAL,
+    JOB_NODE_HEARTBEAT_INTERVAL,
+    NODE_HEALTH_CHECK_TIMEOUT,
+    NODE_RECONNECT_MAX_BACKOFF
+)
 from xray_api import exc as xray_exc
 
+heartbeat_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="node-heartbeat")
+
+# node id -> (failed reconnects in a row, monotonic time the next one is due)
+_reconnects: Dict[int, Tuple[int, float]] = {}
+
+
+def _reconnect_due(node_id: int, now: float) -> bool:
+    return _reconnects.get(node_id, (0, 0.0))[1] <= now
+
+
+def _reconnect_scheduled(node_id: int, now: float):
+    """Pushes back the next reconnect, doubling the delay with jitter so a fleet which failed together spreads out"""
+    attempts = _reconnects.get(node_id, (0, 0.0))[0] + 1
+    delay = min(NODE_RECONNECT_MAX_BACKOFF, JOB_CORE_HEALTH_CHECK_INTERVAL * 2 ** (attempts - 1))
+    _reconnects[node_id] = (attempts, now + delay * random.uniform(0.5, 1.5))
+
+
+async def check_node(node: XRayNode) -> bool:
+    """Whether the node is connected and its core answers"""
+    def get_api():
+        return node.api if node.connected and node.started else None
+
+    # the state is cached but a stale cache, or an RPyC node, sends blocking requests
+    api = await run_in_executor(heartbeat_executor, get_api)
+    if api is None:
+        return False
+    try:
+        await api.aio.get_sys_stats(timeout=NODE_HEALTH_CHECK_TIMEOUT)
+    except (ConnectionError, xray_exc.XrayError):
+        return False
+    return True
+
+
+async def check_nodes(nodes: Dict[int, XRayNode]) -> Dict[int, Tuple[bool, float]]:
+    """Checks the nodes at once, each within its own deadline, returns whether each is healthy and how long it took"""
+    async def check(node: XRayNode) -> Tuple[bool, float]:
+        start = time.perf_counter()
+        try:
+            healthy = await asyncio.wait_for(check_node(node), NODE_HEALTH_CHECK_TIMEOUT)
+        except Exception:
+            healthy = False
+        return healthy, time.perf_counter() - start
+
+    results = await asyncio.gather(*(check(node) for node in nodes.values()))
+    return dict(zip(nodes, results))
+
 
 def core_health_check():
-    config = None
+    config: Optional[dict] = None
 
     # main core
     if not xray.core.started:
-        if not config:
-            config = xray.config.include_db_users()
+        config = xray.config.include_db_users()
         xray.core.restart(config)
 
-    # nodes' core
-    for node_id, node in list(xray.nodes.items()):
-        if node.connected:
-            try:
-                assert node.started
-                node.api.get_sys_stats(timeout=2)
-            except (ConnectionError, xray_exc.XrayError, AssertionError):
-                if not config:
-                    config = xray.config.include_db_users()
-                xray.operations.restart_node(node_id, config)
-
-        if not node.connected:
-            if not config:
-                config = xray.config.include_db_users()
-            xray.operations.connect_node(node_id, config)
-
-
-@app.on_event("startup")
+    # nodes' core, the ones being connected or restarted already are left be
+    start = time.perf_counter()
+    nodes = {node_id: node for node_id, node in list(xray.nodes.items())
+             if not xray.operations.is_node_busy(node_id)}
+    results = jobs_loop.run(check_nodes(nodes)) if nodes else {}
+
+    now = time.monotonic()
+    reconnecting = []
+    for node_id, (healthy, _) in results.items():
+        if healthy:
+            _reconnects.pop(node_id, None)
+            continue
+        if not _reconnect_due(node_id, now):
+            continue
+
+        if config is None:
+            config = xray.config.include_db_users()
+        # restart_node connects the node itself when it's disconnected
+        xray.operations.restart_node(node_id, config)
+        _reconnect_scheduled(node_id, now)
+        reconnecting.append(node_id)
+
+    for node_id in list(_reconnects):
+        if node_id not in xray.nodes:
+            del _reconnects[node_id]
+
+    metrics.update(
+        "node_health_check",
+        elapsed=round(time.perf_counter() - start, 3),
+        checked=len(results),
+        unhealthy=sum(not healthy for healthy, _ in results.values()),
+        reconnecting=reconnecting,
+        latency={str(node_id): round(latency, 3) for node_id, (_, latency) in results.items()}
+    )
+
+
+def node_heartbeat():
+    """Refreshes the cached state of the nodes, nodes whose breaker is open are skipped until it lets a check through"""
+    nodes = [node for node in list(xray.nodes.values()) if node.health.may_check]
+    list(heartbeat_executor.map(lambda node: node.check(), nodes))
+
+
+@controller.on_elected
 def start_core():
     logger.info("Generating Xray core config")
 
@@ -63,6 +146,9 @@ def start_core():
     scheduler.add_job(core_health_check, 'interval',
                       seconds=JOB_CORE_HEALTH_CHECK_INTERVAL,
                       coalesce=True, max_instances=1)
+    scheduler.add_job(node_heartbeat, 'interval',
+                      seconds=JOB_NODE_HEARTBEAT_INTERVAL,
+                      coalesce=True, max_instances=1)
 
 
 @app.on_event("shutdown")
@@ -0,0 +1,34 @@
+from app import app, logger, scheduler
+from app.db import GetDB, crud
+from app.utils.metrics import metrics
+from app.utils.sub_updates import sub_updates
+from config import JOB_FLUSH_SUB_UPDATES_INTERVAL
+
+
+def flush_sub_updates():
+    pending = sub_updates.drain()
+    if not pending:
+        return
+
+    try:
+        with GetDB() as db:
+            flushed = crud.update_users_sub(db, pending)
+    except Exception:
+        sub_updates.restore(pending)
+        raise
+
+    metrics.incr("sub_updates", "flushed", flushed)
+    metrics.incr("sub_updates", "flushes")
+
+
+if JOB_FLUSH_SUB_UPDATES_INTERVAL:
+    scheduler.add_job(flush_sub_updates, 'interval',
+                      seconds=JOB_FLUSH_SUB_UPDATES_INTERVAL,
+                      coalesce=True, max_instances=1, jobstore="local")
+
+    @app.on_event("shutdown")
+    def flush_sub_updates_on_shutdown():
+        try:
+            flush_sub_updates()
+        except Exception as err:
+            logger.error(f"Unable to flush pending subscription updates: {err}")
@@ -0,0 +1,123 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app import logger, scheduler, xray
+from app.models.proxy import ProxyTypes
+from app.utils.concurrency import jobs_loop
+from app.utils.metrics import metrics
+from app.xray.config import clients_digest
+from config import JOB_RECONCILE_USERS_INTERVAL, XRAY_SYNC_BATCH_SIZE
+from xray_api import AsyncXRay as AsyncXRayAPI
+from xray_api import XRay as XRayAPI
+from xray_api import exc as xray_exc
+
+
+async def run_batched(calls: List[Callable[[], Awaitable]]) -> Tuple[int, int]:
+    """Runs the calls a batch at a time, each batch at once, returns how many succeeded and failed"""
+    done = failed = 0
+    for start in range(0, len(calls), XRAY_SYNC_BATCH_SIZE):
+        results = await asyncio.gather(*(call() for call in calls[start:start + XRAY_SYNC_BATCH_SIZE]),
+                                       return_exceptions=True)
+        for result in results:
+            # the user was already added or removed, by the sync queue most likely
+            if isinstance(result, Exception) and \
+                    not isinstance(result, (xray_exc.EmailExistsError, xray_exc.EmailNotFoundError)):
+                failed += 1
+            else:
+                done += 1
+    return done, failed
+
+
+async def reconcile_core(api: AsyncXRayAPI, node_group_id: Optional[int] = None) -> dict:
+    """
+    Compares the users of each inbound of a core with the clients it should have and repairs the differences,
+    the cores of the nodes in `node_group_id` should have the users of the group only.
+
+    The users are fetched before the expected clients are read, and users are changed in the
+    clients index before their operations are queued, so a change made meanwhile is never undone.
+    Inbounds whose digest matches are skipped, only users missing or extra on an inbound are repaired,
+    changed settings of users which exist on both sides are left to the sync queue and restarts.
+    """
+    stats = {"inbounds": 0, "drifted": 0, "missing": 0, "extra": 0, "repaired": 0, "failed": 0}
+    for tag, inbound in list(xray.config.inbounds_by_tag.items()):
+        try:
+            users = await api.get_inbound_users(tag, timeout=30)
+        except xray_exc.XrayError as err:
+            # cores older than Xray v25 have no GetInboundUsers
+            stats["error"] = err.details
+            break
+
+        emails = [user.email for user in users]
+        stats["inbounds"] += 1
+        if xray.config.get_clients_digest(tag, node_group_id) in (None, clients_digest(emails)):
+            continue
+
+        clients = xray.config.get_inbound_clients(tag, node_group_id)
+        actual = set(emails)
+        missing = [email for email in clients if email not in actual]
+        extra = list(actual.difference(clients))
+        if not (missing or extra):
+            continue
+
+        stats["drifted"] += 1
+        stats["missing"] += len(missing)
+        stats["extra"] += len(extra)
+
+        proxy_type = ProxyTypes(inbound['protocol'])
+        calls = [lambda email=email: api.remove_inbound_user(tag, email, timeout=10) for email in extra]
+        calls.extend(lambda client=clients[email]: api.add_inbound_user(tag, proxy_type.account_model(**client),
+                                                                        timeout=10)
+                     for email in missing)
+        repaired, failed = await run_batched(calls)
+        stats["repaired"] += repaired
+        stats["failed"] += failed
+
+    return stats
+
+
+async def reconcile_cores(
+        api_instances: Dict[Optional[int], Tuple[XRayAPI, Optional[int]]]) -> Dict[Optional[int], dict]:
+    """Reconciles the cores at once, `api_instances` maps node ids to the API of the core and the node's group"""
+    results = await asyncio.gather(*(reconcile_core(api.aio, node_group_id)
+                                     for api, node_group_id in api_instances.values()),
+                                   return_exceptions=True)
+    return {
+        node_id: {"error": str(result) or type(result).__name__} if isinstance(result, Exception) else result
+        for node_id, result in zip(api_instances, results)
+    }
+
+
+def reconcile_users():
+    api_instances = {}
+    if xray.core.started:
+        api_instances[None] = (xray.api, None)
+    for node_id, node in list(xray.nodes.items()):
+        # a node which is being (re)started gets its users with the config
+        if not xray.operations.is_node_busy(node_id) and node.connected and node.started:
+            api_instances[node_id] = (node.api, node.node_group_id)
+
+    if not api_instances:
+        return
+
+    start = time.perf_counter()
+    results = jobs_loop.run(reconcile_cores(api_instances))
+
+    cores = {}
+    for node_id, stats in results.items():
+        name = "main core" if node_id is None else f"node {node_id}"
+        if stats.get("missing") or stats.get("extra"):
+            logger.warning(f"Users of {name} drifted, {stats['missing']} missing and {stats['extra']} extra, "
+                           f"{stats['repaired']} repaired")
+        if stats.get("error"):
+            logger.warning(f"Unable to reconcile users of {name}: {stats['error']}")
+        cores["master" if node_id is None else str(node_id)] = stats
+        metrics.incr("user_reconcile", "repaired_total", stats.get("repaired", 0))
+
+    metrics.update("user_reconcile", elapsed=round(time.perf_counter() - start, 3), cores=cores)
+
+
+if JOB_RECONCILE_USERS_INTERVAL:
+    scheduler.add_job(reconcile_users, 'interval',
+                      seconds=JOB_RECONCILE_USERS_INTERVAL,
+                      coalesce=True, max_instances=1)
@@ -1,36 +1,59 @@
+import asyncio
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from operator import attrgetter
-from typing import Union
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, Union
 
 from pymysql.err import OperationalError
-from sqlalchemy import and_, bindparam, insert, select, update
+from sqlalchemy import Table, and_, bindparam, insert, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from sqlalchemy.sql.dml import Insert
 
-from app import scheduler, xray
+from app import app, logger, scheduler, xray
 from app.db import GetDB
 from app.db.models import Admin, NodeUsage, NodeUserUsage, System, User
+from app.utils.concurrency import jobs_loop
+from app.utils.controller import controller
+from app.utils.deadlines import user_deadlines
+from app.utils.directory import user_directory
+from app.utils.usage import (SpillingUsageAccumulator, UsageAccumulator,
+                             UsageSnapshot, parse_user_stats, sum_user_stats)
 from config import (
     DISABLE_RECORDING_NODE_USAGE,
+    JOB_FLUSH_USER_USAGES_INTERVAL,
     JOB_RECORD_NODE_USAGES_INTERVAL,
     JOB_RECORD_USER_USAGES_INTERVAL,
+    USAGE_SPILL_FILE,
 )
+from xray_api import AsyncXRay as AsyncXRayAPI
 from xray_api import XRay as XRayAPI
 from xray_api import exc as xray_exc
 
+T = TypeVar("T")
 
-def safe_execute(db: Session, stmt, params=None):
+# kept in memory until the process is elected, the spill file belongs to the controller alone
+accumulator = UsageAccumulator()
+
+
+def safe_execute(db: Session, stmt, params=None, ignore_duplicates: bool = True):
+    safe_execute_all(db, [(stmt, params)], ignore_duplicates=ignore_duplicates)
+
+
+def safe_execute_all(db: Session, statements: List[Tuple[Any, Any]], ignore_duplicates: bool = True):
+    """Executes the (statement, params) pairs in a single transaction, so either all or none of them are written"""
     if db.bind.name == 'mysql':
-        if isinstance(stmt, Insert):
-            stmt = stmt.prefix_with('IGNORE')
+        if ignore_duplicates:
+            statements = [(stmt.prefix_with('IGNORE') if isinstance(stmt, Insert) else stmt, params)
+                          for stmt, params in statements]
 
         tries = 0
         done = False
         while not done:
             try:
-                db.connection().execute(stmt, params)
+                for stmt, params in statements:
+                    db.connection().execute(stmt, params)
                 db.commit()
                 done = True
             except OperationalError as err:
@@ -41,29 +64,60 @@ def safe_execute(db: Session, stmt, params=None):
                 raise err
 
     else:
-        db.connection().execute(stmt, params)
-        db.commit()
+        try:
+            for stmt, params in statements:
+                db.connection().execute(stmt, params)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+
+def get_upsert_stmt(db: Session, table: Table, index_elements: tuple, increments: tuple) -> Optional[Insert]:
+    """
+    Returns an insert statement which adds the `increments` columns to the existing row
+    if a row with the same `index_elements` (a unique constraint of the table) exists,
+    or None if the database dialect has no native upsert.
+    """
+    if db.bind.name == 'mysql':
+        stmt = mysql_insert(table)
+        return stmt.on_duplicate_key_update({c: table.c[c] + stmt.inserted[c] for c in increments})
+
+    if db.bind.name in ('sqlite', 'postgresql'):
+        stmt = (sqlite_insert if db.bind.name == 'sqlite' else postgresql_insert)(table)
+        return stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={c: table.c[c] + stmt.excluded[c] for c in increments}
+        )
+
+
+def get_hour_bucket() -> datetime:
+    return datetime.fromisoformat(datetime.utcnow().strftime('%Y-%m-%dT%H:00:00'))
 
 
 def record_user_stats(params: list, node_id: Union[int, None],
-                      consumption_factor: int = 1):
+                      consumption_factor: int = 1, created_at: datetime = None):
     if not params:
         return
 
-    created_at = datetime.fromisoformat(datetime.utcnow().strftime('%Y-%m-%dT%H:00:00'))
+    if created_at is None:
+        created_at = get_hour_bucket()
 
     with GetDB() as db:
+        # NULL never conflicts in a unique constraint, so master core's rows can't be upserted
+        stmt = get_upsert_stmt(db, NodeUserUsage.__table__, ('created_at', 'user_id', 'node_id'),
+                               ('used_traffic',)) if node_id is not None else None
+        if stmt is not None:
+            rows = [{"created_at": created_at, "user_id": int(p['uid']), "node_id": node_id,
+                     "used_traffic": int(p['value'] * consumption_factor)} for p in params]
+            safe_execute(db, stmt, rows, ignore_duplicates=False)
+            return
+
         # make user usage row if doesn't exist
         select_stmt = select(NodeUserUsage.user_id) \
             .where(and_(NodeUserUsage.node_id == node_id, NodeUserUsage.created_at == created_at))
-        existings = [r[0] for r in db.execute(select_stmt).fetchall()]
-        uids_to_insert = set()
-
-        for p in params:
-            uid = int(p['uid'])
-            if uid in existings:
-                continue
-            uids_to_insert.add(uid)
+        existings = {r[0] for r in db.execute(select_stmt).fetchall()}
+        uids_to_insert = {int(p['uid']) for p in params} - existings
 
         if uids_to_insert:
             stmt = insert(NodeUserUsage).values(
@@ -87,9 +141,17 @@ def record_node_stats(params: dict, node_id: Union[int, None]):
     if not params:
         return
 
-    created_at = datetime.fromisoformat(datetime.utcnow().strftime('%Y-%m-%dT%H:00:00'))
+    created_at = get_hour_bucket()
+    up = sum(p['up'] for p in params)
+    down = sum(p['down'] for p in params)
 
     with GetDB() as db:
+        stmt = get_upsert_stmt(db, NodeUsage.__table__, ('created_at', 'node_id'),
+                               ('uplink', 'downlink')) if node_id is not None else None
+        if stmt is not None:
+            row = {"created_at": created_at, "node_id": node_id, "uplink": up, "downlink": down}
+            safe_execute(db, stmt, [row], ignore_duplicates=False)
+            return
 
         # make node usage row if doesn't exist
         select_stmt = select(NodeUsage.node_id). \
@@ -101,86 +163,140 @@ def record_node_stats(params: dict, node_id: Union[int, None]):
 
         # record
         stmt = update(NodeUsage). \
-            values(uplink=NodeUsage.uplink + bindparam('up'), downlink=NodeUsage.downlink + bindparam('down')). \
+            values(uplink=NodeUsage.uplink + up, downlink=NodeUsage.downlink + down). \
             where(and_(NodeUsage.node_id == node_id, NodeUsage.created_at == created_at))
 
-        safe_execute(db, stmt, params)
+        safe_execute(db, stmt)
 
 
-def get_users_stats(api: XRayAPI):
+async def get_users_stats(api: AsyncXRayAPI) -> bytes:
     try:
-        params = defaultdict(int)
-        for stat in filter(attrgetter('value'), api.get_users_stats(reset=True, timeout=30)):
-            params[stat.name.split('.', 1)[0]] += stat.value
-        params = list({"uid": uid, "value": value} for uid, value in params.items())
-        return params
+        return await api.query_stats_data("user>>>", reset=True, timeout=30)
     except xray_exc.XrayError:
-        return []
+        return b""
 
 
-def get_outbounds_stats(api: XRayAPI):
+async def get_outbounds_stats(api: AsyncXRayAPI):
     try:
         params = [{"up": stat.value, "down": 0} if stat.link == "uplink" else {"up": 0, "down": stat.value}
-                  for stat in filter(attrgetter('value'), api.get_outbounds_stats(reset=True, timeout=10))]
+                  for stat in await api.get_outbounds_stats(reset=True, timeout=10)
+                  if stat.value]
         return params
     except xray_exc.XrayError:
         return []
 
 
+async def gather_stats(get_stats: Callable[[AsyncXRayAPI], Awaitable[T]],
+                       api_instances: Dict[Optional[int], XRayAPI]) -> Dict[Optional[int], T]:
+    """Queries every core at once on the jobs loop"""
+    results = await asyncio.gather(*(get_stats(api.aio) for api in api_instances.values()))
+    return dict(zip(api_instances, results))
+
+
 def record_user_usages():
     api_instances = {None: xray.api}
     usage_coefficient = {None: 1}  # default usage coefficient for the main api instance
 
     for node_id, node in list(xray.nodes.items()):
+        # the nodes of a group without active users have no users' stats
+        if node.node_group_id is not None and not xray.config.get_group_size(node.node_group_id):
+            continue
         if node.connected and node.started:
             api_instances[node_id] = node.api
             usage_coefficient[node_id] = node.usage_coefficient  # fetch the usage coefficient
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {node_id: executor.submit(get_users_stats, api) for node_id, api in api_instances.items()}
-    api_params = {node_id: future.result() for node_id, future in futures.items()}
+    api_data = jobs_loop.run(gather_stats(get_users_stats, api_instances))
+    api_params = {node_id: parse_user_stats(data) for node_id, data in api_data.items()}
 
-    users_usage = defaultdict(int)
-    for node_id, params in api_params.items():
-        coefficient = usage_coefficient.get(node_id, 1)  # get the usage coefficient for the node
-        for param in params:
-            users_usage[param['uid']] += int(param['value'] * coefficient)  # apply the usage coefficient
-    users_usage = list({"uid": uid, "value": value} for uid, value in users_usage.items())
-    if not users_usage:
+    users_usage, nodes_usage = sum_user_stats(api_params, usage_coefficient)
+    accumulator.add(users_usage, nodes_usage, get_hour_bucket(),
+                    record_node_usage=not DISABLE_RECORDING_NODE_USAGE)
+    accumulator.persist()
+
+    if not JOB_FLUSH_USER_USAGES_INTERVAL:
+        flush_user_usages()
+
+
+def flush_user_usages():
+    # the snapshot stays in the spill file until the flush ends, a flush cut off by a crash
+    # is replayed by the next controller, and what wasn't written is put back if it fails
+    snapshot = accumulator.begin_flush()
+    if not snapshot:
         return
 
-    with GetDB() as db:
-        user_admin_map = dict(db.query(User.id, User.admin_id).all())
+    try:
+        write_user_usages(snapshot)
+    finally:
+        accumulator.end_flush(snapshot)
+
+
+def write_user_usages(snapshot: UsageSnapshot):
+    """
+    Writes the usage of a snapshot, removing the written parts from it.
+
+    The users usage is written once, along with the flush_id of the snapshot, a replayed
+    snapshot whose flush_id was written skips it. The per node usage is written after it and
+    is written again if the flush is cut off in between, so it's recorded at least once.
+    """
+    if snapshot.users and snapshot.flush_id:
+        with GetDB() as db:
+            if db.execute(select(System.usage_flush_id)).scalar() == snapshot.flush_id:
+                logger.info("Users usage of the replayed flush was already written")
+                snapshot.users, snapshot.online_at = {}, {}
+
+    if snapshot.users:
+        _write_users_usage(snapshot)
+
+    node_params = defaultdict(list)
+    for (node_id, created_at, uid), value in snapshot.node_users.items():
+        node_params[(node_id, created_at)].append({"uid": uid, "value": value})
+
+    for (node_id, created_at), params in node_params.items():
+        record_user_stats(params, node_id, created_at=created_at)
+        for param in params:
+            del snapshot.node_users[(node_id, created_at, param['uid'])]
+
 
-    admin_usage = defaultdict(int)
-    for user_usage in users_usage:
-        admin_id = user_admin_map.get(int(user_usage["uid"]))
-        if admin_id:
-            admin_usage[admin_id] += user_usage["value"]
+def _write_users_usage(snapshot: UsageSnapshot):
+    now = datetime.utcnow()
+    online_at = {uid: snapshot.online_at.get(uid) or now for uid in snapshot.users}
+    users_usage = [
+        {"uid": uid, "value": value, "online_at": online_at[uid]}
+        for uid, value in snapshot.users.items()
+    ]
 
     # record users usage
     with GetDB() as db:
+        user_directory.sync(db)
+        admin_usage = user_directory.admin_usage(snapshot.users)
+
         stmt = update(User). \
             where(User.id == bindparam('uid')). \
             values(
                 used_traffic=User.used_traffic + bindparam('value'),
-                online_at=datetime.utcnow()
+                online_at=bindparam('online_at')
         )
 
-        safe_execute(db, stmt, users_usage)
+        statements = [(stmt, users_usage)]
 
         admin_data = [{"admin_id": admin_id, "value": value} for admin_id, value in admin_usage.items()]
         if admin_data:
             admin_update_stmt = update(Admin). \
                 where(Admin.id == bindparam('admin_id')). \
                 values(users_usage=Admin.users_usage + bindparam('value'))
-            safe_execute(db, admin_update_stmt, admin_data)
+            statements.append((admin_update_stmt, admin_data))
 
-    if DISABLE_RECORDING_NODE_USAGE:
-        return
+        if snapshot.flush_id:
+            statements.append((update(System).values(usage_flush_id=snapshot.flush_id), None))
 
-    for node_id, params in api_params.items():
-        record_user_stats(params, node_id, usage_coefficient[node_id])
+        # users and their admins are written together, a failure leaves both to the next flush
+        safe_execute_all(db, statements)
+
+    # written parts are dropped from the snapshot right away, so a failure below doesn't restore them twice
+    written, snapshot.users, snapshot.online_at = snapshot.users, {}, {}
+
+    user_directory.add_usage(written, online_at)
+    user_deadlines.add_usage(written)
 
 
 def record_node_usages():
@@ -189,9 +305,7 @@ def record_node_usages():
         if node.connected and node.started:
             api_instances[node_id] = node.api
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {node_id: executor.submit(get_outbounds_stats, api) for node_id, api in api_instances.items()}
-    api_params = {node_id: future.result() for node_id, future in futures.items()}
+    api_params = jobs_loop.run(gather_stats(get_outbounds_stats, api_instances))
 
     total_up = 0
     total_down = 0
@@ -223,3 +337,25 @@ scheduler.add_job(record_user_usages, 'interval',
 scheduler.add_job(record_node_usages, 'interval',
                   seconds=JOB_RECORD_NODE_USAGES_INTERVAL,
                   coalesce=True, max_instances=1)
+if JOB_FLUSH_USER_USAGES_INTERVAL:
+    scheduler.add_job(flush_user_usages, 'interval',
+                      seconds=JOB_FLUSH_USER_USAGES_INTERVAL,
+                      coalesce=True, max_instances=1)
+
+
+def flush_usages_on_shutdown():
+    try:
+        flush_user_usages()
+    except Exception as err:
+        logger.error(f"Unable to flush pending users usage: {err}")
+
+
+@controller.on_elected
+def load_usage_spill():
+    """Restores the usage spilled by the previous controller, only the controller records and flushes usage"""
+    global accumulator
+    if USAGE_SPILL_FILE:
+        spilling = SpillingUsageAccumulator(USAGE_SPILL_FILE)
+        spilling.restore(accumulator.drain())
+        accumulator = spilling
+    app.add_event_handler("shutdown", flush_usages_on_shutdown)
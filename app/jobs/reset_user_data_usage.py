@@ -32,9 +32,10 @@ def reset_user_data_usage():
             if not (now - last_reset_time).days >= num_days_to_reset:
                 continue
 
+            status = user.status
             crud.reset_user_data_usage(db, user)
             # make user active if limited on usage reset
-            if user.status == UserStatus.limited:
+            if status == UserStatus.limited:
                 xray.operations.add_user(user)
 
             logger.info(f"User data usage reset for User \"{user.username}\"")
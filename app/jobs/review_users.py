@@ -1,15 +1,19 @@
+import time
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, List
 
 from sqlalchemy.orm import Session
 
 from app import logger, scheduler, xray
-from app.db import (GetDB, get_notification_reminder, get_users,
-                    start_user_expire, update_user_status, reset_user_by_next)
+from app.db import (GetDB, crud, get_notification_reminder, get_user_by_id,
+                    get_users, reset_user_by_next)
 from app.models.user import ReminderType, UserResponse, UserStatus
 from app.utils import report
+from app.utils.deadlines import user_deadlines
+from app.utils.directory import user_directory
 from app.utils.helpers import (calculate_expiration_days,
-                               calculate_usage_percent)
+                               calculate_usage_percent, chunks)
+from app.utils.metrics import metrics
 from config import (JOB_REVIEW_USERS_INTERVAL, NOTIFY_DAYS_LEFT,
                     NOTIFY_REACHED_USAGE_PERCENT, WEBHOOK_ADDRESS)
 
@@ -51,68 +55,75 @@ def reset_user_by_next_report(db: Session, user: "User"):
     report.user_data_reset_by_next(user=UserResponse.model_validate(user), user_admin=user.admin)
 
 
-def review():
-    now = datetime.utcnow()
-    now_ts = now.timestamp()
-    with GetDB() as db:
-        for user in get_users(db, status=UserStatus.active):
+def review_due_users(db: Session, user_ids: List[int], now: datetime) -> int:
+    changed = 0
 
-            limited = user.data_limit and user.used_traffic >= user.data_limit
-            expired = user.expire and user.expire <= now_ts
+    user_ids_by_status = {UserStatus.limited: [], UserStatus.expired: []}
+    for row in crud.get_users_reaching_limits(db, now, user_ids=user_ids):
+        if row.next_plan_id is not None and (row.fire_on_either or (row.limited and row.expired)):
+            reset_user_by_next_report(db, get_user_by_id(db, row.id))
+            changed += 1
+            continue
 
-            if (limited or expired) and user.next_plan is not None:
-                if user.next_plan is not None:
+        user_ids_by_status[UserStatus.limited if row.limited else UserStatus.expired].append(row.id)
 
-                    if user.next_plan.fire_on_either:
-                        reset_user_by_next_report(db, user)
-                        continue
-
-                    elif limited and expired:
-                        reset_user_by_next_report(db, user)
-                        continue
-
-            if limited:
-                status = UserStatus.limited
-            elif expired:
-                status = UserStatus.expired
-            else:
-                if WEBHOOK_ADDRESS:
-                    add_notification_reminders(db, user, now)
-                continue
+    for status, ids in user_ids_by_status.items():
+        if not ids:
+            continue
 
+        crud.update_users_status(db, ids, status, now)
+        for user in get_users(db, user_ids=ids, status=status):
             xray.operations.remove_user(user)
-            update_user_status(db, user, status)
 
             report.status_change(username=user.username, status=status,
                                  user=UserResponse.model_validate(user), user_admin=user.admin)
 
             logger.info(f"User \"{user.username}\" status changed to {status}")
+            changed += 1
 
-        for user in get_users(db, status=UserStatus.on_hold):
-
-            if user.edit_at:
-                base_time = datetime.timestamp(user.edit_at)
-            else:
-                base_time = datetime.timestamp(user.created_at)
+    ids = crud.get_on_hold_user_ids_to_activate(db, now, user_ids=user_ids)
+    if ids:
+        crud.activate_on_hold_users(db, ids, now)
+        status = UserStatus.active
+        for user in get_users(db, user_ids=ids, status=status):
+            report.status_change(username=user.username, status=status,
+                                 user=UserResponse.model_validate(user), user_admin=user.admin)
 
-            # Check if the user is online After or at 'base_time'
-            if user.online_at and base_time <= datetime.timestamp(user.online_at):
-                status = UserStatus.active
+            logger.info(f"User \"{user.username}\" status changed to {status}")
+            changed += 1
 
-            elif user.on_hold_timeout and (datetime.timestamp(user.on_hold_timeout) <= (now_ts)):
-                # If the user didn't connect within the timeout period, change status to "Active"
-                status = UserStatus.active
+    return changed
 
-            else:
-                continue
 
-            update_user_status(db, user, status)
-            start_user_expire(db, user)
+def review():
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    changed = 0
 
-            report.status_change(username=user.username, status=status,
-                                 user=UserResponse.model_validate(user), user_admin=user.admin)
+    with GetDB() as db:
+        reloaded = user_directory.needs_reload()
+        user_directory.sync(db)
+        if reloaded or user_deadlines.needs_rebuild():
+            user_deadlines.rebuild(user_directory.reviewable())
+
+        due = list(user_deadlines.pop_due(now.timestamp()))
+        for chunk in chunks(due):
+            changed += review_due_users(db, chunk, now)
+            user_directory.sync(db)
+            user_deadlines.retrack(chunk, user_directory.reviewable(user_ids=chunk))
+
+        if WEBHOOK_ADDRESS and (NOTIFY_REACHED_USAGE_PERCENT or NOTIFY_DAYS_LEFT):
+            # superset of the users which may need a reminder, checked precisely one by one
+            usage_percent = min(NOTIFY_REACHED_USAGE_PERCENT) if NOTIFY_REACHED_USAGE_PERCENT else 101
+            expire_before = int(now.timestamp()) + (max(NOTIFY_DAYS_LEFT) + 1) * 86400 if NOTIFY_DAYS_LEFT else 0
+            for chunk in chunks(user_directory.near_limits(usage_percent, expire_before)):
+                for user in get_users(db, user_ids=chunk, status=UserStatus.active):
+                    add_notification_reminders(db, user, now)
 
-            logger.info(f"User \"{user.username}\" status changed to {status}")
+    elapsed = time.perf_counter() - started
+    metrics.update("review", scanned=len(due), changed=changed, tracked=len(user_deadlines),
+                   elapsed=round(elapsed, 4))
+    logger.debug(f"Reviewed {len(due)} due users in {elapsed:.3f}s, {changed} changed")
 
 
 scheduler.add_job(review, 'interval',
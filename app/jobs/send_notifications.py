@@ -94,5 +94,5 @@ if WEBHOOK_ADDRESS:
     logger.info("Send webhook job started")
     scheduler.add_job(send_notifications, "interval",
                       seconds=JOB_SEND_NOTIFICATIONS_INTERVAL,
-                      replace_existing=True)
+                      replace_existing=True, jobstore="local")
     scheduler.add_job(delete_expired_reminders, "interval", hours=2, start_date=dt.utcnow() + td(minutes=1))
@@ -1,5 +1,6 @@
+from datetime import datetime
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import ConfigDict, BaseModel, Field
 
@@ -11,17 +12,51 @@ class NodeStatus(str, Enum):
     disabled = "disabled"
 
 
+class NodeHealthState(str, Enum):
+    unknown = "unknown"
+    healthy = "healthy"
+    stopped = "stopped"
+    unreachable = "unreachable"
+
+
 class NodeSettings(BaseModel):
     min_node_version: str = "v0.2.0"
     certificate: str
 
 
+class NodeGroup(BaseModel):
+    name: str = Field(max_length=64, min_length=1)
+
+
+class NodeGroupCreate(NodeGroup):
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "name": "EU"
+        }
+    })
+
+
+class NodeGroupModify(NodeGroup):
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "name": "EU"
+        }
+    })
+
+
+class NodeGroupResponse(NodeGroup):
+    id: int
+    created_at: Optional[datetime] = None
+    model_config = ConfigDict(from_attributes=True)
+
+
 class Node(BaseModel):
     name: str
     address: str
     port: int = 62050
     api_port: int = 62051
     usage_coefficient: float = Field(gt=0, default=1.0)
+    node_group_id: Optional[int] = Field(None, nullable=True)
 
 
 class NodeCreate(Node):
@@ -33,7 +68,8 @@ class NodeCreate(Node):
             "port": 62050,
             "api_port": 62051,
             "add_as_new_host": True,
-            "usage_coefficient": 1
+            "usage_coefficient": 1,
+            "node_group_id": None
         }
     })
 
@@ -52,16 +88,31 @@ class NodeModify(Node):
             "port": 62050,
             "api_port": 62051,
             "status": "disabled",
-            "usage_coefficient": 1.0
+            "usage_coefficient": 1.0,
+            "node_group_id": 0
         }
     })
 
 
+class NodeHealthResponse(BaseModel):
+    state: NodeHealthState
+    connected: bool
+    started: bool
+    version: Optional[str] = None
+    message: Optional[str] = None
+    latency: Optional[float] = None
+    failures: int
+    checked_at: Optional[datetime] = None
+    changed_at: Optional[datetime] = None
+    retry_at: Optional[datetime] = None
+
+
 class NodeResponse(Node):
     id: int
     xray_version: Optional[str] = None
     status: NodeStatus
     message: Optional[str] = None
+    health: Optional[NodeHealthResponse] = None
     model_config = ConfigDict(from_attributes=True)
 
 
@@ -74,3 +125,15 @@ class NodeUsageResponse(BaseModel):
 
 class NodesUsageResponse(BaseModel):
     usages: List[NodeUsageResponse]
+
+
+class NodeSyncStats(BaseModel):
+    depth: int
+    lag: float
+    sent: int
+    failed: int
+    dropped: int
+
+
+class NodesSyncResponse(BaseModel):
+    queues: Dict[str, NodeSyncStats]
@@ -75,6 +75,8 @@ class User(BaseModel):
 
     auto_delete_in_days: Optional[int] = Field(None, nullable=True)
 
+    node_group_id: Optional[int] = Field(None, nullable=True)
+
     next_plan: Optional[NextPlanModel] = Field(None, nullable=True)
 
     @field_validator('data_limit', mode='before')
@@ -279,7 +281,11 @@ class UserModify(User):
         return status
 
 
-class UserResponse(User):
+class UserListItem(User):
+    """
+    A user as returned in lists. Links and subscription url are left as given,
+    they're only generated by UserResponse.
+    """
     username: str
     status: UserStatus
     used_traffic: int
@@ -293,23 +299,6 @@ class UserResponse(User):
     admin: Optional[Admin] = None
     model_config = ConfigDict(from_attributes=True)
 
-    @model_validator(mode="after")
-    def validate_links(self):
-        if not self.links:
-            self.links = generate_v2ray_links(
-                self.proxies, self.inbounds, extra_data=self.model_dump(), reverse=False,
-            )
-        return self
-
-    @model_validator(mode="after")
-    def validate_subscription_url(self):
-        if not self.subscription_url:
-            salt = secrets.token_hex(8)
-            url_prefix = (XRAY_SUBSCRIPTION_URL_PREFIX).replace('*', salt)
-            token = create_subscription_token(self.username)
-            self.subscription_url = f"{url_prefix}/{XRAY_SUBSCRIPTION_PATH}/{token}"
-        return self
-
     @field_validator("proxies", mode="before")
     def validate_proxies(cls, v, values, **kwargs):
         if isinstance(v, list):
@@ -327,6 +316,25 @@ class UserResponse(User):
         raise ValueError("must be an integer or a float, not a string")  # Reject strings
 
 
+class UserResponse(UserListItem):
+    @model_validator(mode="after")
+    def validate_links(self):
+        if not self.links:
+            self.links = generate_v2ray_links(
+                self.proxies, self.inbounds, extra_data=self.__dict__, reverse=False,
+            )
+        return self
+
+    @model_validator(mode="after")
+    def validate_subscription_url(self):
+        if not self.subscription_url:
+            salt = secrets.token_hex(8)
+            url_prefix = (XRAY_SUBSCRIPTION_URL_PREFIX).replace('*', salt)
+            token = create_subscription_token(self.username)
+            self.subscription_url = f"{url_prefix}/{XRAY_SUBSCRIPTION_PATH}/{token}"
+        return self
+
+
 class SubscriptionUserResponse(UserResponse):
     admin: Admin | None = Field(default=None, exclude=True)
     excluded_inbounds: Dict[ProxyTypes, List[str]] | None = Field(None, exclude=True)
@@ -337,7 +345,7 @@ class SubscriptionUserResponse(UserResponse):
 
 
 class UsersResponse(BaseModel):
-    users: List[UserResponse]
+    users: List[UserListItem]
     total: int
 
 
@@ -16,6 +16,7 @@ class UserTemplate(BaseModel):
     )
     username_prefix: Optional[str] = Field(max_length=20, min_length=1, default=None)
     username_suffix: Optional[str] = Field(max_length=20, min_length=1, default=None)
+    node_group_id: Optional[int] = Field(None, nullable=True)
 
     inbounds: Dict[ProxyTypes, List[str]] = {}
 
@@ -1,6 +1,7 @@
 import asyncio
 import json
 import time
+from contextlib import aclosing
 
 import commentjson
 from fastapi import APIRouter, Depends, HTTPException, WebSocket
@@ -44,8 +45,8 @@ async def core_logs(websocket: WebSocket, db: Session = Depends(get_db)):
 
     cache = ""
     last_sent_ts = 0
-    with xray.core.get_logs() as logs:
-        while True:
+    async with aclosing(xray.operations.stream_logs()) as logs_stream:
+        async for logs in logs_stream:
             if interval and time.time() - last_sent_ts >= interval and cache:
                 try:
                     await websocket.send_text(cache)
@@ -63,14 +64,13 @@ async def core_logs(websocket: WebSocket, db: Session = Depends(get_db)):
                 except (WebSocketDisconnect, RuntimeError):
                     break
 
-            log = logs.popleft()
-
             if interval:
-                cache += f"{log}\n"
+                cache += "".join(f"{log}\n" for log in logs)
                 continue
 
             try:
-                await websocket.send_text(log)
+                for log in logs:
+                    await websocket.send_text(log)
             except (WebSocketDisconnect, RuntimeError):
                 break
 
@@ -79,22 +79,15 @@ async def core_logs(websocket: WebSocket, db: Session = Depends(get_db)):
 def get_core_stats(admin: Admin = Depends(Admin.get_current)):
     """Retrieve core statistics such as version and uptime."""
     return CoreStats(
-        version=xray.core.version,
-        started=xray.core.started,
+        **xray.operations.get_core_status(),
         logs_websocket=router.url_path_for("core_logs"),
     )
 
 
 @router.post("/core/restart", responses={403: responses._403})
 def restart_core(admin: Admin = Depends(Admin.check_sudo_admin)):
-    """Restart the core and all connected nodes."""
-    startup_config = xray.config.include_db_users()
-    xray.core.restart(startup_config)
-
-    for node_id, node in list(xray.nodes.items()):
-        if node.connected:
-            xray.operations.restart_node(node_id, startup_config)
-
+    """Restart the core and the cores of all connected nodes."""
+    xray.operations.restart_core(force=True)
     return {}
 
 
@@ -113,20 +106,14 @@ def modify_core_config(
 ) -> dict:
     """Modify the core configuration and restart the core."""
     try:
-        config = XRayConfig(payload, api_port=xray.config.api_port)
+        XRayConfig(payload, api_port=xray.config.api_port)
     except ValueError as err:
         raise HTTPException(status_code=400, detail=str(err))
 
-    xray.config = config
     with open(XRAY_JSON, "w") as f:
         f.write(json.dumps(payload, indent=4))
 
-    startup_config = xray.config.include_db_users()
-    xray.core.restart(startup_config)
-    for node_id, node in list(xray.nodes.items()):
-        if node.connected:
-            xray.operations.restart_node(node_id, startup_config)
-
-    xray.hosts.update()
+    xray.operations.update_config(payload)
+    xray.operations.update_hosts()
 
     return payload
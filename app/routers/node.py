@@ -1,5 +1,6 @@
 import asyncio
 import time
+from contextlib import aclosing
 from typing import List
 
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, WebSocket
@@ -8,14 +9,19 @@ from starlette.websockets import WebSocketDisconnect
 
 from app import logger, xray
 from app.db import Session, crud, get_db
-from app.dependencies import get_dbnode, validate_dates
+from app.dependencies import get_dbnode, get_node_group, validate_dates, validate_node_group
 from app.models.admin import Admin
 from app.models.node import (
     NodeCreate,
+    NodeGroupCreate,
+    NodeGroupModify,
+    NodeGroupResponse,
+    NodeHealthResponse,
     NodeModify,
     NodeResponse,
     NodeSettings,
     NodeStatus,
+    NodesSyncResponse,
     NodesUsageResponse,
 )
 from app.models.proxy import ProxyHost
@@ -32,10 +38,11 @@ def add_host_if_needed(new_node: NodeCreate, db: Session):
         host = ProxyHost(
             remark=f"{new_node.name} ({{USERNAME}}) [{{PROTOCOL}} - {{TRANSPORT}}]",
             address=new_node.address,
+            node_group_id=new_node.node_group_id or None,
         )
         for inbound_tag in xray.config.inbounds_by_tag:
             crud.add_host(db, inbound_tag, host)
-        xray.hosts.update()
+        xray.operations.update_hosts()
 
 
 @router.get("/node/settings", response_model=NodeSettings)
@@ -55,6 +62,7 @@ def add_node(
     _: Admin = Depends(Admin.check_sudo_admin),
 ):
     """Add a new node to the database and optionally add it as a host."""
+    validate_node_group(db, new_node.node_group_id)
     try:
         dbnode = crud.create_node(db, new_node)
     except IntegrityError:
@@ -91,10 +99,11 @@ async def node_logs(node_id: int, websocket: WebSocket, db: Session = Depends(ge
     if not admin.is_sudo:
         return await websocket.close(reason="You're not allowed", code=4403)
 
-    if not xray.nodes.get(node_id):
+    connected = xray.operations.get_node_connected(node_id)
+    if connected is None:
         return await websocket.close(reason="Node not found", code=4404)
 
-    if not xray.nodes[node_id].connected:
+    if not connected:
         return await websocket.close(reason="Node is not connected", code=4400)
 
     interval = websocket.query_params.get("interval")
@@ -112,12 +121,8 @@ async def node_logs(node_id: int, websocket: WebSocket, db: Session = Depends(ge
 
     cache = ""
     last_sent_ts = 0
-    node = xray.nodes[node_id]
-    with node.get_logs() as logs:
-        while True:
-            if not node == xray.nodes[node_id]:
-                break
-
+    async with aclosing(xray.operations.stream_logs(node_id)) as logs_stream:
+        async for logs in logs_stream:
             if interval and time.time() - last_sent_ts >= interval and cache:
                 try:
                     await websocket.send_text(cache)
@@ -135,14 +140,13 @@ async def node_logs(node_id: int, websocket: WebSocket, db: Session = Depends(ge
                 except (WebSocketDisconnect, RuntimeError):
                     break
 
-            log = logs.popleft()
-
             if interval:
-                cache += f"{log}\n"
+                cache += "".join(f"{log}\n" for log in logs)
                 continue
 
             try:
-                await websocket.send_text(log)
+                for log in logs:
+                    await websocket.send_text(log)
             except (WebSocketDisconnect, RuntimeError):
                 break
 
@@ -151,8 +155,15 @@ async def node_logs(node_id: int, websocket: WebSocket, db: Session = Depends(ge
 def get_nodes(
     db: Session = Depends(get_db), _: Admin = Depends(Admin.check_sudo_admin)
 ):
-    """Retrieve a list of all nodes. Accessible only to sudo admins."""
-    return crud.get_nodes(db)
+    """Retrieve a list of all nodes with their cached health. Accessible only to sudo admins."""
+    health = {item.pop("node_id"): NodeHealthResponse.model_validate(item)
+              for item in xray.operations.get_nodes_health()}
+    nodes = []
+    for dbnode in crud.get_nodes(db):
+        node = NodeResponse.model_validate(dbnode)
+        node.health = health.get(node.id)
+        nodes.append(node)
+    return nodes
 
 
 @router.put("/node/{node_id}", response_model=NodeResponse)
@@ -163,7 +174,8 @@ def modify_node(
     db: Session = Depends(get_db),
     _: Admin = Depends(Admin.check_sudo_admin),
 ):
-    """Update a node's details. Only accessible to sudo admins."""
+    """Update a node's details, `node_group_id` set to `0` removes the node from its group. Only accessible to sudo admins."""
+    validate_node_group(db, modified_node.node_group_id)
     updated_node = crud.update_node(db, dbnode, modified_node)
     xray.operations.remove_node(updated_node.id)
     if updated_node.status != NodeStatus.disabled:
@@ -179,8 +191,8 @@ def reconnect_node(
     dbnode: NodeResponse = Depends(get_node),
     _: Admin = Depends(Admin.check_sudo_admin),
 ):
-    """Trigger a reconnection for the specified node. Only accessible to sudo admins."""
-    bg.add_task(xray.operations.connect_node, node_id=dbnode.id)
+    """Trigger a reconnection for the specified node, its core is restarted. Only accessible to sudo admins."""
+    bg.add_task(xray.operations.connect_node, node_id=dbnode.id, force=True)
     return {"detail": "Reconnection task scheduled"}
 
 
@@ -198,6 +210,72 @@ def remove_node(
     return {}
 
 
+@router.get("/node_groups", response_model=List[NodeGroupResponse])
+def get_node_groups(
+    db: Session = Depends(get_db), _: Admin = Depends(Admin.check_sudo_admin)
+):
+    """Retrieve a list of all node groups. Accessible only to sudo admins."""
+    return crud.get_node_groups(db)
+
+
+@router.post("/node_group", response_model=NodeGroupResponse, responses={409: responses._409})
+def add_node_group(
+    new_node_group: NodeGroupCreate,
+    db: Session = Depends(get_db),
+    _: Admin = Depends(Admin.check_sudo_admin),
+):
+    """
+    Add a new node group. The nodes of a group carry only the users of the group,
+    the nodes without a group carry every user, and hosts of a group are given to the users of the group only.
+    """
+    try:
+        dbnode_group = crud.create_node_group(db, new_node_group)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409, detail=f'Node group "{new_node_group.name}" already exists'
+        )
+
+    logger.info(f'New node group "{dbnode_group.name}" added')
+    return dbnode_group
+
+
+@router.put("/node_group/{node_group_id}", response_model=NodeGroupResponse, responses={409: responses._409})
+def modify_node_group(
+    modified_node_group: NodeGroupModify,
+    dbnode_group: NodeGroupResponse = Depends(get_node_group),
+    db: Session = Depends(get_db),
+    _: Admin = Depends(Admin.check_sudo_admin),
+):
+    """Rename a node group. Only accessible to sudo admins."""
+    try:
+        dbnode_group = crud.update_node_group(db, dbnode_group, modified_node_group)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409, detail=f'Node group "{modified_node_group.name}" already exists'
+        )
+
+    logger.info(f'Node group "{dbnode_group.name}" modified')
+    return dbnode_group
+
+
+@router.delete("/node_group/{node_group_id}")
+def remove_node_group(
+    bg: BackgroundTasks,
+    dbnode_group: NodeGroupResponse = Depends(get_node_group),
+    db: Session = Depends(get_db),
+    _: Admin = Depends(Admin.check_sudo_admin),
+):
+    """Delete a node group, its nodes, users, templates and hosts are left without a group."""
+    crud.remove_node_group(db, dbnode_group)
+    xray.operations.update_hosts()
+    bg.add_task(xray.operations.sync_nodes_users)
+
+    logger.info(f'Node group "{dbnode_group.name}" deleted')
+    return {}
+
+
 @router.get("/nodes/usage", response_model=NodesUsageResponse)
 def get_usage(
     db: Session = Depends(get_db),
@@ -211,3 +289,9 @@ def get_usage(
     usages = crud.get_nodes_usage(db, start, end)
 
     return {"usages": usages}
+
+
+@router.get("/nodes/sync", response_model=NodesSyncResponse)
+def get_sync_stats(_: Admin = Depends(Admin.check_sudo_admin)):
+    """Retrieve depth and lag of the pending user operations of the main core ("master") and each node."""
+    return {"queues": xray.operations.get_sync_stats()}
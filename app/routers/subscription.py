@@ -4,12 +4,17 @@ from distutils.version import LooseVersion
 from fastapi import APIRouter, Depends, Header, Path, Request, Response
 from fastapi.responses import HTMLResponse
 
-from app.db import Session, crud, get_db
-from app.dependencies import get_validated_sub, validate_dates
-from app.models.user import SubscriptionUserResponse, UserResponse
-from app.subscription.share import encode_title, generate_subscription
+from app.db import crud, run_db
+from app.dependencies import get_validated_sub_user, validate_dates
+from app.models.user import SubscriptionUserResponse, UserListItem, UserResponse
+from app.subscription.cache import subscription_cache
+from app.subscription.share import encode_title
 from app.templates import render_template
+from app.utils.concurrency import render_executor, run_in_executor
+from app.utils.sub_lookup import SubscriptionUser
+from app.utils.sub_updates import sub_updates
 from config import (
+    JOB_FLUSH_SUB_UPDATES_INTERVAL,
     SUB_PROFILE_TITLE,
     SUB_SUPPORT_URL,
     SUB_UPDATE_INTERVAL,
@@ -45,27 +50,52 @@ def get_subscription_user_info(user: UserResponse) -> dict:
     }
 
 
+async def subscription_response(
+    request: Request,
+    dbuser: SubscriptionUser,
+    user: UserListItem,
+    config_format: str,
+    as_base64: bool,
+    reverse: bool,
+    media_type: str,
+    headers: dict,
+) -> Response:
+    """Generates the subscription through the cache, answers 304 if the client already has it."""
+    conf, etag = await run_in_executor(render_executor, subscription_cache.generate, dbuser, user,
+                                       config_format=config_format, as_base64=as_base64, reverse=reverse)
+    headers = {**headers, "etag": etag}
+
+    if_none_match = request.headers.get("If-None-Match", "")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+
+    return Response(content=conf, media_type=media_type, headers=headers)
+
+
 @router.get("/{token}/")
 @router.get("/{token}", include_in_schema=False)
-def user_subscription(
+async def user_subscription(
     request: Request,
-    db: Session = Depends(get_db),
-    dbuser: UserResponse = Depends(get_validated_sub),
+    dbuser: SubscriptionUser = Depends(get_validated_sub_user),
     user_agent: str = Header(default="")
 ):
     """Provides a subscription link based on the user agent (Clash, V2Ray, etc.)."""
-    user: UserResponse = UserResponse.model_validate(dbuser)
-
     accept_header = request.headers.get("Accept", "")
     if "text/html" in accept_header:
-        return HTMLResponse(
-            render_template(
-                SUBSCRIPTION_PAGE_TEMPLATE,
-                {"user": user}
-            )
-        )
+        def render_page():
+            user = UserResponse.model_validate(dbuser.user, from_attributes=True)
+            return render_template(SUBSCRIPTION_PAGE_TEMPLATE, {"user": user})
 
-    crud.update_user_sub(db, dbuser, user_agent)
+        return HTMLResponse(await run_in_executor(render_executor, render_page))
+
+    user: UserListItem = dbuser.user
+
+    if JOB_FLUSH_SUB_UPDATES_INTERVAL:
+        sub_updates.record(dbuser.id, user_agent)
+    else:
+        await run_db(lambda db: crud.update_user_sub(db, crud.get_user_by_id(db, dbuser.id), user_agent))
     response_headers = {
         "content-disposition": f'attachment; filename="{user.username}"',
         "profile-web-page-url": str(request.url),
@@ -79,99 +109,99 @@ def user_subscription(
     }
 
     if re.match(r'^([Cc]lash-verge|[Cc]lash[-\.]?[Mm]eta|[Ff][Ll][Cc]lash|[Mm]ihomo)', user_agent):
-        conf = generate_subscription(user=user, config_format="clash-meta", as_base64=False, reverse=False)
-        return Response(content=conf, media_type="text/yaml", headers=response_headers)
+        return await subscription_response(request, dbuser, user, "clash-meta", False, False,
+                                           "text/yaml", response_headers)
 
     elif re.match(r'^([Cc]lash|[Ss]tash)', user_agent):
-        conf = generate_subscription(user=user, config_format="clash", as_base64=False, reverse=False)
-        return Response(content=conf, media_type="text/yaml", headers=response_headers)
+        return await subscription_response(request, dbuser, user, "clash", False, False,
+                                           "text/yaml", response_headers)
 
     elif re.match(r'^(SFA|SFI|SFM|SFT|[Kk]aring|[Hh]iddify[Nn]ext)', user_agent):
-        conf = generate_subscription(user=user, config_format="sing-box", as_base64=False, reverse=False)
-        return Response(content=conf, media_type="application/json", headers=response_headers)
+        return await subscription_response(request, dbuser, user, "sing-box", False, False,
+                                           "application/json", response_headers)
 
     elif re.match(r'^(SS|SSR|SSD|SSS|Outline|Shadowsocks|SSconf)', user_agent):
-        conf = generate_subscription(user=user, config_format="outline", as_base64=False, reverse=False)
-        return Response(content=conf, media_type="application/json", headers=response_headers)
+        return await subscription_response(request, dbuser, user, "outline", False, False,
+                                           "application/json", response_headers)
 
     elif (USE_CUSTOM_JSON_DEFAULT or USE_CUSTOM_JSON_FOR_V2RAYN) and re.match(r'^v2rayN/(\d+\.\d+)', user_agent):
         version_str = re.match(r'^v2rayN/(\d+\.\d+)', user_agent).group(1)
         if LooseVersion(version_str) >= LooseVersion("6.40"):
-            conf = generate_subscription(user=user, config_format="v2ray-json", as_base64=False, reverse=False)
-            return Response(content=conf, media_type="application/json", headers=response_headers)
+            return await subscription_response(request, dbuser, user, "v2ray-json", False, False,
+                                               "application/json", response_headers)
         else:
-            conf = generate_subscription(user=user, config_format="v2ray", as_base64=True, reverse=False)
-            return Response(content=conf, media_type="text/plain", headers=response_headers)
+            return await subscription_response(request, dbuser, user, "v2ray", True, False,
+                                               "text/plain", response_headers)
 
     elif (USE_CUSTOM_JSON_DEFAULT or USE_CUSTOM_JSON_FOR_V2RAYNG) and re.match(r'^v2rayNG/(\d+\.\d+\.\d+)', user_agent):
         version_str = re.match(r'^v2rayNG/(\d+\.\d+\.\d+)', user_agent).group(1)
         if LooseVersion(version_str) >= LooseVersion("1.8.29"):
-            conf = generate_subscription(user=user, config_format="v2ray-json", as_base64=False, reverse=False)
-            return Response(content=conf, media_type="application/json", headers=response_headers)
+            return await subscription_response(request, dbuser, user, "v2ray-json", False, False,
+                                               "application/json", response_headers)
         elif LooseVersion(version_str) >= LooseVersion("1.8.18"):
-            conf = generate_subscription(user=user, config_format="v2ray-json", as_base64=False, reverse=True)
-            return Response(content=conf, media_type="application/json", headers=response_headers)
+            return await subscription_response(request, dbuser, user, "v2ray-json", False, True,
+                                               "application/json", response_headers)
         else:
-            conf = generate_subscription(user=user, config_format="v2ray", as_base64=True, reverse=False)
-            return Response(content=conf, media_type="text/plain", headers=response_headers)
+            return await subscription_response(request, dbuser, user, "v2ray", True, False,
+                                               "text/plain", response_headers)
 
     elif re.match(r'^[Ss]treisand', user_agent):
         if USE_CUSTOM_JSON_DEFAULT or USE_CUSTOM_JSON_FOR_STREISAND:
-            conf = generate_subscription(user=user, config_format="v2ray-json", as_base64=False, reverse=False)
-            return Response(content=conf, media_type="application/json", headers=response_headers)
+            return await subscription_response(request, dbuser, user, "v2ray-json", False, False,
+                                               "application/json", response_headers)
         else:
-            conf = generate_subscription(user=user, config_format="v2ray", as_base64=True, reverse=False)
-            return Response(content=conf, media_type="text/plain", headers=response_headers)
+            return await subscription_response(request, dbuser, user, "v2ray", True, False,
+                                               "text/plain", response_headers)
 
     elif (USE_CUSTOM_JSON_DEFAULT or USE_CUSTOM_JSON_FOR_HAPP) and re.match(r'^Happ/(\d+\.\d+\.\d+)', user_agent):
         version_str = re.match(r'^Happ/(\d+\.\d+\.\d+)', user_agent).group(1)
         if LooseVersion(version_str) >= LooseVersion("1.63.1"):
-            conf = generate_subscription(user=user, config_format="v2ray-json", as_base64=False, reverse=False)
-            return Response(content=conf, media_type="application/json", headers=response_headers)
+            return await subscription_response(request, dbuser, user, "v2ray-json", False, False,
+                                               "application/json", response_headers)
         else:
-            conf = generate_subscription(user=user, config_format="v2ray", as_base64=True, reverse=False)
-            return Response(content=conf, media_type="text/plain", headers=response_headers)
+            return await subscription_response(request, dbuser, user, "v2ray", True, False,
+                                               "text/plain", response_headers)
 
 
 
     else:
-        conf = generate_subscription(user=user, config_format="v2ray", as_base64=True, reverse=False)
-        return Response(content=conf, media_type="text/plain", headers=response_headers)
+        return await subscription_response(request, dbuser, user, "v2ray", True, False,
+                                           "text/plain", response_headers)
 
 
 @router.get("/{token}/info", response_model=SubscriptionUserResponse)
-def user_subscription_info(
-    dbuser: UserResponse = Depends(get_validated_sub),
+async def user_subscription_info(
+    dbuser: SubscriptionUser = Depends(get_validated_sub_user),
 ):
     """Retrieves detailed information about the user's subscription."""
-    return dbuser
+    # generates the links of the user
+    return await run_in_executor(render_executor, SubscriptionUserResponse.model_validate,
+                                 dbuser.user, from_attributes=True)
 
 
 @router.get("/{token}/usage")
-def user_get_usage(
-    dbuser: UserResponse = Depends(get_validated_sub),
+async def user_get_usage(
+    dbuser: SubscriptionUser = Depends(get_validated_sub_user),
     start: str = "",
     end: str = "",
-    db: Session = Depends(get_db)
 ):
     """Fetches the usage statistics for the user within a specified date range."""
     start, end = validate_dates(start, end)
 
-    usages = crud.get_user_usages(db, dbuser, start, end)
+    usages = await run_db(lambda db: crud.get_user_usages(db, dbuser, start, end))
 
     return {"usages": usages, "username": dbuser.username}
 
 
 @router.get("/{token}/{client_type}")
-def user_subscription_with_client_type(
+async def user_subscription_with_client_type(
     request: Request,
-    dbuser: UserResponse = Depends(get_validated_sub),
+    dbuser: SubscriptionUser = Depends(get_validated_sub_user),
     client_type: str = Path(..., regex="sing-box|clash-meta|clash|outline|v2ray|v2ray-json"),
-    db: Session = Depends(get_db),
     user_agent: str = Header(default="")
 ):
     """Provides a subscription link based on the specified client type (e.g., Clash, V2Ray)."""
-    user: UserResponse = UserResponse.model_validate(dbuser)
+    user: UserListItem = dbuser.user
 
     response_headers = {
         "content-disposition": f'attachment; filename="{user.username}"',
@@ -186,9 +216,6 @@ def user_subscription_with_client_type(
     }
 
     config = client_config.get(client_type)
-    conf = generate_subscription(user=user,
-                                 config_format=config["config_format"],
-                                 as_base64=config["as_base64"],
-                                 reverse=config["reverse"])
-
-    return Response(content=conf, media_type=config["media_type"], headers=response_headers)
+    return await subscription_response(request, dbuser, user,
+                                       config["config_format"], config["as_base64"], config["reverse"],
+                                       config["media_type"], response_headers)
@@ -1,14 +1,16 @@
-from typing import Dict, List, Union
+from typing import Any, Dict, List, Union
 
 from fastapi import APIRouter, Depends, HTTPException
 
 from app import __version__, xray
 from app.db import Session, crud, get_db
+from app.dependencies import validate_node_group
 from app.models.admin import Admin
 from app.models.proxy import ProxyHost, ProxyInbound, ProxyTypes
 from app.models.system import SystemStats
 from app.models.user import UserStatus
 from app.utils import responses
+from app.utils.metrics import get_metrics
 from app.utils.system import cpu_usage, memory_usage, realtime_bandwidth
 
 router = APIRouter(tags=["System"], prefix="/api", responses={401: responses._401})
@@ -63,6 +65,14 @@ def get_system_stats(
     )
 
 
+@router.get(
+    "/system/metrics", response_model=Dict[str, Dict[str, Any]], responses={403: responses._403}
+)
+def get_system_metrics(admin: Admin = Depends(Admin.check_sudo_admin)):
+    """Get metrics reported by the background jobs."""
+    return get_metrics()
+
+
 @router.get("/inbounds", response_model=Dict[ProxyTypes, List[ProxyInbound]])
 def get_inbounds(admin: Admin = Depends(Admin.get_current)):
     """Retrieve inbound configurations grouped by protocol."""
@@ -94,10 +104,12 @@ def modify_hosts(
             raise HTTPException(
                 status_code=400, detail=f"Inbound {inbound_tag} doesn't exist"
             )
+        for host in modified_hosts[inbound_tag]:
+            validate_node_group(db, host.node_group_id)
 
     for inbound_tag, hosts in modified_hosts.items():
         crud.update_hosts(db, inbound_tag, hosts)
 
-    xray.hosts.update()
+    xray.operations.update_hosts()
 
     return {tag: crud.get_hosts(db, tag) for tag in xray.config.inbounds_by_tag}
@@ -16,6 +16,7 @@ from app.models.telegram_user import (
     TelegramUsersResponse,
 )
 from app.utils import responses
+from app.utils.helpers import FastJSONResponse
 from app.db.models import TelegramUser, User
 import httpx
 from app.models.user import UserResponse
@@ -190,7 +191,7 @@ def remove_telegram_user_by_id(
     return {"detail": "Telegram user successfully deleted"}
 
 
-@router.get("/telegram_users", response_model=TelegramUsersResponse, responses={400: responses._400})
+@router.get("/telegram_users", response_class=FastJSONResponse, response_model=TelegramUsersResponse, responses={400: responses._400})
 def get_all_telegram_users(
     offset: int = 0,
     limit: int = 100,
@@ -219,7 +220,7 @@ def get_all_telegram_users(
     }
 
 
-@router.get("/telegram_users_with_keys", response_model=List[dict], responses={400: responses._400})
+@router.get("/telegram_users_with_keys", response_class=FastJSONResponse, response_model=List[dict], responses={400: responses._400})
 async def get_telegram_users_with_keys(
     db: Session = Depends(get_db),
     admin: Admin = Depends(Admin.get_current),
@@ -6,7 +6,7 @@ from sqlalchemy.exc import IntegrityError
 
 from app import logger, xray
 from app.db import Session, crud, get_db
-from app.dependencies import get_expired_users_list, get_validated_user, validate_dates
+from app.dependencies import get_expired_users_list, get_validated_user, validate_dates, validate_node_group
 from app.models.admin import Admin
 from app.models.user import (
     UserCreate,
@@ -18,6 +18,7 @@ from app.models.user import (
     UserUsagesResponse,
 )
 from app.utils import report, responses
+from app.utils.helpers import FastJSONResponse
 
 router = APIRouter(tags=["User"], prefix="/api", responses={401: responses._401})
 
@@ -42,6 +43,7 @@ def add_user(
     - **note**: Optional text field for additional user information or notes.
     - **on_hold_timeout**: UTC timestamp when `on_hold` status should start or end.
     - **on_hold_expire_duration**: Duration (in seconds) for how long the user should stay in `on_hold` status.
+    - **node_group_id**: Node group of the user, its nodes carry only the users of the group. None means the nodes without a group.
     - **next_plan**: Next user plan (resets after use).
     """
 
@@ -53,6 +55,7 @@ def add_user(
                 status_code=400,
                 detail=f"Protocol {proxy_type} is disabled on your server",
             )
+    validate_node_group(db, new_user.node_group_id)
 
     try:
         dbuser = crud.create_user(
@@ -96,6 +99,7 @@ def modify_user(
     - **note**: New optional text for additional user information or notes. `null` means no change.
     - **on_hold_timeout**: New UTC timestamp for when `on_hold` status should start or end. Only applicable if status is changed to 'on_hold'.
     - **on_hold_expire_duration**: New duration (in seconds) for how long the user should stay in `on_hold` status. Only applicable if status is changed to 'on_hold'.
+    - **node_group_id**: New node group of the user. Set to `0` to remove it, `null` for no change.
     - **next_plan**: Next user plan (resets after use).
 
     Note: Fields set to `null` or omitted will not be modified.
@@ -107,6 +111,7 @@ def modify_user(
                 status_code=400,
                 detail=f"Protocol {proxy_type} is disabled on your server",
             )
+    validate_node_group(db, modified_user.node_group_id)
 
     old_status = dbuser.status
     dbuser = crud.update_user(db, dbuser, modified_user)
@@ -199,7 +204,7 @@ def revoke_user_subscription(
     return user
 
 
-@router.get("/users", response_model=UsersResponse, responses={400: responses._400, 403: responses._403, 404: responses._404})
+@router.get("/users", response_class=FastJSONResponse, response_model=UsersResponse, responses={400: responses._400, 403: responses._403, 404: responses._404})
 def get_users(
     offset: int = None,
     limit: int = None,
@@ -208,10 +213,11 @@ def get_users(
     owner: Union[List[str], None] = Query(None, alias="admin"),
     status: UserStatus = None,
     sort: str = None,
+    links: bool = True,
     db: Session = Depends(get_db),
     admin: Admin = Depends(Admin.get_current),
 ):
-    """Get all users"""
+    """Get all users, pass `links=false` to skip generating the links and subscription url of each user"""
     if sort is not None:
         opts = sort.strip(",").split(",")
         sort = []
@@ -235,6 +241,9 @@ def get_users(
         return_with_count=True,
     )
 
+    if links:
+        users = [UserResponse.model_validate(user) for user in users]
+
     return {"users": users, "total": count}
 
 
@@ -245,11 +254,7 @@ def reset_users_data_usage(
     """Reset all users data usage"""
     dbadmin = crud.get_admin(db, admin.username)
     crud.reset_all_users_data_usage(db=db, admin=dbadmin)
-    startup_config = xray.config.include_db_users()
-    xray.core.restart(startup_config)
-    for node_id, node in list(xray.nodes.items()):
-        if node.connected:
-            xray.operations.restart_node(node_id, startup_config)
+    xray.operations.restart_core(force=False)
     return {"detail": "Users successfully reset."}
 
 
@@ -295,7 +300,7 @@ def active_next_plan(
     return dbuser
 
 
-@router.get("/users/usage", response_model=UsersUsagesResponse)
+@router.get("/users/usage", response_class=FastJSONResponse, response_model=UsersUsagesResponse)
 def get_users_usage(
     start: str = "",
     end: str = "",
@@ -333,7 +338,7 @@ def set_owner(
     return user
 
 
-@router.get("/users/expired", response_model=List[str])
+@router.get("/users/expired", response_class=FastJSONResponse, response_model=List[str])
 def get_expired_users(
     expired_after: Optional[datetime] = Query(None, example="2024-01-01T00:00:00"),
     expired_before: Optional[datetime] = Query(None, example="2024-01-31T23:59:59"),
@@ -7,7 +7,7 @@ from app.db import Session, crud, get_db
 from app.models.admin import Admin
 from app.models.user_template import (UserTemplateCreate, UserTemplateModify,
                                       UserTemplateResponse)
-from app.dependencies import get_user_template
+from app.dependencies import get_user_template, validate_node_group
 
 router = APIRouter(tags=['User Template'], prefix='/api')
 
@@ -24,7 +24,9 @@ def add_user_template(
     - **data_limit** must be in bytes and larger or equal to 0
     - **expire_duration** must be in seconds and larger or equat to 0
     - **inbounds** dictionary of protocol:inbound_tags, empty means all inbounds
+    - **node_group_id** node group of the users made from the template, none means the nodes without a group
     """
+    validate_node_group(db, new_user_template.node_group_id)
     try:
         return crud.create_user_template(db, new_user_template)
     except IntegrityError:
@@ -54,7 +56,9 @@ def modify_user_template(
     - **data_limit** must be in bytes and larger or equal to 0
     - **expire_duration** must be in seconds and larger or equat to 0
     - **inbounds** dictionary of protocol:inbound_tags, empty means all inbounds
+    - **node_group_id** node group of the users made from the template, `0` removes it, `null` means no change
     """
+    validate_node_group(db, modify_user_template.node_group_id)
     try:
         return crud.update_user_template(db, dbuser_template, modify_user_template)
     except IntegrityError:
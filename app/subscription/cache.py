@@ -0,0 +1,145 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, FrozenSet, Optional, Tuple
+
+from app import xray
+from app.subscription.share import generate_subscription, get_template_fields, setup_format_variables
+from app.utils.metrics import metrics
+from config import SUB_CACHE_RANDOM_HOSTS, SUB_CACHE_SIZE, SUB_CACHE_TTL
+
+if TYPE_CHECKING:
+    from app.models.user import UserListItem
+    from app.utils.sub_lookup import SubscriptionUser
+
+
+def _is_random(values: list) -> bool:
+    return len(values) > 1 or any('*' in value for value in values)
+
+
+class SubscriptionCache:
+    """
+    LRU cache of generated subscriptions with a TTL.
+
+    Entries are keyed by everything which changes the output: the user, its proxies and inbounds,
+    the client format, the hosts and core config versions, and the values of the format
+    variables used by the hosts (so a remark showing {DATA_LEFT} is regenerated when it changes).
+    Users in inbounds having a host with random SNI, host, address or user agent are not cached
+    unless SUB_CACHE_RANDOM_HOSTS is set, since every request must get a new random pick.
+    """
+
+    def __init__(self, size: int, ttl: int, cache_random_hosts: bool = False):
+        self.size = size
+        self.ttl = ttl
+        self.cache_random_hosts = cache_random_hosts
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, Tuple[float, str, str]]" = OrderedDict()
+        self._hosts_key = None
+        self._fields: FrozenSet[str] = frozenset()
+        self._random_tags: FrozenSet[str] = frozenset()
+
+    def generate(self, dbuser: "SubscriptionUser", user: "UserListItem",
+                 config_format: str, as_base64: bool, reverse: bool) -> Tuple[str, str]:
+        """Returns the subscription and its ETag, from the cache if possible"""
+        key = self._get_key(dbuser, user, config_format, as_base64, reverse) if self.size > 0 else None
+        if key is None:
+            metrics.incr("subscription_cache", "bypasses")
+            conf = generate_subscription(user=user, config_format=config_format, as_base64=as_base64, reverse=reverse)
+            return conf, _get_etag(conf)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._count_hit(True)
+                return entry[1], entry[2]
+
+        conf = generate_subscription(user=user, config_format=config_format, as_base64=as_base64, reverse=reverse)
+        etag = _get_etag(conf)
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, conf, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            self._count_hit(False)
+
+        return conf, etag
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _count_hit(self, hit: bool):
+        stats = metrics.get("subscription_cache")
+        hits = stats.get("hits", 0) + hit
+        misses = stats.get("misses", 0) + (not hit)
+        metrics.update("subscription_cache", hits=hits, misses=misses,
+                       hit_ratio=round(hits / (hits + misses), 4), size=len(self._entries))
+
+    def _get_key(self, dbuser: "SubscriptionUser", user: "UserListItem",
+                 config_format: str, as_base64: bool, reverse: bool) -> Optional[tuple]:
+        hosts_key = (xray.config.base_hash, xray.hosts.version)
+        if hosts_key != self._hosts_key:
+            self._analyze_hosts(hosts_key)
+
+        inbound_tags = [tag for tags in user.inbounds.values() for tag in tags]
+        if not self.cache_random_hosts and self._random_tags.intersection(inbound_tags):
+            return None
+
+        format_variables = setup_format_variables(user.__dict__)
+        user_data = json.dumps(
+            [
+                {str(proxy_type): settings.dict(no_obj=True) for proxy_type, settings in user.proxies.items()},
+                {str(proxy_type): tags for proxy_type, tags in user.inbounds.items()},
+                [(name, str(format_variables.get(name))) for name in sorted(self._fields)],
+            ],
+            sort_keys=True
+        )
+
+        return (
+            dbuser.id,
+            config_format,
+            as_base64,
+            reverse,
+            hosts_key,
+            dbuser.edit_at,
+            dbuser.sub_revoked_at,
+            hashlib.sha1(user_data.encode()).hexdigest(),
+        )
+
+    def _analyze_hosts(self, hosts_key: tuple):
+        fields = set()
+        random_tags = set()
+        for tag, inbound in xray.config.inbounds_by_tag.items():
+            fields |= get_template_fields(inbound.get("path"))
+            if inbound.get("sids") and len(inbound["sids"]) > 1:
+                random_tags.add(tag)
+
+            for host in xray.hosts.get(tag, []):
+                fields |= get_template_fields(host["remark"])
+                fields |= get_template_fields(host["path"])
+                for address in host["address"]:
+                    fields |= get_template_fields(address)
+
+                if (host["random_user_agent"]
+                        or _is_random(host["sni"] or inbound["sni"])
+                        or _is_random(host["host"] or inbound["host"])
+                        or _is_random(host["address"])):
+                    random_tags.add(tag)
+
+        with self._lock:
+            self._entries.clear()
+            self._fields = frozenset(fields)
+            self._random_tags = frozenset(random_tags)
+            self._hosts_key = hosts_key
+
+
+def _get_etag(conf: str) -> str:
+    return f'"{hashlib.sha1(conf.encode()).hexdigest()}"'
+
+
+subscription_cache = SubscriptionCache(SUB_CACHE_SIZE, SUB_CACHE_TTL, SUB_CACHE_RANDOM_HOSTS)
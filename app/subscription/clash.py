@@ -1,5 +1,7 @@
 import copy
 import json
+import os
+import re
 from random import choice
 from uuid import UUID
 
@@ -7,7 +9,8 @@ import yaml
 from jinja2.exceptions import TemplateNotFound
 
 from app.subscription.funcs import get_grpc_gun
-from app.templates import render_template
+from app.templates import env, render_parsed_template, render_template
+from app.templates.filters import exclude_keys
 from app.utils.helpers import yml_uuid_representer
 from config import (
     CLASH_SETTINGS_TEMPLATE,
@@ -16,6 +19,70 @@ from config import (
     USER_AGENT_TEMPLATE,
 )
 
+try:
+    from yaml import CSafeDumper
+except ImportError:
+    CSafeDumper = None
+
+# used by the yaml filter of the templates
+yaml.add_representer(UUID, yml_uuid_representer)
+
+DEFAULT_SUBSCRIPTION_TEMPLATE = os.path.abspath("app/templates/clash/default.yml")
+
+# unicode line separators are changed on their way through the template, by YAML and jinja's indent
+LINE_SEPARATOR = re.compile("[\x85\u2028\u2029]")
+
+# strings made of these characters are emitted the same way by libyaml and PyYAML's emitter,
+# libyaml escapes emojis and folds quoted strings having escapes differently
+LIBYAML_SAFE_STRING = re.compile("[\x20-\x7e\xa0-\u2027\u202a-\ud7ff\ue000-\ufefe\uff00-\ufffd]*")
+
+
+def _as_loaded(obj):
+    """
+    Copies `obj` as it comes out of the yaml filter and SafeLoader:
+    mappings with sorted keys and UUIDs as strings.
+    """
+    if isinstance(obj, dict):
+        return {key: _as_loaded(obj[key]) for key in sorted(obj)}
+    if isinstance(obj, list):
+        return [_as_loaded(item) for item in obj]
+    if isinstance(obj, UUID):
+        return str(obj)
+    return obj
+
+
+def _strings(obj):
+    """Yields every string of `obj`, mapping keys included"""
+    if isinstance(obj, str):
+        yield obj
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            yield from _strings(key)
+            yield from _strings(value)
+    elif isinstance(obj, list):
+        for item in obj:
+            yield from _strings(item)
+
+
+def _libyaml_safe(obj) -> bool:
+    if isinstance(obj, str):
+        return LIBYAML_SAFE_STRING.fullmatch(obj) is not None
+    if isinstance(obj, dict):
+        return all(
+            (not isinstance(key, str) or 0 < len(key) < 128 and key.isascii())
+            and _libyaml_safe(key) and _libyaml_safe(value)
+            for key, value in obj.items()
+        )
+    if isinstance(obj, list):
+        return all(_libyaml_safe(item) for item in obj)
+    return True
+
+
+def dump_yaml(document) -> str:
+    """Dumps `document` with libyaml when it's available and gives the same output as PyYAML"""
+    dumper = CSafeDumper if CSafeDumper and _libyaml_safe(document) else yaml.SafeDumper
+    return yaml.dump(document, Dumper=dumper, sort_keys=False, allow_unicode=True)
+
 
 class ClashConfiguration(object):
     def __init__(self):
@@ -26,8 +93,8 @@ class ClashConfiguration(object):
             'rules': []
         }
         self.proxy_remarks = []
-        self.mux_template = render_template(MUX_TEMPLATE)
-        user_agent_data = json.loads(render_template(USER_AGENT_TEMPLATE))
+        self.mux_template = render_parsed_template(MUX_TEMPLATE, json.loads)
+        user_agent_data = render_parsed_template(USER_AGENT_TEMPLATE, json.loads)
 
         if 'list' in user_agent_data and isinstance(user_agent_data['list'], list):
             self.user_agent_list = user_agent_data['list']
@@ -35,7 +102,7 @@ class ClashConfiguration(object):
             self.user_agent_list = []
 
         try:
-            self.settings = yaml.load(render_template(CLASH_SETTINGS_TEMPLATE), Loader=yaml.SafeLoader)
+            self.settings = render_parsed_template(CLASH_SETTINGS_TEMPLATE, yaml.safe_load)
         except TemplateNotFound:
             self.settings = {}
 
@@ -45,19 +112,36 @@ class ClashConfiguration(object):
         if reverse:
             self.data['proxies'].reverse()
 
-        yaml.add_representer(UUID, yml_uuid_representer)
-        return yaml.dump(
-            yaml.load(
+        if (os.path.abspath(env.get_template(CLASH_SUBSCRIPTION_TEMPLATE).filename) == DEFAULT_SUBSCRIPTION_TEMPLATE
+                and not any(map(LINE_SEPARATOR.search, _strings([self.data, self.proxy_remarks])))):
+            document = self._default_document()
+        else:
+            document = yaml.load(
                 render_template(
                     CLASH_SUBSCRIPTION_TEMPLATE,
                     {"conf": self.data, "proxy_remarks": self.proxy_remarks}
                 ),
                 Loader=yaml.SafeLoader
+            )
 
-            ),
-            sort_keys=False,
-            allow_unicode=True,
-        )
+        return dump_yaml(document)
+
+    def _default_document(self) -> dict:
+        """Builds what the default subscription template renders to, without going through YAML text"""
+        document = {"mode": "Global", "port": 7890}
+        document.update(_as_loaded(exclude_keys(self.data, "proxy-groups", "port", "mode")))
+        document["proxy-groups"] = [
+            {
+                "name": "♻️ Automatic",
+                "type": "url-test",
+                "url": "http://www.gstatic.com/generate_204",
+                "interval": 300,
+                # an empty list renders to nothing, which is loaded as null
+                "proxies": _as_loaded(self.proxy_remarks) or None,
+            },
+            *_as_loaded(self.data.get("proxy-groups", [])),
+        ]
+        return document
 
     def __str__(self) -> str:
         return self.render()
@@ -245,11 +329,10 @@ class ClashConfiguration(object):
 
         node[f'{network}-opts'] = net_opts
 
-        mux_json = json.loads(self.mux_template)
-        mux_config = mux_json["clash"]
+        mux_config = self.mux_template["clash"]
 
         if mux_enable:
-            node['smux'] = mux_config
+            node['smux'] = copy.deepcopy(mux_config)
 
         return node
 
@@ -1,10 +1,12 @@
 import base64
 import random
 import secrets
+import threading
 from collections import defaultdict
 from datetime import datetime as dt
 from datetime import timedelta
-from typing import TYPE_CHECKING, List, Literal, Union
+from string import Formatter
+from typing import TYPE_CHECKING, Callable, Dict, List, Literal, Optional, Set, Tuple, Union
 
 from jdatetime import date as jd
 
@@ -47,7 +49,8 @@ STATUS_TEXTS = {
 def generate_v2ray_links(proxies: dict, inbounds: dict, extra_data: dict, reverse: bool) -> list:
     format_variables = setup_format_variables(extra_data)
     conf = V2rayShareLink()
-    return process_inbounds_and_tags(inbounds, proxies, format_variables, conf=conf, reverse=reverse)
+    return process_inbounds_and_tags(inbounds, proxies, format_variables, conf=conf, reverse=reverse,
+                                     node_group_id=extra_data.get("node_group_id"))
 
 
 def generate_clash_subscription(
@@ -60,7 +63,8 @@ def generate_clash_subscription(
 
     format_variables = setup_format_variables(extra_data)
     return process_inbounds_and_tags(
-        inbounds, proxies, format_variables, conf=conf, reverse=reverse
+        inbounds, proxies, format_variables, conf=conf, reverse=reverse,
+        node_group_id=extra_data.get("node_group_id")
     )
 
 
@@ -71,7 +75,8 @@ def generate_singbox_subscription(
 
     format_variables = setup_format_variables(extra_data)
     return process_inbounds_and_tags(
-        inbounds, proxies, format_variables, conf=conf, reverse=reverse
+        inbounds, proxies, format_variables, conf=conf, reverse=reverse,
+        node_group_id=extra_data.get("node_group_id")
     )
 
 
@@ -82,7 +87,8 @@ def generate_outline_subscription(
 
     format_variables = setup_format_variables(extra_data)
     return process_inbounds_and_tags(
-        inbounds, proxies, format_variables, conf=conf, reverse=reverse
+        inbounds, proxies, format_variables, conf=conf, reverse=reverse,
+        node_group_id=extra_data.get("node_group_id")
     )
 
 
@@ -93,7 +99,8 @@ def generate_v2ray_json_subscription(
 
     format_variables = setup_format_variables(extra_data)
     return process_inbounds_and_tags(
-        inbounds, proxies, format_variables, conf=conf, reverse=reverse
+        inbounds, proxies, format_variables, conf=conf, reverse=reverse,
+        node_group_id=extra_data.get("node_group_id")
     )
 
 
@@ -229,6 +236,134 @@ def setup_format_variables(extra_data: dict) -> dict:
     return format_variables
 
 
+def get_template_fields(template: Optional[str]) -> Set[str]:
+    """Returns the format variables used by a remark, address or path template"""
+    if not template:
+        return set()
+    try:
+        return {name for _, name, _, _ in Formatter().parse(template) if name}
+    except ValueError:
+        return set()
+
+
+def _compile_template(template: str) -> Callable[[dict], str]:
+    try:
+        static = not get_template_fields(template) and template.format_map({})
+    except ValueError:
+        static = False  # malformed templates keep failing the way they did
+    if static is False:
+        return template.format_map
+    return lambda _: static
+
+
+def _compile_choice(values: List[str]) -> Union[str, List[str]]:
+    """Resolves a list of values ahead of time when no random pick is needed"""
+    if not values:
+        return ""
+    if len(values) == 1 and "*" not in values[0]:
+        return values[0]
+    return values
+
+
+def _pick(choice: Union[str, List[str]]) -> str:
+    if isinstance(choice, str):
+        return choice
+    return random.choice(choice).replace("*", secrets.token_hex(8))
+
+
+class HostPlan:
+    """
+    The link of an inbound through one of its hosts, with everything which doesn't
+    depend on the user resolved ahead of time. Only random picks and templates
+    using format variables are left to be filled in for each user.
+    """
+    __slots__ = ("inbound", "remark", "address", "path", "sni", "host", "sids", "use_sni_as_host", "node_group_id")
+
+    def __init__(self, inbound: dict, host: dict):
+        self.remark = _compile_template(host["remark"])
+        self.address = _compile_choice(host["address"])
+        if isinstance(self.address, str):
+            self.address = _compile_template(self.address)
+        self.path = _compile_template(host["path"] if host["path"] is not None else inbound.get("path", ""))
+        self.sni = _compile_choice(host["sni"] or inbound["sni"])
+        self.host = _compile_choice(host["host"] or inbound["host"])
+        self.sids = inbound.get("sids") or []
+        self.use_sni_as_host = host.get("use_sni_as_host", False)
+        # only the users of the node group get the host
+        self.node_group_id = host.get("node_group_id")
+
+        self.inbound = inbound.copy()
+        self.inbound.update(
+            {
+                "port": host["port"] or inbound["port"],
+                "tls": inbound["tls"] if host["tls"] is None else host["tls"],
+                "alpn": host["alpn"] if host["alpn"] else None,
+                "fp": host["fingerprint"] or inbound.get("fp", ""),
+                "ais": host["allowinsecure"]
+                or inbound.get("allowinsecure", ""),
+                "mux_enable": host["mux_enable"],
+                "fragment_setting": host["fragment_setting"],
+                "noise_setting": host["noise_setting"],
+                "random_user_agent": host["random_user_agent"],
+            }
+        )
+        if len(self.sids) == 1:
+            self.inbound["sid"] = self.sids[0]
+
+    def render(self, format_variables: dict) -> Tuple[str, str, dict]:
+        """Returns the remark, address and inbound of the link"""
+        sni = _pick(self.sni)
+        req_host = _pick(self.host)
+        if self.use_sni_as_host and sni:
+            req_host = sni
+
+        if isinstance(self.address, list):
+            address = _pick(self.address).format_map(format_variables)
+        else:
+            address = self.address(format_variables)
+
+        inbound = self.inbound.copy()
+        inbound["sni"] = sni
+        inbound["host"] = req_host
+        inbound["path"] = self.path(format_variables)
+        if len(self.sids) > 1:
+            inbound["sid"] = random.choice(self.sids)
+
+        return self.remark(format_variables), address, inbound
+
+
+class HostPlans:
+    """The host plans of every inbound, rebuilt when the hosts or the core config change"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._plans: Tuple[Dict[str, int], Dict[str, List[HostPlan]]] = ({}, {})
+
+    def get(self) -> Tuple[Dict[str, int], Dict[str, List[HostPlan]]]:
+        """Returns the position of each inbound tag in the core config and the plans of its hosts"""
+        if self._key != (xray.config.base_hash, xray.hosts.version):
+            self._build()
+        return self._plans
+
+    def _build(self):
+        with self._lock:
+            inbounds_by_tag = xray.config.inbounds_by_tag
+            hosts = {tag: xray.hosts.get(tag, []) for tag in inbounds_by_tag}
+            key = (xray.config.base_hash, xray.hosts.version)
+            if key == self._key:
+                return
+
+            self._plans = (
+                {tag: index for index, tag in enumerate(inbounds_by_tag)},
+                {tag: [HostPlan(inbound, host) for host in hosts[tag]] for tag, inbound in inbounds_by_tag.items()},
+            )
+            self._key = key
+
+
+host_plans = HostPlans()
+
+
 def process_inbounds_and_tags(
         inbounds: dict,
         proxies: dict,
@@ -242,83 +377,36 @@ def process_inbounds_and_tags(
             OutlineConfiguration
         ],
         reverse=False,
+        node_group_id: Optional[int] = None,
 ) -> Union[List, str]:
+    order, plans = host_plans.get()
     _inbounds = []
     for protocol, tags in inbounds.items():
         for tag in tags:
-            _inbounds.append((protocol, [tag]))
-    index_dict = {proxy: index for index, proxy in enumerate(
-        xray.config.inbounds_by_tag.keys())}
-    inbounds = sorted(
-        _inbounds, key=lambda x: index_dict.get(x[1][0], float('inf')))
+            _inbounds.append((order.get(tag, float('inf')), protocol, tag))
+    _inbounds.sort(key=lambda x: x[0])
 
-    for protocol, tags in inbounds:
+    for _, protocol, tag in _inbounds:
         settings = proxies.get(protocol)
         if not settings:
             continue
 
+        tag_plans = [plan for plan in plans.get(tag) or ()
+                     if plan.node_group_id is None or plan.node_group_id == node_group_id]
+        if not tag_plans:
+            continue
+
         format_variables.update({"PROTOCOL": protocol.name})
-        for tag in tags:
-            inbound = xray.config.inbounds_by_tag.get(tag)
-            if not inbound:
-                continue
-
-            format_variables.update({"TRANSPORT": inbound["network"]})
-            host_inbound = inbound.copy()
-            for host in xray.hosts.get(tag, []):
-                sni = ""
-                sni_list = host["sni"] or inbound["sni"]
-                if sni_list:
-                    salt = secrets.token_hex(8)
-                    sni = random.choice(sni_list).replace("*", salt)
-
-                if sids := inbound.get("sids"):
-                    inbound["sid"] = random.choice(sids)
-
-                req_host = ""
-                req_host_list = host["host"] or inbound["host"]
-                if req_host_list:
-                    salt = secrets.token_hex(8)
-                    req_host = random.choice(req_host_list).replace("*", salt)
-
-                address = ""
-                address_list = host['address']
-                if host['address']:
-                    salt = secrets.token_hex(8)
-                    address = random.choice(address_list).replace('*', salt)
-
-                if host["path"] is not None:
-                    path = host["path"].format_map(format_variables)
-                else:
-                    path = inbound.get("path", "").format_map(format_variables)
-
-                if host.get("use_sni_as_host", False) and sni:
-                    req_host = sni
-
-                host_inbound.update(
-                    {
-                        "port": host["port"] or inbound["port"],
-                        "sni": sni,
-                        "host": req_host,
-                        "tls": inbound["tls"] if host["tls"] is None else host["tls"],
-                        "alpn": host["alpn"] if host["alpn"] else None,
-                        "path": path,
-                        "fp": host["fingerprint"] or inbound.get("fp", ""),
-                        "ais": host["allowinsecure"]
-                        or inbound.get("allowinsecure", ""),
-                        "mux_enable": host["mux_enable"],
-                        "fragment_setting": host["fragment_setting"],
-                        "noise_setting": host["noise_setting"],
-                        "random_user_agent": host["random_user_agent"],
-                    }
-                )
-
-                conf.add(
-                    remark=host["remark"].format_map(format_variables),
-                    address=address.format_map(format_variables),
-                    inbound=host_inbound,
-                    settings=settings.model_dump()
-                )
+        format_variables.update({"TRANSPORT": tag_plans[0].inbound["network"]})
+        settings_dict = settings.model_dump()
+        for plan in tag_plans:
+            remark, address, inbound = plan.render(format_variables)
+            conf.add(
+                remark=remark,
+                address=address,
+                inbound=inbound,
+                settings=settings_dict
+            )
 
     return conf.render(reverse=reverse)
 
@@ -2,15 +2,16 @@ import copy
 import json
 from random import choice
 
-from app.utils.helpers import UUIDEncoder
+from app.utils.helpers import json_dumps
 from jinja2.exceptions import TemplateNotFound
 
 from app.subscription.funcs import get_grpc_gun
-from app.templates import render_template
+from app.templates import render_parsed_template
 from config import (
     MUX_TEMPLATE,
     SINGBOX_SETTINGS_TEMPLATE,
     SINGBOX_SUBSCRIPTION_TEMPLATE,
+    SUB_JSON_INDENT,
     USER_AGENT_TEMPLATE
 )
 
@@ -19,9 +20,11 @@ class SingBoxConfiguration(str):
 
     def __init__(self):
         self.proxy_remarks = []
-        self.config = json.loads(render_template(SINGBOX_SUBSCRIPTION_TEMPLATE))
-        self.mux_template = render_template(MUX_TEMPLATE)
-        user_agent_data = json.loads(render_template(USER_AGENT_TEMPLATE))
+        template = render_parsed_template(SINGBOX_SUBSCRIPTION_TEMPLATE, json.loads)
+        # the template is shared, only the outbounds are changed while rendering
+        self.config = {**template, "outbounds": [outbound.copy() for outbound in template["outbounds"]]}
+        self.mux_template = render_parsed_template(MUX_TEMPLATE, json.loads)
+        user_agent_data = render_parsed_template(USER_AGENT_TEMPLATE, json.loads)
 
         if 'list' in user_agent_data and isinstance(user_agent_data['list'], list):
             self.user_agent_list = user_agent_data['list']
@@ -29,7 +32,7 @@ class SingBoxConfiguration(str):
             self.user_agent_list = []
 
         try:
-            self.settings = json.loads(render_template(SINGBOX_SETTINGS_TEMPLATE))
+            self.settings = render_parsed_template(SINGBOX_SETTINGS_TEMPLATE, json.loads)
         except TemplateNotFound:
             self.settings = {}
 
@@ -66,7 +69,7 @@ class SingBoxConfiguration(str):
 
         if reverse:
             self.config["outbounds"].reverse()
-        return json.dumps(self.config, indent=4,cls=UUIDEncoder)
+        return json_dumps(self.config, indent=SUB_JSON_INDENT)
 
     @staticmethod
     def tls_config(sni=None, fp=None, tls=None, pbk=None,
@@ -274,10 +277,9 @@ class SingBoxConfiguration(str):
                                             pbk=pbk, sid=sid, alpn=alpn,
                                             ais=ais)
 
-        mux_json = json.loads(self.mux_template)
-        mux_config = mux_json["sing-box"]
+        mux_config = self.mux_template["sing-box"]
 
-        config['multiplex'] = mux_config
+        config['multiplex'] = copy.deepcopy(mux_config)
         if config['multiplex']["enabled"]:
             config['multiplex']["enabled"] = mux_enable
 
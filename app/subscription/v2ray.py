@@ -10,12 +10,13 @@ from uuid import UUID
 from jinja2.exceptions import TemplateNotFound
 
 from app.subscription.funcs import get_grpc_gun, get_grpc_multi
-from app.templates import render_template
-from app.utils.helpers import UUIDEncoder
+from app.templates import render_parsed_template
+from app.utils.helpers import json_dumps
 from config import (
     EXTERNAL_CONFIG,
     GRPC_USER_AGENT_TEMPLATE,
     MUX_TEMPLATE,
+    SUB_JSON_INDENT,
     USER_AGENT_TEMPLATE,
     V2RAY_SETTINGS_TEMPLATE,
     V2RAY_SUBSCRIPTION_TEMPLATE,
@@ -489,16 +490,16 @@ class V2rayJsonConfig(str):
 
     def __init__(self):
         self.config = []
-        self.template = render_template(V2RAY_SUBSCRIPTION_TEMPLATE)
-        self.mux_template = render_template(MUX_TEMPLATE)
-        user_agent_data = json.loads(render_template(USER_AGENT_TEMPLATE))
+        self.template = render_parsed_template(V2RAY_SUBSCRIPTION_TEMPLATE, json.loads)
+        self.mux_template = render_parsed_template(MUX_TEMPLATE, json.loads)
+        user_agent_data = render_parsed_template(USER_AGENT_TEMPLATE, json.loads)
 
         if 'list' in user_agent_data and isinstance(user_agent_data['list'], list):
             self.user_agent_list = user_agent_data['list']
         else:
             self.user_agent_list = []
 
-        grpc_user_agent_data = json.loads(render_template(GRPC_USER_AGENT_TEMPLATE))
+        grpc_user_agent_data = render_parsed_template(GRPC_USER_AGENT_TEMPLATE, json.loads)
 
         if 'list' in grpc_user_agent_data and isinstance(grpc_user_agent_data['list'], list):
             self.grpc_user_agent_data = grpc_user_agent_data['list']
@@ -506,14 +507,15 @@ class V2rayJsonConfig(str):
             self.grpc_user_agent_data = []
 
         try:
-            self.settings = json.loads(render_template(V2RAY_SETTINGS_TEMPLATE))
+            self.settings = render_parsed_template(V2RAY_SETTINGS_TEMPLATE, json.loads)
         except TemplateNotFound:
             self.settings = {}
 
         del user_agent_data, grpc_user_agent_data
 
     def add_config(self, remarks, outbounds):
-        json_template = json.loads(self.template)
+        # the template is shared, only the replaced keys may differ between configs
+        json_template = dict(self.template)
         json_template["remarks"] = remarks
         json_template["outbounds"] = outbounds + json_template["outbounds"]
         self.config.append(json_template)
@@ -521,7 +523,7 @@ class V2rayJsonConfig(str):
     def render(self, reverse=False):
         if reverse:
             self.config.reverse()
-        return json.dumps(self.config, indent=4, cls=UUIDEncoder)
+        return json_dumps(self.config, indent=SUB_JSON_INDENT)
 
     @staticmethod
     def tls_config(sni=None, fp=None, alpn=None, ais: bool = False) -> dict:
@@ -708,9 +710,9 @@ class V2rayJsonConfig(str):
                 "header": {}
             }))
         else:
-            config = self.settings.get("httpSettings", {
+            config = copy.deepcopy(self.settings.get("httpSettings", {
                 "header": {}
-            })
+            }))
         if "header" not in config:
             config["header"] = {}
 
@@ -1072,11 +1074,10 @@ class V2rayJsonConfig(str):
             keepAlivePeriod=inbound.get("keepAlivePeriod", 0),
         )
 
-        mux_json = json.loads(self.mux_template)
-        mux_config = mux_json["v2ray"]
+        mux_config = self.mux_template["v2ray"]
 
         if inbound.get('mux_enable', False):
-            outbound["mux"] = mux_config
+            outbound["mux"] = copy.deepcopy(mux_config)
             outbound["mux"]["enabled"] = True
 
         self.add_config(remarks=remark, outbounds=outbounds)
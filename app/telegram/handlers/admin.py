@@ -979,6 +979,7 @@ def random_username(call: types.CallbackQuery):
     mem_store.set(f"{call.message.chat.id}:username", username)
     mem_store.set(f"{call.message.chat.id}:data_limit", template.data_limit)
     mem_store.set(f"{call.message.chat.id}:protocols", template.inbounds)
+    mem_store.set(f"{call.message.chat.id}:node_group_id", template.node_group_id)
     now = datetime.now()
     today = datetime(year=now.year, month=now.month, day=now.day, hour=23, minute=59, second=59)
     expire_date = None
@@ -1070,6 +1071,7 @@ def add_user_from_template_username_step(message: types.Message):
     mem_store.set(f"{message.chat.id}:username", username)
     mem_store.set(f"{message.chat.id}:data_limit", template.data_limit)
     mem_store.set(f"{message.chat.id}:protocols", template.inbounds)
+    mem_store.set(f"{message.chat.id}:node_group_id", template.node_group_id)
     now = datetime.now()
     today = datetime(year=now.year, month=now.month, day=now.day, hour=23, minute=59, second=59)
     expire_date = None
@@ -1123,6 +1125,7 @@ def add_user_command(call: types.CallbackQuery):
         mem_store.set(f"{call.message.chat.id}:is_bulk", False)
 
     mem_store.set(f"{call.message.chat.id}:is_bulk_from_template", False)
+    mem_store.delete(f"{call.message.chat.id}:node_group_id")
 
     username_msg = bot.send_message(
         call.message.chat.id,
@@ -1591,11 +1594,11 @@ def confirm_user_command(call: types.CallbackQuery):
     elif data == 'restart':
         m = bot.edit_message_text(
             '🔄 Restarting XRay core...', call.message.chat.id, call.message.message_id)
-        config = xray.config.include_db_users()
+        config = xray.config.include_db_users(reload=True)
         xray.core.restart(config)
         for node_id, node in list(xray.nodes.items()):
             if node.connected:
-                xray.operations.restart_node(node_id, config)
+                xray.operations.restart_node(node_id, config, force=True)
         bot.edit_message_text(
             '✅ XRay core restarted successfully.',
             m.chat.id, m.message_id,
@@ -1633,6 +1636,7 @@ def confirm_user_command(call: types.CallbackQuery):
                     status=UserStatus.active,
                     expire=int(expire_date.timestamp()) if expire_date else 0,
                     data_limit=template.data_limit,
+                    node_group_id=template.node_group_id,
                 )
             else:
                 expire_date = None
@@ -1834,7 +1838,8 @@ def confirm_user_command(call: types.CallbackQuery):
                     data_limit=mem_store.get(f'{call.message.chat.id}:data_limit')
                     if mem_store.get(f'{call.message.chat.id}:data_limit') else None,
                     proxies=proxies,
-                    inbounds=inbounds)
+                    inbounds=inbounds,
+                    node_group_id=mem_store.get(f'{call.message.chat.id}:node_group_id'))
             else:
                 new_user = UserCreate(
                     username=username,
@@ -1844,7 +1849,8 @@ def confirm_user_command(call: types.CallbackQuery):
                     data_limit=mem_store.get(f'{call.message.chat.id}:data_limit')
                     if mem_store.get(f'{call.message.chat.id}:data_limit') else None,
                     proxies=proxies,
-                    inbounds=inbounds)
+                    inbounds=inbounds,
+                    node_group_id=mem_store.get(f'{call.message.chat.id}:node_group_id'))
             for proxy_type in new_user.proxies:
                 if not xray.config.inbounds_by_protocol.get(proxy_type):
                     return bot.answer_callback_query(
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Union
+from typing import Any, Callable, Dict, Tuple, Union
 
 import jinja2
 
@@ -19,3 +19,22 @@ env.globals['now'] = datetime.utcnow
 
 def render_template(template: str, context: Union[dict, None] = None) -> str:
     return env.get_template(template).render(context or {})
+
+
+_parsed_templates: Dict[Tuple[str, Callable], Tuple[jinja2.Template, Any]] = {}
+
+
+def render_parsed_template(template: str, parse: Callable[[str], Any]) -> Any:
+    """
+    Renders a template without context and parses it with `parse`. The result is cached until
+    the template file is modified, it's shared by every caller so it must be copied before any change.
+    """
+    key = (template, parse)
+    cached = _parsed_templates.get(key)
+    if cached and cached[0].is_up_to_date:
+        return cached[1]
+
+    jinja_template = env.get_template(template)
+    parsed = parse(jinja_template.render())
+    _parsed_templates[key] = (jinja_template, parsed)
+    return parsed
@@ -1,8 +1,19 @@
-from threading import Thread
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from threading import Lock, Thread
+from typing import Awaitable, Callable, Optional, TypeVar
 
 import anyio
 from fastapi import BackgroundTasks
 
+from config import SUB_RENDER_WORKERS
+
+T = TypeVar("T")
+
+# subscriptions are rendered here by the async endpoints, so a burst of polls can't take every thread
+render_executor = ThreadPoolExecutor(max_workers=SUB_RENDER_WORKERS, thread_name_prefix="sub-render")
+
 
 def threaded_function(func):
     def wrapper(*args, **kwargs):
@@ -11,6 +22,38 @@ def threaded_function(func):
     return wrapper
 
 
+async def run_in_executor(executor: Executor, func: Callable[..., T], *args, **kwargs) -> T:
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+class EventLoopThread:
+    """
+    An event loop running in a daemon thread, for the jobs to run their async code on.
+    The loop outlives each job, so what's bound to it like grpc.aio channels can be reused.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                Thread(target=self._loop.run_forever, name=self.name, daemon=True).start()
+            return self._loop
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Runs `coro` on the loop and waits for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+
+# the async code of the jobs runs here, like the usage sweeps across cores
+jobs_loop = EventLoopThread("jobs-loop")
+
+
 class GetBG:
     """
     context manager for fastapi.BackgroundTasks
@@ -0,0 +1,360 @@
+import asyncio
+import fcntl
+import inspect
+import json
+import os
+import random
+import select
+import socket
+import socketserver
+import threading
+import time
+from contextlib import closing
+from functools import wraps
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from app import logger
+from app.utils.helpers import json_dumps
+from config import CONTROLLER_SOCKET, UVICORN_WORKERS
+
+
+class Controller:
+    """
+    Coordinates the processes of marzban when uvicorn runs more than one worker.
+
+    The worker which locks `<socket_path>.lock` first is the controller, it runs the xray core,
+    connects the nodes, runs the jobs and serves the other workers on a unix socket.
+    The other workers only serve http, they run the xray operations on the controller
+    through `call` and share their changes of the in-memory state with `broadcast`.
+    When the controller exits the lock is released, and the first worker to notice it takes over.
+
+    With a single worker the process is the controller and nothing goes through the socket.
+    """
+
+    def __init__(self, workers: int, socket_path: str, timeout: float = 10):
+        self.workers = workers
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.is_controller = workers <= 1
+
+        self._elected_hooks: List[Callable[[], Any]] = []
+        self._handlers: Dict[str, Callable[..., Any]] = {"publish": self._publish}
+        self._streamers: Dict[str, Callable[..., Any]] = {}
+        self._listeners: Dict[str, List[Callable[..., Any]]] = {}
+
+        self._election_lock = threading.Lock()
+        self._lock_file = None
+        self._server: Optional[socketserver.ThreadingUnixStreamServer] = None
+        self._subscribers: Dict[socket.socket, int] = {}
+        self._subscribers_lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    @property
+    def multiprocess(self) -> bool:
+        return self.workers > 1
+
+    def on_elected(self, func: Callable[[], Any]):
+        """Registers a function to run once the process becomes the controller"""
+        self._elected_hooks.append(func)
+        return func
+
+    def handler(self, name: str):
+        """Registers a function which the workers run on the controller by `call`"""
+        def decorator(func):
+            self._handlers[name] = func
+            return func
+        return decorator
+
+    def streamer(self, name: str):
+        """
+        Registers a generator which the workers read from the controller by `stream`.
+        It yields lists of lines, an empty list when there's nothing new.
+        """
+        def decorator(func):
+            self._streamers[name] = func
+            return func
+        return decorator
+
+    def listener(self, event: str):
+        """
+        Registers a function to run in every process on `broadcast(event, ...)`.
+        After a worker reconnects to the controller its listeners run without arguments,
+        since the events sent meanwhile are lost.
+        """
+        def decorator(func):
+            self._listeners.setdefault(event, []).append(func)
+            return func
+        return decorator
+
+    def delegate(self, func: Callable):
+        """
+        Makes `func` run on the controller when it's called by a worker.
+        The arguments must be JSON serializable, the controller calls it the same way as the worker.
+        """
+        signature = inspect.signature(func)
+        self._handlers[func.__name__] = func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if self.is_controller:
+                return func(*args, **kwargs)
+            return self.call(func.__name__, **signature.bind(*args, **kwargs).arguments)
+
+        return wrapper
+
+    def call(self, name: str, **kwargs):
+        """Runs the handler `name` on the controller and returns its result"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if self.is_controller:
+                return self._handlers[name](**kwargs)
+
+            try:
+                response = self._request({"op": "call", "name": name, "args": kwargs})
+                break
+            except OSError as err:
+                self._disconnect()
+                if self._take_over():
+                    continue
+                if time.monotonic() > deadline:
+                    raise ConnectionError(f"Controller is unreachable: {err}") from err
+                time.sleep(0.1)
+
+        if "error" in response:
+            raise RuntimeError(f"Controller failed to run {name}: {response['error']}")
+        return response.get("result")
+
+    def broadcast(self, event: str, **kwargs):
+        """Runs the listeners of `event` in this process, then in the other processes"""
+        self._dispatch(event, kwargs)
+        if not self.multiprocess:
+            return
+
+        try:
+            self.call("publish", event=event, args=kwargs, origin=os.getpid())
+        except ConnectionError as err:
+            logger.warning(f"Unable to broadcast {event} to the other workers: {err}")
+
+    async def stream(self, name: str, **kwargs) -> AsyncIterator[List[str]]:
+        """Reads the streamer `name` of the controller, an empty list is yielded when nothing is new"""
+        if self.is_controller:
+            with closing(self._streamers[name](**kwargs)) as lines_iter:
+                for lines in lines_iter:
+                    yield lines
+            return
+
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        try:
+            writer.write(_encode({"op": "stream", "name": name, "args": kwargs}))
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), timeout=0.2)
+                except asyncio.TimeoutError:
+                    yield []
+                    continue
+                if not line:
+                    return
+                yield json.loads(line)
+        finally:
+            writer.close()
+
+    def elect(self) -> bool:
+        """Makes the process the controller if no other one is, returns whether it is"""
+        if self.multiprocess and not self._take_over(startup=True):
+            logger.info(f"Worker {os.getpid()} is serving, the xray core runs on the controller")
+            threading.Thread(target=self._subscribe, daemon=True).start()
+            return False
+
+        self._run_elected_hooks()
+        return True
+
+    def close(self):
+        self._closed = True
+        self._disconnect()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            with self._subscribers_lock:
+                for conn in list(self._subscribers):
+                    conn.close()
+                self._subscribers.clear()
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+        if self._lock_file:
+            self._lock_file.close()
+
+    def _take_over(self, startup: bool = False) -> bool:
+        """
+        Becomes the controller if the lock is free. The socket is served right away,
+        the hooks run in the background unless the worker is starting up.
+        """
+        with self._election_lock:
+            if self.is_controller:
+                return True
+            if self._closed:
+                return False
+
+            lock_file = open(f"{self.socket_path}.lock", "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+
+            self._lock_file = lock_file
+            self._serve()
+            self.is_controller = True
+
+        logger.info(f"Worker {os.getpid()} is the controller")
+        if not startup:
+            threading.Thread(target=self._run_elected_hooks, daemon=True).start()
+        return True
+
+    def _run_elected_hooks(self):
+        for hook in self._elected_hooks:
+            try:
+                hook()
+            except Exception:
+                logger.exception(f"Unable to run {hook.__name__} on the controller")
+
+    def _serve(self):
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, _RequestHandler)
+        self._server.daemon_threads = True
+        self._server.controller = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def _request(self, message: dict) -> dict:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+
+        sock, rfile = conn
+        sock.sendall(_encode(message))
+        line = rfile.readline()
+        if not line:
+            raise ConnectionResetError("Connection closed by the controller")
+        return json.loads(line)
+
+    def _disconnect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            conn[1].close()
+            conn[0].close()
+
+    def _subscribe(self):
+        """Receives the broadcasts of the other processes until the worker takes over or exits"""
+        subscribed = False
+        while not self._closed:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.socket_path)
+                    sock.sendall(_encode({"op": "subscribe", "pid": os.getpid()}))
+                    with sock.makefile("rb") as rfile:
+                        if subscribed:
+                            for event in self._listeners:
+                                self._dispatch(event, {})
+                        subscribed = True
+                        for line in rfile:
+                            message = json.loads(line)
+                            self._dispatch(message["event"], message["args"])
+            except OSError:
+                pass
+
+            if self._closed or self._take_over():
+                return
+            time.sleep(random.uniform(0.1, 0.5))
+
+    def _dispatch(self, event: str, args: dict):
+        for func in self._listeners.get(event, ()):
+            try:
+                func(**args)
+            except Exception:
+                logger.exception(f"Unable to handle {event} event")
+
+    def _publish(self, event: str, args: dict, origin: int):
+        if origin != os.getpid():
+            self._dispatch(event, args)
+
+        message = _encode({"event": event, "args": args})
+        with self._subscribers_lock:
+            for conn, pid in list(self._subscribers.items()):
+                if pid == origin:
+                    continue
+                try:
+                    conn.sendall(message)
+                except OSError:
+                    # the worker resyncs when it reconnects
+                    del self._subscribers[conn]
+                    conn.close()
+
+    def _add_subscriber(self, conn: socket.socket, pid: int):
+        conn.settimeout(1)
+        with self._subscribers_lock:
+            self._subscribers[conn] = pid
+
+    def _remove_subscriber(self, conn: socket.socket):
+        with self._subscribers_lock:
+            self._subscribers.pop(conn, None)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        controller: Controller = self.server.controller
+        for line in self.rfile:
+            request = json.loads(line)
+            op = request["op"]
+
+            if op == "subscribe":
+                controller._add_subscriber(self.connection, request["pid"])
+                try:
+                    # subscribers don't send anything else, readable means the worker exited
+                    select.select([self.connection], [], [])
+                except (OSError, ValueError):
+                    pass
+                finally:
+                    controller._remove_subscriber(self.connection)
+                return
+
+            if op == "stream":
+                return self._stream(controller._streamers[request["name"]], request["args"])
+
+            try:
+                response = {"result": controller._handlers[request["name"]](**request["args"])}
+            except Exception as err:
+                logger.exception(f"Unable to run {request['name']} for a worker")
+                response = {"error": str(err) or type(err).__name__}
+            self.wfile.write(_encode(response))
+
+    def _stream(self, streamer: Callable, args: dict):
+        with closing(streamer(**args)) as lines_iter:
+            for lines in lines_iter:
+                if lines:
+                    self.wfile.write(_encode(lines))
+                    continue
+
+                # the worker doesn't send anything, readable means it closed the connection
+                readable, _, _ = select.select([self.connection], [], [], 0.2)
+                if readable:
+                    return
+
+
+def _encode(message: Any) -> bytes:
+    return (json_dumps(message) + "\n").encode()
+
+
+controller = Controller(UVICORN_WORKERS, CONTROLLER_SOCKET)
@@ -0,0 +1,160 @@
+import heapq
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.models.user import UserStatus
+from app.utils.controller import controller
+from config import JOB_REVIEW_USERS_REBUILD_INTERVAL
+
+# (deadline, remaining data, on hold, due)
+Entry = Tuple[Optional[float], Optional[int], bool, bool]
+
+
+def _get_entry(user) -> Entry:
+    deadline = remaining = None
+    on_hold = due = False
+    if user.status == UserStatus.active:
+        if user.expire:
+            deadline = float(user.expire)
+        if user.data_limit:
+            remaining = user.data_limit - (user.used_traffic or 0)
+            due = remaining <= 0
+
+    elif user.status == UserStatus.on_hold:
+        on_hold = True
+        due = bool(user.online_at and user.online_at >= (user.edit_at or user.created_at))
+        if user.on_hold_timeout:
+            deadline = user.on_hold_timeout.timestamp()
+
+    return deadline, remaining, on_hold, due
+
+
+class UserDeadlines:
+    """
+    Keeps track of when active and on hold users may change their status,
+    so the review job only has to look at the users which are due.
+
+    Each tracked user has at most one deadline, the expire time of an active user
+    or the on hold timeout of an on hold user. Deadlines live in a min-heap and
+    outdated heap entries are skipped lazily when they are popped.
+    Data limit crossings are detected from the usage deltas, and any usage of
+    an on hold user makes it due since it may start its expiration timer.
+
+    The review job runs on the controller, the changes made by the other workers are sent to it.
+    """
+
+    def __init__(self, rebuild_interval: int = 0):
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, int]] = []
+        self._deadlines: Dict[int, float] = {}
+        self._remaining: Dict[int, int] = {}
+        self._on_hold: Set[int] = set()
+        self._due: Set[int] = set()
+        self._built_at: Optional[float] = None
+
+    def needs_rebuild(self) -> bool:
+        if self._built_at is None:
+            return True
+        return bool(self.rebuild_interval) and time.monotonic() - self._built_at >= self.rebuild_interval
+
+    def invalidate(self):
+        """Forces a rebuild from the database on the next review"""
+        if not controller.is_controller:
+            return controller.call("invalidate_user_deadlines")
+        self._built_at = None
+
+    def rebuild(self, users: Iterable):
+        """Tracks `users` from scratch, users which are already due stay due"""
+        with self._lock:
+            self._heap.clear()
+            self._deadlines.clear()
+            self._remaining.clear()
+            self._on_hold.clear()
+            for user in users:
+                self._set(user.id, _get_entry(user))
+            heapq.heapify(self._heap)
+            self._built_at = time.monotonic()
+
+    def track(self, user):
+        """Updates the deadlines of a user, `user` may be a db user or a row having the same attributes"""
+        self.track_entry(user.id, _get_entry(user))
+
+    def track_entry(self, user_id: int, entry: Entry):
+        if not controller.is_controller:
+            return controller.call("track_user_deadlines", user_id=user_id, entry=entry)
+        with self._lock:
+            self._untrack(user_id)
+            self._set(user_id, entry, push=True)
+
+    def retrack(self, user_ids: Iterable[int], users: Iterable):
+        """Replaces the deadlines of `user_ids` with the ones of `users`, users not in `users` are dropped"""
+        with self._lock:
+            for user_id in user_ids:
+                self._untrack(user_id)
+            for user in users:
+                self._set(user.id, _get_entry(user), push=True)
+
+    def discard(self, user_id: int):
+        if not controller.is_controller:
+            return controller.call("discard_user_deadlines", user_id=user_id)
+        with self._lock:
+            self._untrack(user_id)
+
+    def add_usage(self, usages: Dict[int, int]):
+        with self._lock:
+            for user_id, value in usages.items():
+                if user_id in self._on_hold:
+                    self._due.add(user_id)
+                    continue
+
+                remaining = self._remaining.get(user_id)
+                if remaining is None:
+                    continue
+
+                remaining -= value
+                self._remaining[user_id] = remaining
+                if remaining <= 0:
+                    self._due.add(user_id)
+
+    def pop_due(self, now_ts: float) -> Set[int]:
+        with self._lock:
+            due, self._due = self._due, set()
+            while self._heap and self._heap[0][0] <= now_ts:
+                deadline, user_id = heapq.heappop(self._heap)
+                if self._deadlines.get(user_id) == deadline:
+                    del self._deadlines[user_id]
+                    due.add(user_id)
+            return due
+
+    def __len__(self):
+        return len(self._deadlines) + len(self._remaining) + len(self._on_hold)
+
+    def _untrack(self, user_id: int):
+        self._deadlines.pop(user_id, None)
+        self._remaining.pop(user_id, None)
+        self._on_hold.discard(user_id)
+        self._due.discard(user_id)
+
+    def _set(self, user_id: int, entry: Entry, push: bool = False):
+        deadline, remaining, on_hold, due = entry
+        if remaining is not None:
+            self._remaining[user_id] = remaining
+        if on_hold:
+            self._on_hold.add(user_id)
+        if due:
+            self._due.add(user_id)
+
+        if deadline is not None:
+            self._deadlines[user_id] = deadline
+            if push:
+                heapq.heappush(self._heap, (deadline, user_id))
+            else:
+                self._heap.append((deadline, user_id))
+
+
+user_deadlines = UserDeadlines(JOB_REVIEW_USERS_REBUILD_INTERVAL)
+controller.handler("track_user_deadlines")(user_deadlines.track_entry)
+controller.handler("discard_user_deadlines")(user_deadlines.discard)
+controller.handler("invalidate_user_deadlines")(user_deadlines.invalidate)
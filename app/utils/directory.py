@@ -0,0 +1,316 @@
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from app.models.user import UserStatus
+from app.utils.controller import controller
+from app.utils.helpers import chunks
+from app.utils.metrics import metrics
+from config import JOB_REVIEW_USERS_REBUILD_INTERVAL
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+EPOCH = datetime(1970, 1, 1)
+STATUSES = list(UserStatus)
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+# name and array typecode of the columns, missing values are stored as 0
+COLUMNS = (
+    ("id", "q"),
+    ("status", "b"),
+    ("used_traffic", "q"),
+    ("data_limit", "q"),
+    ("expire", "q"),
+    ("admin_id", "q"),
+    ("online_at", "d"),
+    ("on_hold_timeout", "d"),
+    ("edit_at", "d"),
+    ("created_at", "d"),
+)
+ID, STATUS, USED_TRAFFIC, DATA_LIMIT, EXPIRE, ADMIN_ID, ONLINE_AT, ON_HOLD_TIMEOUT, EDIT_AT, CREATED_AT = range(len(COLUMNS))
+
+Row = Tuple[int, int, int, int, int, int, float, float, float, float]
+
+
+class DirectoryUser(NamedTuple):
+    """The fields of a user which decide when its status changes, like the rows of the database"""
+    id: int
+    status: UserStatus
+    expire: Optional[int]
+    data_limit: Optional[int]
+    used_traffic: int
+    on_hold_timeout: Optional[datetime]
+    online_at: Optional[datetime]
+    edit_at: Optional[datetime]
+    created_at: Optional[datetime]
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    return (value - EPOCH).total_seconds() if value else 0.0
+
+
+def _datetime(value: float) -> Optional[datetime]:
+    return EPOCH + timedelta(seconds=value) if value else None
+
+
+def _get_row(user) -> Row:
+    return (
+        user.id,
+        STATUS_CODES[user.status],
+        user.used_traffic or 0,
+        user.data_limit or 0,
+        user.expire or 0,
+        user.admin_id or 0,
+        _timestamp(user.online_at),
+        _timestamp(user.on_hold_timeout),
+        _timestamp(user.edit_at),
+        _timestamp(user.created_at),
+    )
+
+
+class UserDirectory:
+    """
+    Keeps the fields of every user which the jobs read on each tick in compact
+    typed arrays, one per column, so the jobs don't query the users table.
+
+    It's loaded from the database once and kept up to date by the user functions of crud
+    and by the recorded usage. Users changed by bulk statements are loaded again
+    on the next `sync`, and everything is reloaded every `reload_interval` seconds
+    to catch changes made outside of the API. Like the review job, it lives on the controller.
+    """
+
+    def __init__(self, reload_interval: int = 0):
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._columns: List[array] = [array(typecode) for _, typecode in COLUMNS]
+        self._index: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._stale: Set[int] = set()
+        self._loaded_at: Optional[float] = None
+        # changes made while users are fetched from the database, replayed on top of the fetched rows
+        self._replay: Optional[list] = None
+
+    def needs_reload(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return bool(self.reload_interval) and time.monotonic() - self._loaded_at >= self.reload_interval
+
+    def invalidate(self):
+        """Reloads every user on the next sync"""
+        if not controller.is_controller:
+            return controller.call("invalidate_user_directory")
+        self._loaded_at = None
+
+    def invalidate_ids(self, user_ids: Iterable[int]):
+        """Reloads the given users on the next sync"""
+        if not controller.is_controller:
+            return controller.call("invalidate_user_directory_ids", user_ids=list(user_ids))
+        with self._lock:
+            self._stale.update(user_ids)
+
+    def track(self, user):
+        """Updates a user, `user` may be a db user or a row having the same attributes"""
+        self.set_row(_get_row(user))
+
+    def set_row(self, row: Row):
+        if not controller.is_controller:
+            return controller.call("set_user_directory_row", row=row)
+        with self._lock:
+            self._set_row(row)
+            if self._replay is not None:
+                self._replay.append((self._set_row, (row,)))
+
+    def discard(self, user_id: int):
+        if not controller.is_controller:
+            return controller.call("discard_user_directory", user_id=user_id)
+        with self._lock:
+            self._discard(user_id)
+            if self._replay is not None:
+                self._replay.append((self._discard, (user_id,)))
+
+    def add_usage(self, usages: Dict[int, int], online_at: Dict[int, datetime]):
+        """Applies usage which was written to the database"""
+        with self._lock:
+            self._add_usage(usages, online_at)
+            if self._replay is not None:
+                self._replay.append((self._add_usage, (usages, online_at)))
+
+    def sync(self, db: "Session"):
+        """Loads the users from the database if they're due, or the stale ones"""
+        with self._load_lock:
+            if self.needs_reload():
+                self._load(db)
+            elif self._stale:
+                with self._lock:
+                    stale, self._stale = self._stale, set()
+                self._refresh(db, list(stale))
+
+    def admin_usage(self, usages: Dict[int, int]) -> Dict[int, int]:
+        """Sums the usage of users by their admin"""
+        admin_usage: Dict[int, int] = {}
+        with self._lock:
+            index, admin_ids = self._index, self._columns[ADMIN_ID]
+            for user_id, value in usages.items():
+                row = index.get(user_id)
+                if row is None:
+                    continue
+                admin_id = admin_ids[row]
+                if admin_id:
+                    admin_usage[admin_id] = admin_usage.get(admin_id, 0) + value
+        return admin_usage
+
+    def reviewable(self, user_ids: Optional[Iterable[int]] = None) -> List[DirectoryUser]:
+        """
+        Returns the active and on hold users, the datetimes are only set for on hold users
+        since deadlines of active users don't depend on them.
+        """
+        active, on_hold = STATUS_CODES[UserStatus.active], STATUS_CODES[UserStatus.on_hold]
+
+        users = []
+        with self._lock:
+            ids, statuses, used, limits, expires, online, holds, edits, creates = (
+                self._columns[i] for i in (ID, STATUS, USED_TRAFFIC, DATA_LIMIT, EXPIRE,
+                                           ONLINE_AT, ON_HOLD_TIMEOUT, EDIT_AT, CREATED_AT)
+            )
+            if user_ids is None:
+                rows = range(len(ids))
+            else:
+                rows = [row for row in map(self._index.get, user_ids) if row is not None]
+
+            for row in rows:
+                status = statuses[row]
+                if status == active:
+                    users.append(DirectoryUser(ids[row], UserStatus.active, expires[row] or None,
+                                               limits[row] or None, used[row], None, None, None, None))
+                elif status == on_hold:
+                    users.append(DirectoryUser(ids[row], UserStatus.on_hold, expires[row] or None,
+                                               limits[row] or None, used[row], _datetime(holds[row]),
+                                               _datetime(online[row]), _datetime(edits[row]),
+                                               _datetime(creates[row])))
+        return users
+
+    def near_limits(self, usage_percent: int, expire_before: int) -> List[int]:
+        """Returns the ids of the active users which used at least a percent of their data limit or expire soon"""
+        active = STATUS_CODES[UserStatus.active]
+        with self._lock:
+            ids, statuses, used, limits, expires = (
+                self._columns[i] for i in (ID, STATUS, USED_TRAFFIC, DATA_LIMIT, EXPIRE)
+            )
+            return [
+                ids[row] for row in range(len(ids))
+                if statuses[row] == active and (
+                    (limits[row] > 0 and used[row] * 100 >= limits[row] * usage_percent)
+                    or (0 < expires[row] <= expire_before)
+                )
+            ]
+
+    def memory_usage(self) -> int:
+        """Approximate size of the directory in bytes"""
+        with self._lock:
+            size = sum(column.buffer_info()[1] * column.itemsize for column in self._columns)
+            size += sys.getsizeof(self._index) + sum(sys.getsizeof(k) + sys.getsizeof(v)
+                                                     for k, v in self._index.items())
+        return size
+
+    def __len__(self):
+        return len(self._index)
+
+    def _load(self, db: "Session"):
+        from app.db import crud
+
+        started = time.perf_counter()
+        with self._lock:
+            self._replay = []
+            self._stale.clear()
+        try:
+            rows = [_get_row(user) for user in crud.get_user_directory_rows(db)]
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        columns = [array(typecode, values) for (_, typecode), values in zip(COLUMNS, zip(*rows))] \
+            if rows else [array(typecode) for _, typecode in COLUMNS]
+        index = {row[ID]: position for position, row in enumerate(rows)}
+
+        with self._lock:
+            self._columns, self._index, self._free = columns, index, []
+            replay, self._replay = self._replay, None
+            for func, args in replay:
+                func(*args)
+            self._loaded_at = time.monotonic()
+
+        metrics.update("directory", users=len(index), bytes=self.memory_usage(),
+                       loaded_in=round(time.perf_counter() - started, 4))
+
+    def _refresh(self, db: "Session", user_ids: List[int]):
+        from app.db import crud
+
+        with self._lock:
+            self._replay = []
+        try:
+            rows = {}
+            for chunk in chunks(user_ids):
+                rows.update((user.id, _get_row(user)) for user in crud.get_user_directory_rows(db, user_ids=chunk))
+        except Exception:
+            with self._lock:
+                self._replay = None
+                self._stale.update(user_ids)
+            raise
+
+        with self._lock:
+            for user_id in user_ids:
+                row = rows.get(user_id)
+                if row is None:
+                    self._discard(user_id)
+                else:
+                    self._set_row(row)
+            replay, self._replay = self._replay, None
+            for func, args in replay:
+                func(*args)
+
+    def _set_row(self, row: Row):
+        position = self._index.get(row[ID])
+        if position is None:
+            if self._free:
+                position = self._free.pop()
+            else:
+                position = len(self._columns[ID])
+                for column in self._columns:
+                    column.append(0)
+            self._index[row[ID]] = position
+
+        for column, value in zip(self._columns, row):
+            column[position] = value
+
+    def _discard(self, user_id: int):
+        position = self._index.pop(user_id, None)
+        if position is None:
+            return
+
+        # the slot is reused by the next new user, until then it's skipped as a user of no status
+        self._columns[ID][position] = 0
+        self._columns[STATUS][position] = -1
+        self._free.append(position)
+
+    def _add_usage(self, usages: Dict[int, int], online_at: Dict[int, datetime]):
+        index, used, online = self._index, self._columns[USED_TRAFFIC], self._columns[ONLINE_AT]
+        for user_id, value in usages.items():
+            position = index.get(user_id)
+            if position is None:
+                continue
+            used[position] += value
+            if user_id in online_at:
+                online[position] = _timestamp(online_at[user_id])
+
+
+user_directory = UserDirectory(JOB_REVIEW_USERS_REBUILD_INTERVAL)
+controller.handler("invalidate_user_directory")(user_directory.invalidate)
+controller.handler("invalidate_user_directory_ids")(user_directory.invalidate_ids)
+controller.handler("set_user_directory_row")(user_directory.set_row)
+controller.handler("discard_user_directory")(user_directory.discard)
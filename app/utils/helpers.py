@@ -1,7 +1,20 @@
 import json
 from datetime import datetime as dt
+from typing import Any, Optional
 from uuid import UUID
 
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
 
 def calculate_usage_percent(used_traffic: int, data_limit: int) -> float:
     return (used_traffic * 100) / data_limit
@@ -11,6 +24,11 @@ def calculate_expiration_days(expire: int) -> int:
     return (dt.fromtimestamp(expire) - dt.utcnow()).days
 
 
+def chunks(items: list, size: int = 500):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
 def yml_uuid_representer(dumper, data):
     return dumper.represent_scalar('tag:yaml.org,2002:str', str(data))
 
@@ -21,3 +39,43 @@ class UUIDEncoder(json.JSONEncoder):
             # if the obj is uuid, we simply return the value of uuid
             return str(obj)
         return super().default(self, obj)
+
+
+def _encode_default(obj):
+    if isinstance(obj, UUID):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def json_dumps(obj: Any, indent: Optional[int] = None) -> str:
+    """
+    Serializes `obj` to JSON, UUIDs included, with orjson or msgspec when they're installed.
+
+    Without `indent` the output has no whitespace at all, with `indent` it's laid out like
+    `json.dumps(obj, indent=indent)`. Non-ASCII characters are never escaped, like orjson and msgspec do,
+    so every backend gives the same output. orjson only indents by 2, msgspec by any positive indent,
+    other indents fall back to the standard library.
+    """
+    if orjson is not None and indent in (None, 2):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(obj, default=_encode_default, option=option).decode()
+        except TypeError:
+            pass  # e.g. integers out of 64 bits, which the standard library handles
+
+    elif msgspec is not None and (indent is None or indent > 0):
+        encoded = msgspec.json.encode(obj, enc_hook=_encode_default)
+        if indent:
+            encoded = msgspec.json.format(encoded, indent=indent)
+        return encoded.decode()
+
+    if indent is None:
+        return json.dumps(obj, cls=UUIDEncoder, separators=(",", ":"), ensure_ascii=False)
+    return json.dumps(obj, cls=UUIDEncoder, indent=indent, ensure_ascii=False)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response serialized by `json_dumps`, for endpoints returning large lists"""
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps(content).encode()
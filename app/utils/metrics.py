@@ -0,0 +1,38 @@
+import threading
+from collections import defaultdict
+from typing import Any, Dict
+
+from app.utils.controller import controller
+
+
+class Metrics:
+    """Process-wide counters and gauges, grouped by the component which reports them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = defaultdict(dict)
+
+    def update(self, group: str, **values):
+        with self._lock:
+            self._data[group].update(values)
+
+    def incr(self, group: str, name: str, amount: int = 1):
+        with self._lock:
+            self._data[group][name] = self._data[group].get(name, 0) + amount
+
+    def get(self, group: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._data.get(group, {}))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {group: dict(values) for group, values in self._data.items()}
+
+
+metrics = Metrics()
+
+
+@controller.delegate
+def get_metrics() -> Dict[str, Dict[str, Any]]:
+    """The metrics of the controller, which runs the jobs, whichever worker asks for them"""
+    return metrics.snapshot()
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from app.models.user import UserListItem
+from app.utils.controller import controller
+from app.utils.jwt import get_subscription_payload
+from app.utils.metrics import metrics
+from config import SUB_TOKEN_CACHE_SIZE, SUB_USER_CACHE_SIZE, SUB_USER_CACHE_TTL
+
+if TYPE_CHECKING:
+    from app.db.models import User
+
+
+class TokenCache:
+    """
+    LRU cache of verified subscription token payloads.
+
+    A payload only depends on the token and the secret key, so entries never go stale,
+    whether the user still accepts the token is checked on every request.
+    Invalid tokens aren't cached, so they can't evict the valid ones.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        if self.size <= 0:
+            return get_subscription_payload(token)
+
+        with self._lock:
+            payload = self._entries.get(token)
+            if payload is not None:
+                self._entries.move_to_end(token)
+
+        if payload is not None:
+            metrics.incr("sub_lookup", "token_hits")
+            return payload
+
+        metrics.incr("sub_lookup", "token_misses")
+        payload = get_subscription_payload(token)
+        if payload:
+            with self._lock:
+                self._entries[token] = payload
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return payload
+
+
+class SubscriptionUser:
+    """The part of a user which the subscription endpoints need, detached from the database session"""
+
+    __slots__ = ("id", "username", "created_at", "edit_at", "sub_revoked_at", "user")
+
+    def __init__(self, dbuser: "User"):
+        self.id: int = dbuser.id
+        self.username: str = dbuser.username
+        self.created_at: datetime = dbuser.created_at
+        self.edit_at: Optional[datetime] = dbuser.edit_at
+        self.sub_revoked_at: Optional[datetime] = dbuser.sub_revoked_at
+        # the links of UserResponse aren't needed to generate the subscription
+        self.user: UserListItem = UserListItem.model_validate(dbuser)
+
+
+class SubscriptionUserCache:
+    """
+    Short lived cache of subscription users by username.
+
+    The user functions of crud invalidate the users they change after committing, and a user
+    loaded while it was being changed isn't stored, so a revoked, deleted or recreated user
+    is never served from the cache. Usage and other changes made by bulk statements
+    show up once the entry expires. Invalidations are broadcast to every worker.
+    """
+
+    def __init__(self, size: int, ttl: int):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, SubscriptionUser]]" = OrderedDict()
+        self._ids: Dict[int, str] = {}
+        self._generation = 0
+
+    def lookup(self, username: str) -> Tuple[Optional[SubscriptionUser], int]:
+        """
+        Returns the cached user, if any, and the generation to pass to `store`
+        once the user is loaded from the database.
+        """
+        if self.size <= 0 or self.ttl <= 0:
+            return None, -1
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(username)
+                metrics.incr("sub_lookup", "user_hits")
+                return entry[1], self._generation
+            generation = self._generation
+
+        metrics.incr("sub_lookup", "user_misses")
+        return None, generation
+
+    def store(self, sub_user: SubscriptionUser, generation: int):
+        """Caches a loaded user, unless users were invalidated since `generation` was looked up"""
+        if self.size <= 0 or self.ttl <= 0:
+            return
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[sub_user.username] = (time.monotonic() + self.ttl, sub_user)
+                self._entries.move_to_end(sub_user.username)
+                self._ids[sub_user.id] = sub_user.username
+                while len(self._entries) > self.size:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self._ids.pop(evicted.id, None)
+            size = len(self._entries)
+        metrics.update("sub_lookup", user_entries=size)
+
+    def invalidate(self, username: str):
+        controller.broadcast("sub_users", usernames=[username])
+
+    def invalidate_ids(self, user_ids: Iterable[int]):
+        controller.broadcast("sub_users", user_ids=list(user_ids))
+
+    def clear(self):
+        controller.broadcast("sub_users")
+
+    def evict(self, usernames: List[str] = None, user_ids: List[int] = None):
+        """Drops the given users from this process, every user when none is given"""
+        with self._lock:
+            self._generation += 1
+            if usernames is None and user_ids is None:
+                self._entries.clear()
+                self._ids.clear()
+                return
+
+            for user_id in user_ids or ():
+                username = self._ids.pop(user_id, None)
+                if username is not None:
+                    self._entries.pop(username, None)
+            for username in usernames or ():
+                entry = self._entries.pop(username, None)
+                if entry:
+                    self._ids.pop(entry[1].id, None)
+
+
+token_payloads = TokenCache(SUB_TOKEN_CACHE_SIZE)
+sub_users = SubscriptionUserCache(SUB_USER_CACHE_SIZE, SUB_USER_CACHE_TTL)
+controller.listener("sub_users")(sub_users.evict)
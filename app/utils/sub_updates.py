@@ -0,0 +1,49 @@
+import threading
+from datetime import datetime
+from typing import Dict, Tuple
+
+from app.utils.metrics import metrics
+
+SubUpdate = Tuple[datetime, str]  # (sub_updated_at, sub_last_user_agent)
+
+
+class SubUpdateBuffer:
+    """
+    Keeps the latest subscription fetch of every user in memory, so fetching
+    a subscription doesn't write to the users table. The pending updates are
+    written in one batch by the flush job, only the last fetch of a user is kept.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[int, SubUpdate] = {}
+
+    def record(self, user_id: int, user_agent: str, updated_at: datetime = None):
+        update = (updated_at or datetime.utcnow(), user_agent)
+        with self._lock:
+            self._pending[user_id] = update
+            size = len(self._pending)
+        metrics.incr("sub_updates", "buffered")
+        metrics.update("sub_updates", pending=size)
+
+    def drain(self) -> Dict[int, SubUpdate]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        metrics.update("sub_updates", pending=0)
+        return pending
+
+    def restore(self, pending: Dict[int, SubUpdate]):
+        """Puts back updates which couldn't be written, unless the user fetched again meanwhile"""
+        with self._lock:
+            for user_id, update in pending.items():
+                current = self._pending.get(user_id)
+                if current is None or current[0] < update[0]:
+                    self._pending[user_id] = update
+            size = len(self._pending)
+        metrics.update("sub_updates", pending=size)
+
+    def __len__(self):
+        return len(self._pending)
+
+
+sub_updates = SubUpdateBuffer()
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import threading
 from collections import defaultdict
 from copy import deepcopy
 from pathlib import PosixPath
-from typing import Union
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
 
 import commentjson
 from sqlalchemy import func
@@ -14,9 +16,19 @@ from app.db import models as db_models
 from app.models.proxy import ProxyTypes
 from app.models.user import UserStatus
 from app.utils.crypto import get_cert_SANs
+from app.utils.helpers import json_dumps
 from config import DEBUG, XRAY_EXCLUDE_INBOUND_TAGS, XRAY_FALLBACKS_INBOUND_TAG
 
 
+def clients_digest(emails: Iterable[str]) -> Tuple[int, int]:
+    """An order independent digest of the clients of an inbound, their count and the sum of their emails' hashes"""
+    count = total = 0
+    for email in emails:
+        count += 1
+        total += hash(email)
+    return count, total & 0xFFFFFFFFFFFFFFFF
+
+
 def merge_dicts(a, b):  # B will override A dictionary key and values
     for key, value in b.items():
         if isinstance(value, dict) and key in a and isinstance(a[key], dict):
@@ -61,6 +73,21 @@ class XRayConfig(dict):
 
         self._apply_api()
 
+        # the config without the users, copies made by include_db_users keep it
+        self.base_hash = hashlib.sha256(self.to_json().encode()).hexdigest()
+
+        # the node group whose users a copy made by include_db_users has, None for every user
+        self.node_group_id = None
+
+        # inbound tag -> email -> client, built on the first include_db_users
+        self._clients = None
+        # node group id -> emails of its users, the users without a group are in no set
+        self._groups = None
+        # node group id, or None for every user -> inbound tag -> [count, sum of hashes] of the emails
+        # of the clients, kept along with the clients
+        self._digests = None
+        self._clients_lock = threading.RLock()
+
     def _apply_api(self):
         api_inbound = self.get_inbound("API_INBOUND")
         if api_inbound:
@@ -352,19 +379,92 @@ class XRayConfig(dict):
             if outbound['tag'] == tag:
                 return outbound
 
-    def to_json(self, **json_kwargs):
-        return json.dumps(self, **json_kwargs)
+    def to_json(self, indent: int = None):
+        return json_dumps(self, indent=indent)
+
+    def iter_json(self, chunk_size: int = 65536) -> Iterator[str]:
+        """
+        Yields the same JSON as `to_json()` in chunks of about `chunk_size` characters.
+        Clients are encoded a few at a time, so the whole config is never held as a single string.
+        """
+        clients_lists = []
+        inbounds = []
+        for inbound in self.get('inbounds', []):
+            clients = (inbound.get('settings') or {}).get('clients')
+            if clients:
+                inbound = {**inbound, 'settings': {**inbound['settings'], 'clients': f"\0clients:{len(clients_lists)}"}}
+                clients_lists.append(clients)
+            inbounds.append(inbound)
+
+        skeleton = json_dumps({**self, 'inbounds': inbounds} if 'inbounds' in self else self)
+        if not clients_lists:
+            yield skeleton
+            return
+
+        buffer = []
+        size = 0
+        for i, clients in enumerate(clients_lists):
+            head, skeleton = skeleton.split(json_dumps(f"\0clients:{i}"), 1)
+            buffer.append(head + '[')
+            # a few hundred clients are encoded at once, which is nearly as fast as encoding the whole list
+            for start in range(0, len(clients), 256):
+                encoded = json_dumps(clients[start:start + 256])[1:-1]
+                buffer.append(encoded if start == 0 else ',' + encoded)
+                size += len(encoded)
+                if size >= chunk_size:
+                    yield ''.join(buffer)
+                    buffer, size = [], 0
+            buffer.append(']')
+
+        buffer.append(skeleton)
+        yield ''.join(buffer)
 
     def copy(self):
         return deepcopy(self)
 
-    def include_db_users(self) -> XRayConfig:
-        config = self.copy()
+    def __deepcopy__(self, memo):
+        config = self.__class__.__new__(self.__class__)
+        memo[id(self)] = config
+        for key, value in self.__dict__.items():
+            if key in ('_clients', '_groups', '_digests', '_clients_lock'):
+                continue
+            setattr(config, key, deepcopy(value, memo))
+        config._clients = None
+        config._groups = None
+        config._digests = None
+        config._clients_lock = threading.RLock()
+        dict.update(config, deepcopy(dict(self), memo))
+        return config
+
+    def _get_client(self, inbound: dict, email: str, settings: dict) -> dict:
+        client = {
+            "email": email,
+            **settings
+        }
 
-        with GetDB() as db:
+        # XTLS currently only supports transmission methods of TCP and mKCP
+        if client.get('flow') and (
+                inbound.get('network', 'tcp') not in ('tcp', 'raw', 'kcp')
+                or
+                (
+                    inbound.get('network', 'tcp') in ('tcp', 'raw', 'kcp')
+                    and
+                    inbound.get('tls') not in ('tls', 'reality')
+                )
+                or
+                inbound.get('header_type') == 'http'
+        ):
+            del client['flow']
+
+        return client
+
+    def load_clients(self):
+        """Builds the clients of every inbound from the database"""
+        with self._clients_lock, GetDB() as db:
             query = db.query(
                 db_models.User.id,
                 db_models.User.username,
+                db_models.User.node_group_id,
                 func.lower(db_models.Proxy.type).label('type'),
                 db_models.Proxy.settings,
                 func.group_concat(db_models.excluded_inbounds_association.c.inbound_tag).label('excluded_inbound_tags')
@@ -379,13 +479,17 @@ class XRayConfig(dict):
                 func.lower(db_models.Proxy.type),
                 db_models.User.id,
                 db_models.User.username,
+                db_models.User.node_group_id,
                 db_models.Proxy.settings,
             )
             result = query.all()
 
             grouped_data = defaultdict(list)
+            groups = defaultdict(set)
 
             for row in result:
+                if row.node_group_id is not None:
+                    groups[row.node_group_id].add(f"{row.id}.{row.username}")
                 grouped_data[row.type].append((
                     row.id,
                     row.username,
@@ -393,6 +497,7 @@ class XRayConfig(dict):
                     [i for i in row.excluded_inbound_tags.split(',') if i] if row.excluded_inbound_tags else None
                 ))
 
+            clients = {tag: {} for tag in self.inbounds_by_tag}
             for proxy_type, rows in grouped_data.items():
 
                 inbounds = self.inbounds_by_protocol.get(proxy_type)
@@ -400,7 +505,7 @@ class XRayConfig(dict):
                     continue
 
                 for inbound in inbounds:
-                    clients = config.get_inbound(inbound['tag'])['settings']['clients']
+                    inbound_clients = clients[inbound['tag']]
 
                     for row in rows:
                         user_id, username, settings, excluded_inbound_tags = row
@@ -408,26 +513,136 @@ class XRayConfig(dict):
                         if excluded_inbound_tags and inbound['tag'] in excluded_inbound_tags:
                             continue
 
-                        client = {
-                            "email": f"{user_id}.{username}",
-                            **settings
-                        }
-
-                        # XTLS currently only supports transmission methods of TCP and mKCP
-                        if client.get('flow') and (
-                                inbound.get('network', 'tcp') not in ('tcp', 'raw', 'kcp')
-                                or
-                                (
-                                    inbound.get('network', 'tcp') in ('tcp', 'raw', 'kcp')
-                                    and
-                                    inbound.get('tls') not in ('tls', 'reality')
-                                )
-                                or
-                                inbound.get('header_type') == 'http'
-                        ):
-                            del client['flow']
-
-                        clients.append(client)
+                        email = f"{user_id}.{username}"
+                        inbound_clients[email] = self._get_client(inbound, email, settings)
+
+            self._clients = clients
+            self._groups = dict(groups)
+            self._digests = {None: {}}
+            for tag, inbound_clients in clients.items():
+                emails = [client['email'] for client in self._static_clients(tag) if client.get('email')]
+                self._digests[None][tag] = list(clients_digest(emails + list(inbound_clients)))
+                for group_id, group_emails in self._groups.items():
+                    self._digests.setdefault(group_id, {})[tag] = list(clients_digest(
+                        emails + [email for email in inbound_clients if email in group_emails]
+                    ))
+
+    def _static_clients(self, tag: str) -> list:
+        """The clients of an inbound in the config itself, which every core has along with the users"""
+        return self.get_inbound(tag)['settings'].get('clients') or []
+
+    def _update_digest(self, group_id: Optional[int], tag: str, email: str, sign: int):
+        if group_id not in self._digests:
+            self._digests[group_id] = {
+                tag: list(clients_digest(client['email'] for client in self._static_clients(tag)
+                                         if client.get('email')))
+                for tag in self._clients
+            }
+        digest = self._digests[group_id][tag]
+        digest[0] += sign
+        digest[1] = (digest[1] + sign * hash(email)) & 0xFFFFFFFFFFFFFFFF
+
+    def _get_group(self, email: str) -> Optional[int]:
+        return next((group_id for group_id, emails in self._groups.items() if email in emails), None)
+
+    def set_user_clients(self, email: str, inbound_settings: Dict[str, dict],
+                         node_group_id: Optional[int] = None) -> Optional[int]:
+        """
+        Replaces the clients of a user, `inbound_settings` maps the inbound tags
+        the user is in to the settings of its proxy, `node_group_id` is the node group of the user.
+        Returns the node group the user was in.
+        """
+        with self._clients_lock:
+            if self._clients is None:
+                return None
+
+            previous_group_id = self._get_group(email)
+            for tag, clients in self._clients.items():
+                settings = inbound_settings.get(tag)
+                existed = email in clients
+                if settings is None:
+                    clients.pop(email, None)
+                else:
+                    clients[email] = self._get_client(self.inbounds_by_tag[tag], email, settings)
+
+                present = settings is not None
+                if existed != present:
+                    self._update_digest(None, tag, email, 1 if present else -1)
+                if previous_group_id is not None and existed and \
+                        not (present and node_group_id == previous_group_id):
+                    self._update_digest(previous_group_id, tag, email, -1)
+                if node_group_id is not None and present and \
+                        not (existed and node_group_id == previous_group_id):
+                    self._update_digest(node_group_id, tag, email, 1)
+
+            if previous_group_id != node_group_id:
+                if previous_group_id is not None:
+                    self._groups[previous_group_id].discard(email)
+                if node_group_id is not None:
+                    self._groups.setdefault(node_group_id, set()).add(email)
+
+            return previous_group_id
+
+    def remove_user_clients(self, email: str) -> Optional[int]:
+        """Removes the clients of a user, returns the node group the user was in"""
+        return self.set_user_clients(email, {})
+
+    def get_group_size(self, node_group_id: int) -> int:
+        """How many active users the node group has, so how many users its nodes carry besides the static ones"""
+        with self._clients_lock:
+            if self._groups is None:
+                return 0
+            return len(self._groups.get(node_group_id, ()))
+
+    def get_clients_digest(self, tag: str, node_group_id: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """
+        The `clients_digest` of the clients a core should have on an inbound, the cores of a node group
+        have the users of the group only, None before they are loaded
+        """
+        with self._clients_lock:
+            if self._digests is None or tag not in self._clients:
+                return None
+            if node_group_id not in self._digests:
+                return clients_digest(client['email'] for client in self._static_clients(tag) if client.get('email'))
+            return tuple(self._digests[node_group_id][tag])
+
+    def get_inbound_clients(self, tag: str, node_group_id: Optional[int] = None) -> Dict[str, dict]:
+        """A copy of the clients a core should have on an inbound by email, see `get_clients_digest`"""
+        with self._clients_lock:
+            if self._clients is None:
+                return {}
+            clients = {client['email']: client for client in self._static_clients(tag) if client.get('email')}
+            inbound_clients = self._clients.get(tag, {})
+            if node_group_id is None:
+                clients.update(inbound_clients)
+            else:
+                clients.update((email, inbound_clients[email]) for email in self._groups.get(node_group_id, ())
+                               if email in inbound_clients)
+            return clients
+
+    def include_db_users(self, reload: bool = False, node_group_id: Optional[int] = None) -> XRayConfig:
+        """
+        Returns a copy of the config with the users as clients of the inbounds,
+        only the users of `node_group_id` if it's given, for the nodes of the group.
+
+        The clients are kept in memory and updated along with the users by xray.operations,
+        `reload` builds them again from the database after users are changed in bulk.
+        """
+        with self._clients_lock:
+            if reload or self._clients is None:
+                self.load_clients()
+
+            config = self.copy()
+            config.node_group_id = node_group_id
+            group_emails = None if node_group_id is None else self._groups.get(node_group_id, set())
+            for tag, clients in self._clients.items():
+                # client dicts are shared with the index, they are replaced and never modified
+                if group_emails is None:
+                    config.get_inbound(tag)['settings']['clients'].extend(clients.values())
+                else:
+                    config.get_inbound(tag)['settings']['clients'].extend(
+                        clients[email] for email in group_emails if email in clients
+                    )
 
         if DEBUG:
             with open('generated_config-debug.json', 'w') as f:
@@ -124,7 +124,8 @@ class XRayCore:
             stdout=subprocess.PIPE,
             universal_newlines=True
         )
-        self.process.stdin.write(config.to_json())
+        for chunk in config.iter_json():
+            self.process.stdin.write(chunk)
         self.process.stdin.flush()
         self.process.stdin.close()
         logger.warning(f"Xray core {self.version} started")
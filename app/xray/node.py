@@ -1,12 +1,15 @@
+import json
 import socket
 import re
 import ssl
 import tempfile
 import threading
 import time
+import zlib
 from collections import deque
 from contextlib import contextmanager
-from typing import List
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional
 
 import grpc
 import requests
@@ -15,10 +18,21 @@ from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.poolmanager import PoolManager
 from websocket import WebSocketConnectionClosedException, WebSocketTimeoutException, create_connection
 
+from app.models.node import NodeHealthState
 from app.xray.config import XRayConfig
+from config import JOB_NODE_HEARTBEAT_INTERVAL, NODE_BREAKER_MAX_BACKOFF, NODE_CONFIG_GZIP
 from xray_api import XRay as XRayAPI
 
 
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
 def string_to_temp_file(content: str):
     file = tempfile.NamedTemporaryFile(mode='w+t')
     file.write(content)
@@ -40,6 +54,92 @@ class NodeAPIError(Exception):
         self.detail = detail
 
 
+class NodeHealth:
+    """
+    Cached liveness of a node, so the hot paths don't make a request to know whether it's up.
+
+    It's refreshed by the heartbeat job and by the node's own connect, start and stop calls,
+    and used as is while it's fresh. Once a check fails the node counts as down without
+    any request until `retry_at`, a backoff which doubles on every failed check
+    up to NODE_BREAKER_MAX_BACKOFF, like a circuit breaker.
+    """
+
+    def __init__(self, max_age: float = JOB_NODE_HEARTBEAT_INTERVAL * 2, max_backoff: float = NODE_BREAKER_MAX_BACKOFF):
+        self.max_age = max_age
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.connected = False
+        self.started = False
+        self.version: Optional[str] = None
+        self.message: Optional[str] = None
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.checked_at: Optional[datetime] = None
+        self.changed_at: Optional[datetime] = None
+        self._checked: Optional[float] = None
+        self._retry_at = 0.0
+
+    @property
+    def state(self) -> NodeHealthState:
+        if self.checked_at is None:
+            return NodeHealthState.unknown
+        if not self.connected:
+            return NodeHealthState.unreachable
+        return NodeHealthState.healthy if self.started else NodeHealthState.stopped
+
+    @property
+    def fresh(self) -> bool:
+        return self._checked is not None and time.monotonic() - self._checked < self.max_age
+
+    @property
+    def may_check(self) -> bool:
+        """Whether the breaker lets a request through"""
+        return time.monotonic() >= self._retry_at
+
+    def update(self, connected: bool, started: bool, version: str = None, latency: float = None):
+        with self._lock:
+            self._set(connected, started)
+            if version:
+                self.version = version
+            if latency is not None:
+                self.latency = round(latency, 4)
+            self.message = None
+            self.failures = 0
+            self._retry_at = 0.0
+
+    def fail(self, message: str):
+        with self._lock:
+            self._set(False, False)
+            self.message = message
+            self.failures += 1
+            self._retry_at = time.monotonic() + min(self.max_backoff, 2 ** self.failures)
+
+    def to_dict(self) -> dict:
+        """JSON serializable state, the times are ISO formatted"""
+        retry_in = self._retry_at - time.monotonic()
+        retry_at = datetime.utcnow() + timedelta(seconds=retry_in) if retry_in > 0 else None
+        return {
+            "state": self.state.value,
+            "connected": self.connected,
+            "started": self.started,
+            "version": self.version,
+            "message": self.message,
+            "latency": self.latency,
+            "failures": self.failures,
+            "checked_at": self.checked_at and self.checked_at.isoformat(),
+            "changed_at": self.changed_at and self.changed_at.isoformat(),
+            "retry_at": retry_at and retry_at.isoformat(),
+        }
+
+    def _set(self, connected: bool, started: bool):
+        now = datetime.utcnow()
+        if self.checked_at is None or (connected, started) != (self.connected, self.started):
+            self.changed_at = now
+        self.connected, self.started = connected, started
+        self.checked_at = now
+        self._checked = time.monotonic()
+
+
 class ReSTXRayNode:
     def __init__(self,
                  address: str,
@@ -47,7 +147,8 @@ class ReSTXRayNode:
                  api_port: int,
                  ssl_key: str,
                  ssl_cert: str,
-                 usage_coefficient: float = 1):
+                 usage_coefficient: float = 1,
+                 node_group_id: Optional[int] = None):
 
         self.address = address
         self.port = port
@@ -55,6 +156,8 @@ class ReSTXRayNode:
         self.ssl_key = ssl_key
         self.ssl_cert = ssl_cert
         self.usage_coefficient = usage_coefficient
+        # the node carries only the users of its node group, every user if it's None
+        self.node_group_id = node_group_id
 
         self._keyfile = string_to_temp_file(ssl_key)
         self._certfile = string_to_temp_file(ssl_cert)
@@ -76,6 +179,9 @@ class ReSTXRayNode:
 
         self._api = None
         self._started = False
+        # base_hash of the config the core was started with, see XRayConfig
+        self.config_hash = None
+        self.health = NodeHealth()
 
     def _prepare_config(self, config: XRayConfig):
         for inbound in config.get("inbounds", []):
@@ -99,10 +205,30 @@ class ReSTXRayNode:
 
         return config
 
-    def make_request(self, path: str, timeout: int, **params):
+    def _config_body(self, config: XRayConfig) -> Iterator[bytes]:
+        # the config is sent as a JSON string inside the JSON body, escaped chunk by chunk
+        yield f'{{"session_id": {json.dumps(self._session_id)}, "config": "'.encode()
+        for chunk in config.iter_json():
+            yield json.dumps(chunk)[1:-1].encode()
+        yield b'"}'
+
+    def make_config_request(self, path: str, timeout: int, config: XRayConfig):
+        """Posts the config with a chunked body, so it's streamed instead of being built in memory"""
+        headers = {"Content-Type": "application/json"}
+        body = self._config_body(config)
+        if NODE_CONFIG_GZIP:
+            headers["Content-Encoding"] = "gzip"
+            body = gzip_chunks(body)
+
+        return self.make_request(path, timeout, data=body, headers=headers)
+
+    def make_request(self, path: str, timeout: int, data: Iterable[bytes] = None, headers: dict = None, **params):
         try:
-            res = self.session.post(self._rest_api_url + path, timeout=timeout,
-                                    json={"session_id": self._session_id, **params})
+            if data is None:
+                res = self.session.post(self._rest_api_url + path, timeout=timeout,
+                                        json={"session_id": self._session_id, **params})
+            else:
+                res = self.session.post(self._rest_api_url + path, timeout=timeout, data=data, headers=headers)
             data = res.json()
         except Exception as e:
             exc = NodeAPIError(0, str(e))
@@ -118,16 +244,32 @@ class ReSTXRayNode:
     def connected(self):
         if not self._session_id:
             return False
-        try:
-            self.make_request("/ping", timeout=3)
-            return True
-        except NodeAPIError:
-            return False
+        if not self.health.fresh and self.health.may_check:
+            self.check()
+        return self.health.connected
 
     @property
     def started(self):
-        res = self.make_request("/", timeout=3)
-        return res.get('started', False)
+        if not self.health.fresh and self.health.may_check:
+            self.check()
+        return self.health.started
+
+    def check(self) -> NodeHealth:
+        """Checks the node with requests and caches the result"""
+        if not self._session_id:
+            self.health.update(connected=False, started=False)
+            return self.health
+
+        start = time.perf_counter()
+        try:
+            self.make_request("/ping", timeout=3)
+            res = self.make_request("/", timeout=3)
+        except NodeAPIError as exc:
+            self.health.fail(exc.detail)
+        else:
+            self.health.update(connected=True, started=res.get('started', False),
+                               version=res.get('core_version'), latency=time.perf_counter() - start)
+        return self.health
 
     @property
     def api(self):
@@ -154,12 +296,19 @@ class ReSTXRayNode:
 
         res = self.make_request("/connect", timeout=3)
         self._session_id = res['session_id']
+        # the core may still be running from the previous session
+        self._started = bool(res.get('started', False))
+        self.health.update(connected=True, started=res.get('started', False), version=res.get('core_version'))
 
     def disconnect(self):
         self.make_request("/disconnect", timeout=3)
         self._session_id = None
+        self.config_hash = None
+        self.health.update(connected=False, started=False)
 
     def get_version(self):
+        if self.health.fresh and self.health.version:
+            return self.health.version
         res = self.make_request("/", timeout=3)
         return res.get('core_version')
 
@@ -168,10 +317,9 @@ class ReSTXRayNode:
             self.connect()
 
         config = self._prepare_config(config)
-        json_config = config.to_json()
 
         try:
-            res = self.make_request("/start", timeout=10, config=json_config)
+            res = self.make_config_request("/start", timeout=10, config=config)
         except NodeAPIError as exc:
             if exc.detail == 'Xray is started already':
                 return self.restart(config)
@@ -192,6 +340,8 @@ class ReSTXRayNode:
         except grpc.FutureTimeoutError:
             raise ConnectionError('Failed to connect to node\'s API')
 
+        self.config_hash = config.base_hash
+        self.health.update(connected=True, started=True, version=res.get('core_version'))
         return res
 
     def stop(self):
@@ -201,15 +351,16 @@ class ReSTXRayNode:
         self.make_request('/stop', timeout=5)
         self._api = None
         self._started = False
+        self.config_hash = None
+        self.health.update(connected=True, started=False)
 
     def restart(self, config: XRayConfig):
         if not self.connected:
             self.connect()
 
         config = self._prepare_config(config)
-        json_config = config.to_json()
 
-        res = self.make_request("/restart", timeout=10, config=json_config)
+        res = self.make_config_request("/restart", timeout=10, config=config)
 
         self._started = True
 
@@ -225,6 +376,8 @@ class ReSTXRayNode:
         except grpc.FutureTimeoutError:
             raise ConnectionError('Failed to connect to node\'s API')
 
+        self.config_hash = config.base_hash
+        self.health.update(connected=True, started=True, version=res.get('core_version'))
         return res
 
     def _bg_fetch_logs(self):
@@ -278,7 +431,8 @@ class RPyCXRayNode:
                  api_port: int,
                  ssl_key: str,
                  ssl_cert: str,
-                 usage_coefficient: float = 1):
+                 usage_coefficient: float = 1,
+                 node_group_id: Optional[int] = None):
 
         class Service(rpyc.Service):
             def __init__(self,
@@ -313,6 +467,8 @@ class RPyCXRayNode:
         self.ssl_key = ssl_key
         self.ssl_cert = ssl_cert
         self.usage_coefficient = usage_coefficient
+        # the node carries only the users of its node group, every user if it's None
+        self.node_group_id = node_group_id
 
         self.started = False
 
@@ -321,6 +477,9 @@ class RPyCXRayNode:
 
         self._service = Service()
         self._api = None
+        # base_hash of the config the core was started with, see XRayConfig
+        self.config_hash = None
+        self.health = NodeHealth()
 
     def disconnect(self):
         try:
@@ -328,6 +487,8 @@ class RPyCXRayNode:
             del self.connection
         except AttributeError:
             pass
+        self.config_hash = None
+        self.health.update(connected=False, started=False)
 
     def connect(self):
         self.disconnect()
@@ -353,14 +514,31 @@ class RPyCXRayNode:
                     continue
                 raise exc
 
+        self.health.update(connected=True, started=self.started)
+
     @property
     def connected(self):
+        if not self.health.fresh and self.health.may_check:
+            self.check()
+        return self.health.connected
+
+    def check(self) -> NodeHealth:
+        """Pings the node and caches the result"""
+        if not hasattr(self, "connection"):
+            self.health.update(connected=False, started=False)
+            return self.health
+
+        start = time.perf_counter()
         try:
             self.connection.ping()
-            return (not self.connection.closed)
-        except (AttributeError, EOFError, TimeoutError):
+            if self.connection.closed:
+                raise EOFError("Connection is closed")
+        except (EOFError, TimeoutError) as exc:
             self.disconnect()
-            return False
+            self.health.fail(str(exc) or type(exc).__name__)
+        else:
+            self.health.update(connected=True, started=self.started, latency=time.perf_counter() - start)
+        return self.health
 
     @property
     def remote(self):
@@ -408,6 +586,7 @@ class RPyCXRayNode:
         json_config = config.to_json()
         self.remote.start(json_config)
         self.started = True
+        self.config_hash = config.base_hash
 
         # connect to API
         self._api = XRayAPI(
@@ -439,6 +618,7 @@ class RPyCXRayNode:
     def stop(self):
         self.remote.stop()
         self.started = False
+        self.config_hash = None
         self._api = None
 
     def restart(self, config: XRayConfig):
@@ -447,6 +627,7 @@ class RPyCXRayNode:
         json_config = config.to_json()
         self.remote.restart(json_config)
         self.started = True
+        self.config_hash = config.base_hash
 
     @contextmanager
     def get_logs(self):
@@ -500,7 +681,8 @@ class XRayNode:
                 api_port: int,
                 ssl_key: str,
                 ssl_cert: str,
-                usage_coefficient: float = 1):
+                usage_coefficient: float = 1,
+                node_group_id: Optional[int] = None):
 
         # trying to detect what's the server of node
         try:
@@ -517,7 +699,8 @@ class XRayNode:
                 api_port=api_port,
                 ssl_key=ssl_key,
                 ssl_cert=ssl_cert,
-                usage_coefficient=usage_coefficient
+                usage_coefficient=usage_coefficient,
+                node_group_id=node_group_id
             )
         except Exception:
             # if might be rpyc
@@ -527,5 +710,6 @@ class XRayNode:
                 api_port=api_port,
                 ssl_key=ssl_key,
                 ssl_cert=ssl_cert,
-                usage_coefficient=usage_coefficient
+                usage_coefficient=usage_coefficient,
+                node_group_id=node_group_id
             )
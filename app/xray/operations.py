@@ -1,15 +1,20 @@
 from functools import lru_cache
-from typing import TYPE_CHECKING
+from threading import BoundedSemaphore
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Tuple
 
 from sqlalchemy.exc import SQLAlchemyError
 
 from app import logger, xray
 from app.db import GetDB, crud
 from app.models.node import NodeStatus
+from app.models.proxy import ProxyTypes
 from app.models.user import UserResponse
 from app.utils.concurrency import threaded_function
+from app.utils.controller import controller
+from app.xray.config import XRayConfig
 from app.xray.node import XRayNode
-from xray_api import XRay as XRayAPI
+from app.xray.sync import ADD, ALTER, REMOVE, apply_clients, user_sync
+from config import NODE_CONFIG_PUSH_CONCURRENCY, XRAY_JSON
 from xray_api.types.account import Account, XTLSFlows
 
 if TYPE_CHECKING:
@@ -28,124 +33,95 @@ def get_tls():
         }
 
 
-@threaded_function
-def _add_user_to_inbound(api: XRayAPI, inbound_tag: str, account: Account):
-    try:
-        api.add_inbound_user(tag=inbound_tag, user=account, timeout=30)
-    except (xray.exc.EmailExistsError, xray.exc.ConnectionError):
-        pass
+def _get_inbound_settings(dbuser: "DBUser") -> Dict[str, Tuple[ProxyTypes, dict]]:
+    user = UserResponse.model_validate(dbuser)
 
+    inbound_settings = {}
+    for proxy_type, inbound_tags in user.inbounds.items():
+        try:
+            proxy_settings = user.proxies[proxy_type].dict(no_obj=True)
+        except KeyError:
+            continue
 
-@threaded_function
-def _remove_user_from_inbound(api: XRayAPI, inbound_tag: str, email: str):
-    try:
-        api.remove_inbound_user(tag=inbound_tag, email=email, timeout=30)
-    except (xray.exc.EmailNotFoundError, xray.exc.ConnectionError):
-        pass
+        for inbound_tag in inbound_tags:
+            inbound_settings[inbound_tag] = (proxy_type, proxy_settings)
 
+    return inbound_settings
 
-@threaded_function
-def _alter_inbound_user(api: XRayAPI, inbound_tag: str, account: Account):
-    try:
-        api.remove_inbound_user(tag=inbound_tag, email=account.email, timeout=30)
-    except (xray.exc.EmailNotFoundError, xray.exc.ConnectionError):
-        pass
-    try:
-        api.add_inbound_user(tag=inbound_tag, user=account, timeout=30)
-    except (xray.exc.EmailExistsError, xray.exc.ConnectionError):
-        pass
 
+def _get_accounts(email: str, inbound_settings: Dict[str, Tuple[ProxyTypes, dict]]) -> Dict[str, Account]:
+    accounts = {}
+    for inbound_tag, (proxy_type, proxy_settings) in inbound_settings.items():
+        inbound = xray.config.inbounds_by_tag.get(inbound_tag, {})
+        account = ProxyTypes(proxy_type).account_model(email=email, **proxy_settings)
 
-def add_user(dbuser: "DBUser"):
-    user = UserResponse.model_validate(dbuser)
-    email = f"{dbuser.id}.{dbuser.username}"
+        # XTLS currently only supports transmission methods of TCP and mKCP
+        if getattr(account, 'flow', None) and (
+            inbound.get('network', 'tcp') not in ('tcp', 'kcp')
+            or
+            (
+                inbound.get('network', 'tcp') in ('tcp', 'kcp')
+                and
+                inbound.get('tls') not in ('tls', 'reality')
+            )
+            or
+            inbound.get('header_type') == 'http'
+        ):
+            account.flow = XTLSFlows.NONE
 
-    for proxy_type, inbound_tags in user.inbounds.items():
-        for inbound_tag in inbound_tags:
-            inbound = xray.config.inbounds_by_tag.get(inbound_tag, {})
+        accounts[inbound_tag] = account
 
-            try:
-                proxy_settings = user.proxies[proxy_type].dict(no_obj=True)
-            except KeyError:
-                pass
-            account = proxy_type.account_model(email=email, **proxy_settings)
-
-            # XTLS currently only supports transmission methods of TCP and mKCP
-            if getattr(account, 'flow', None) and (
-                inbound.get('network', 'tcp') not in ('tcp', 'kcp')
-                or
-                (
-                    inbound.get('network', 'tcp') in ('tcp', 'kcp')
-                    and
-                    inbound.get('tls') not in ('tls', 'reality')
-                )
-                or
-                inbound.get('header_type') == 'http'
-            ):
-                account.flow = XTLSFlows.NONE
-
-            _add_user_to_inbound(xray.api, inbound_tag, account)  # main core
-            for node in list(xray.nodes.values()):
-                if node.connected and node.started:
-                    _add_user_to_inbound(node.api, inbound_tag, account)
+    return accounts
 
 
-def remove_user(dbuser: "DBUser"):
-    email = f"{dbuser.id}.{dbuser.username}"
+def add_user(dbuser: "DBUser"):
+    _add_user(f"{dbuser.id}.{dbuser.username}", _get_inbound_settings(dbuser), dbuser.node_group_id)
+
 
-    for inbound_tag in xray.config.inbounds_by_tag:
-        _remove_user_from_inbound(xray.api, inbound_tag, email)
-        for node in list(xray.nodes.values()):
-            if node.connected and node.started:
-                _remove_user_from_inbound(node.api, inbound_tag, email)
+def remove_user(dbuser: "DBUser"):
+    _remove_user(f"{dbuser.id}.{dbuser.username}")
 
 
 def update_user(dbuser: "DBUser"):
-    user = UserResponse.model_validate(dbuser)
-    email = f"{dbuser.id}.{dbuser.username}"
+    _update_user(f"{dbuser.id}.{dbuser.username}", _get_inbound_settings(dbuser), dbuser.node_group_id)
 
-    active_inbounds = []
-    for proxy_type, inbound_tags in user.inbounds.items():
-        for inbound_tag in inbound_tags:
-            active_inbounds.append(inbound_tag)
-            inbound = xray.config.inbounds_by_tag.get(inbound_tag, {})
 
-            try:
-                proxy_settings = user.proxies[proxy_type].dict(no_obj=True)
-            except KeyError:
-                pass
-            account = proxy_type.account_model(email=email, **proxy_settings)
-
-            # XTLS currently only supports transmission methods of TCP and mKCP
-            if getattr(account, 'flow', None) and (
-                inbound.get('network', 'tcp') not in ('tcp', 'kcp')
-                or
-                (
-                    inbound.get('network', 'tcp') in ('tcp', 'kcp')
-                    and
-                    inbound.get('tls') not in ('tls', 'reality')
-                )
-                or
-                inbound.get('header_type') == 'http'
-            ):
-                account.flow = XTLSFlows.NONE
-
-            _alter_inbound_user(xray.api, inbound_tag, account)  # main core
-            for node in list(xray.nodes.values()):
-                if node.connected and node.started:
-                    _alter_inbound_user(node.api, inbound_tag, account)
-
-    for inbound_tag in xray.config.inbounds_by_tag:
-        if inbound_tag in active_inbounds:
-            continue
-        # remove disabled inbounds
-        _remove_user_from_inbound(xray.api, inbound_tag, email)
-        for node in list(xray.nodes.values()):
-            if node.connected and node.started:
-                _remove_user_from_inbound(node.api, inbound_tag, email)
+@controller.delegate
+def _add_user(email: str, inbound_settings: Dict[str, Tuple[ProxyTypes, dict]], node_group_id: Optional[int] = None):
+    accounts = _get_accounts(email, inbound_settings)
 
+    previous_group_id = xray.config.set_user_clients(
+        email, {tag: settings for tag, (_, settings) in inbound_settings.items()}, node_group_id
+    )
+    user_sync.put(email, [(inbound_tag, ADD, account) for inbound_tag, account in accounts.items()],
+                  node_group_id, previous_group_id)
 
+
+@controller.delegate
+def _remove_user(email: str):
+    node_group_id = xray.config.remove_user_clients(email)
+    user_sync.put(email, [(inbound_tag, REMOVE, None) for inbound_tag in xray.config.inbounds_by_tag],
+                  node_group_id)
+
+
+@controller.delegate
+def _update_user(email: str, inbound_settings: Dict[str, Tuple[ProxyTypes, dict]],
+                 node_group_id: Optional[int] = None):
+    accounts = _get_accounts(email, inbound_settings)
+
+    previous_group_id = xray.config.set_user_clients(
+        email, {tag: settings for tag, (_, settings) in inbound_settings.items()}, node_group_id
+    )
+    changes = [(inbound_tag, ALTER, account) for inbound_tag, account in accounts.items()]
+    # remove disabled inbounds
+    changes.extend((inbound_tag, REMOVE, None)
+                   for inbound_tag in xray.config.inbounds_by_tag if inbound_tag not in accounts)
+    user_sync.put(email, changes, node_group_id, previous_group_id)
+
+
+@controller.delegate
 def remove_node(node_id: int):
+    user_sync.remove(node_id)
     if node_id in xray.nodes:
         try:
             xray.nodes[node_id].disconnect()
@@ -167,11 +143,19 @@ def add_node(dbnode: "DBNode"):
                                      api_port=dbnode.api_port,
                                      ssl_key=tls['key'],
                                      ssl_cert=tls['certificate'],
-                                     usage_coefficient=dbnode.usage_coefficient)
+                                     usage_coefficient=dbnode.usage_coefficient,
+                                     node_group_id=dbnode.node_group_id)
 
     return xray.nodes[dbnode.id]
 
 
+def _get_node_config(node: XRayNode, config: Optional[XRayConfig]) -> XRayConfig:
+    """`config` if it has the users the node carries, otherwise a config with the users of the node's group"""
+    if config is None or config.node_group_id != node.node_group_id:
+        return xray.config.include_db_users(node_group_id=node.node_group_id)
+    return config
+
+
 def _change_node_status(node_id: int, status: NodeStatus, message: str = None, version: str = None):
     with GetDB() as db:
         try:
@@ -188,12 +172,45 @@ def _change_node_status(node_id: int, status: NodeStatus, message: str = None, v
             db.rollback()
 
 
+def _push_config(node: XRayNode, config: XRayConfig, name: str, restart: bool = False, force: bool = False) -> bool:
+    """
+    Brings the core of a node up to `config`.
+
+    A core already running a config with the same base only gets its users changed over the API,
+    so the clients of the others stay connected. Otherwise, or if that fails like on cores
+    older than Xray v25, the core is (re)started with the whole config.
+    `force` always (re)starts the core, for an admin recovering a core which is stuck.
+    Returns whether only the users were changed.
+    """
+    if not force and node.config_hash is not None and node.config_hash == config.base_hash:
+        try:
+            if not node.connected:
+                node.connect()
+            if node.started:
+                added, removed = apply_clients(node.api, config)
+                logger.info(f"Users of \"{name}\" node synced, {added} added and {removed} removed")
+                return True
+        except Exception as e:
+            logger.warning(f"Unable to sync users of \"{name}\" node, restarting its core: {e}")
+
+    if restart:
+        node.restart(config)
+    else:
+        node.start(config)
+    return False
+
+
 global _connecting_nodes
 _connecting_nodes = {}
 
+# a config push makes the node restart its core with every user, a few at a time
+# keeps a reconnecting fleet from saturating the panel's uplink and the database
+_config_pushes = BoundedSemaphore(NODE_CONFIG_PUSH_CONCURRENCY)
+
 
 @threaded_function
-def connect_node(node_id, config=None):
+@controller.delegate
+def connect_node(node_id, config=None, force: bool = False):
     global _connecting_nodes
 
     if _connecting_nodes.get(node_id):
@@ -209,7 +226,10 @@ def connect_node(node_id, config=None):
         node = xray.nodes[dbnode.id]
         assert node.connected
     except (KeyError, AssertionError):
+        config_hash = getattr(xray.nodes.get(dbnode.id), "config_hash", None)
         node = xray.operations.add_node(dbnode)
+        # the core may have kept running while the node was unreachable
+        node.config_hash = config_hash
 
     try:
         _connecting_nodes[node_id] = True
@@ -217,10 +237,10 @@ def connect_node(node_id, config=None):
         _change_node_status(node_id, NodeStatus.connecting)
         logger.info(f"Connecting to \"{dbnode.name}\" node")
 
-        if config is None:
-            config = xray.config.include_db_users()
+        config = _get_node_config(node, config)
 
-        node.start(config)
+        with _config_pushes:
+            _push_config(node, config, dbnode.name, force=force)
         version = node.get_version()
         _change_node_status(node_id, NodeStatus.connected, version=version)
         logger.info(f"Connected to \"{dbnode.name}\" node, xray run on v{version}")
@@ -237,7 +257,10 @@ def connect_node(node_id, config=None):
 
 
 @threaded_function
-def restart_node(node_id, config=None):
+@controller.delegate
+def restart_node(node_id, config=None, force: bool = False):
+    global _connecting_nodes
+
     with GetDB() as db:
         dbnode = crud.get_node_by_id(db, node_id)
 
@@ -250,16 +273,20 @@ def restart_node(node_id, config=None):
         node = xray.operations.add_node(dbnode)
 
     if not node.connected:
-        return connect_node(node_id, config)
+        return connect_node(node_id, config, force)
 
+    # marked as busy so that the health check leaves it be, a restart with a newer config still goes ahead
+    marked = not _connecting_nodes.get(node_id)
     try:
+        _connecting_nodes[node_id] = True
         logger.info(f"Restarting Xray core of \"{dbnode.name}\" node")
 
-        if config is None:
-            config = xray.config.include_db_users()
+        config = _get_node_config(node, config)
 
-        node.restart(config)
-        logger.info(f"Xray core of \"{dbnode.name}\" node restarted")
+        with _config_pushes:
+            synced = _push_config(node, config, dbnode.name, restart=True, force=force)
+        if not synced:
+            logger.info(f"Xray core of \"{dbnode.name}\" node restarted")
     except Exception as e:
         _change_node_status(node_id, NodeStatus.error, message=str(e))
         logger.info(f"Unable to restart node {node_id}")
@@ -267,13 +294,119 @@ def restart_node(node_id, config=None):
             node.disconnect()
         except Exception:
             pass
+    finally:
+        if marked:
+            _connecting_nodes.pop(node_id, None)
+
+
+@controller.delegate
+def restart_core(reload: bool = True, force: bool = True):
+    """
+    Restarts the core and the connected nodes, `reload` loads the users from the database again.
+    Without `force` the nodes running the same config only get their users synced, after users changed in bulk.
+    """
+    startup_config = xray.config.include_db_users(reload=reload)
+    xray.core.restart(startup_config)
+
+    for node_id, node in list(xray.nodes.items()):
+        if node.connected:
+            restart_node(node_id, startup_config, force)
+
+
+@controller.delegate
+def sync_nodes_users():
+    """Loads the users from the database again and brings the connected nodes up to them, after groups changed"""
+    config = xray.config.include_db_users(reload=True)
+    for node_id, node in list(xray.nodes.items()):
+        if node.connected:
+            restart_node(node_id, config)
+
+
+def update_config(payload: dict):
+    """Replaces the config in every process and restarts the core and the nodes with it"""
+    controller.broadcast("config", payload=payload)
+    restart_core(reload=False)
+
+
+def update_hosts():
+    """Loads the hosts from the database again in every process"""
+    controller.broadcast("hosts")
+
+
+@controller.listener("config")
+def _load_config(payload: dict = None):
+    xray.config = XRayConfig(XRAY_JSON if payload is None else payload, api_port=xray.config.api_port)
+
+
+@controller.listener("hosts")
+def _load_hosts():
+    xray.hosts.update()
+
+
+@controller.delegate
+def get_core_status() -> dict:
+    return {"version": xray.core.version, "started": xray.core.started}
+
+
+@controller.delegate
+def get_node_connected(node_id: int) -> Optional[bool]:
+    """Returns whether the node is connected, None if the node isn't added to xray"""
+    node = xray.nodes.get(node_id)
+    return None if node is None else node.connected
+
+
+def is_node_busy(node_id: int) -> bool:
+    """Whether the node is being connected or restarted by this process"""
+    return bool(_connecting_nodes.get(node_id))
+
+
+@controller.delegate
+def get_nodes_health() -> List[dict]:
+    """Returns the cached health of the nodes added to xray"""
+    return [{"node_id": node_id, **node.health.to_dict()} for node_id, node in list(xray.nodes.items())]
+
+
+@controller.delegate
+def get_sync_stats() -> Dict[str, dict]:
+    return user_sync.stats()
+
+
+def stream_logs(node_id: int = None) -> AsyncIterator[List[str]]:
+    """Yields the new logs of the core, or of a node, an empty list when there are none"""
+    return controller.stream("logs", node_id=node_id)
+
+
+@controller.streamer("logs")
+def _stream_logs(node_id: int = None):
+    source = xray.core if node_id is None else xray.nodes.get(node_id)
+    if source is None:
+        return
+
+    with source.get_logs() as logs:
+        # a node's stream ends once it's removed or replaced
+        while node_id is None or xray.nodes.get(node_id) is source:
+            lines = []
+            while logs:
+                lines.append(logs.popleft())
+            yield lines
 
 
 __all__ = [
     "add_user",
     "remove_user",
+    "update_user",
     "add_node",
     "remove_node",
     "connect_node",
     "restart_node",
+    "restart_core",
+    "sync_nodes_users",
+    "update_config",
+    "update_hosts",
+    "get_core_status",
+    "get_node_connected",
+    "get_nodes_health",
+    "is_node_busy",
+    "get_sync_stats",
+    "stream_logs",
 ]
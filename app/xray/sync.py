@@ -0,0 +1,281 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple
+
+from google.protobuf import descriptor_pool, message_factory
+
+from app import logger, xray
+from app.models.proxy import ProxyTypes
+from app.utils.metrics import metrics
+from config import (XRAY_SYNC_BATCH_SIZE, XRAY_SYNC_MAX_PENDING, XRAY_SYNC_PUT_TIMEOUT, XRAY_SYNC_RETRIES,
+                    XRAY_SYNC_WORKERS)
+from xray_api import XRay as XRayAPI
+from xray_api import exceptions as exc
+from xray_api.types.account import Account
+from xray_api.types.message import TypedMessage
+
+if TYPE_CHECKING:
+    from app.xray.config import XRayConfig
+
+ADD = "add"
+ALTER = "alter"  # remove then add, so changed settings are applied
+REMOVE = "remove"
+
+Change = Tuple[str, str, Optional[Account]]  # (inbound tag, action, account)
+
+
+class UserOperation:
+    """Pending changes of a user on a single core, coalesced per inbound"""
+
+    def __init__(self, email: str):
+        self.email = email
+        self.queued_at = time.monotonic()
+        self.inbounds: Dict[str, Tuple[str, Optional[Account]]] = {}
+
+    def merge(self, inbound_tag: str, action: str, account: Optional[Account] = None):
+        previous = self.inbounds.get(inbound_tag)
+        if action == ADD and previous and previous[0] != ADD:
+            # the user may still exist on the core with its old settings
+            action = ALTER
+        self.inbounds[inbound_tag] = (action, account)
+
+
+class UserSyncQueue:
+    """
+    Pending user operations of a core, sent in batches by one worker at a time
+    so the operations of a user are applied in order.
+    """
+
+    def __init__(self, name: str, get_api: Callable[[], Optional[XRayAPI]], executor: ThreadPoolExecutor):
+        self.name = name
+        self._get_api = get_api
+        self._executor = executor
+        self._cond = threading.Condition()
+        self._pending: Dict[str, UserOperation] = {}
+        self._running = False
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def put(self, email: str, changes: Iterable[Change]):
+        with self._cond:
+            if email not in self._pending:
+                if not self._cond.wait_for(lambda: len(self._pending) < XRAY_SYNC_MAX_PENDING,
+                                           timeout=XRAY_SYNC_PUT_TIMEOUT):
+                    self._drop(1)
+                    logger.warning(f"User sync queue of {self.name} is full, dropped the operations of "
+                                   f"user \"{email}\", it's left to be reconciled")
+                    return
+                self._pending[email] = UserOperation(email)
+
+            operation = self._pending[email]
+            for inbound_tag, action, account in changes:
+                operation.merge(inbound_tag, action, account)
+
+            if self._running:
+                return
+            self._running = True
+
+        self._executor.submit(self._run)
+
+    def clear(self):
+        with self._cond:
+            self._drop(len(self._pending))
+            self._pending.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            oldest = next(iter(self._pending.values()), None)
+            return {
+                "depth": len(self._pending),
+                "lag": round(time.monotonic() - oldest.queued_at, 3) if oldest else 0.0,
+                "sent": self.sent,
+                "failed": self.failed,
+                "dropped": self.dropped,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._running = False
+                    return
+                emails = list(islice(self._pending, XRAY_SYNC_BATCH_SIZE))
+                batch = [self._pending.pop(email) for email in emails]
+                self._cond.notify_all()
+
+            try:
+                self._send(batch)
+            except Exception as err:
+                self.failed += len(batch)
+                logger.exception(f"Unable to sync users with {self.name}: {err}")
+
+    def _send(self, batch: List[UserOperation]):
+        try:
+            api = self._get_api()
+        except ConnectionError:
+            api = None
+        if api is None:
+            # the core gets every user again when it's (re)started
+            self._drop(len(batch))
+            logger.warning(f"{self.name} is not connected, dropped {len(batch)} pending user operations")
+            return
+
+        for i, operation in enumerate(batch):
+            for inbound_tag, (action, account) in operation.inbounds.items():
+                if not self._apply(api, inbound_tag, action, operation.email, account):
+                    self._drop(len(batch) - i)
+                    logger.warning(f"Lost connection to {self.name}, "
+                                   f"dropped {len(batch) - i} pending user operations")
+                    return
+            self.sent += 1
+
+    def _drop(self, count: int):
+        self.dropped += count
+        metrics.incr("user_sync", "dropped", count)
+
+    def _apply(self, api: XRayAPI, inbound_tag: str, action: str, email: str, account: Optional[Account]) -> bool:
+        for attempt in range(XRAY_SYNC_RETRIES + 1):
+            try:
+                if action in (REMOVE, ALTER):
+                    try:
+                        api.remove_inbound_user(tag=inbound_tag, email=email, timeout=30)
+                    except exc.EmailNotFoundError:
+                        pass
+                if action in (ADD, ALTER):
+                    try:
+                        api.add_inbound_user(tag=inbound_tag, user=account, timeout=30)
+                    except exc.EmailExistsError:
+                        pass
+                return True
+
+            except (exc.ConnectionError, exc.TimeoutError):
+                if attempt < XRAY_SYNC_RETRIES:
+                    time.sleep(0.5 * 2 ** attempt)
+
+            except exc.XrayError as err:
+                self.failed += 1
+                logger.error(f"Unable to {action} user \"{email}\" on {self.name} inbound {inbound_tag}: {err.details}")
+                return True
+
+        return False
+
+
+class UserSync:
+    """Per core queues of user operations, served by a bounded pool of threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues: Dict[Optional[int], UserSyncQueue] = {}
+        self._executor = ThreadPoolExecutor(max_workers=XRAY_SYNC_WORKERS, thread_name_prefix="xray-sync")
+
+    def queue(self, node_id: Optional[int] = None) -> UserSyncQueue:
+        """Returns the queue of a node, or the main core's queue if `node_id` is None"""
+        with self._lock:
+            if node_id not in self._queues:
+                name = "main core" if node_id is None else f"node {node_id}"
+                self._queues[node_id] = UserSyncQueue(name, lambda: _get_api(node_id), self._executor)
+            return self._queues[node_id]
+
+    def put(self, email: str, changes: List[Change],
+            node_group_id: Optional[int] = None, previous_group_id: Optional[int] = None):
+        """
+        Queues the changes of a user for the main core and the nodes which carry the user,
+        the nodes without a group and the nodes of `node_group_id`.
+        The nodes of `previous_group_id` get the user removed, after it's moved to another group.
+        """
+        self.queue(None).put(email, changes)
+        removals = None
+        for node_id, node in list(xray.nodes.items()):
+            group_id = node.node_group_id
+            if group_id is None or group_id == node_group_id:
+                self.queue(node_id).put(email, changes)
+            elif group_id == previous_group_id:
+                if removals is None:
+                    removals = [(inbound_tag, REMOVE, None) for inbound_tag in xray.config.inbounds_by_tag]
+                self.queue(node_id).put(email, removals)
+
+    def remove(self, node_id: int):
+        with self._lock:
+            queue = self._queues.pop(node_id, None)
+        if queue:
+            queue.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            queues = list(self._queues.items())
+        return {"master" if node_id is None else str(node_id): queue.stats() for node_id, queue in queues}
+
+
+@lru_cache(maxsize=None)
+def _message_class(type_name: str):
+    return message_factory.GetMessageClass(descriptor_pool.Default().FindMessageTypeByName(type_name))
+
+
+def _same_account(expected: TypedMessage, actual: TypedMessage) -> bool:
+    """Whether the account a core has sets the fields of the expected one, cores fill in defaults of their own"""
+    if expected.type != actual.type:
+        return False
+    if expected.value == actual.value:
+        return True
+    message_class = _message_class(expected.type)
+    actual_message = message_class.FromString(actual.value)
+    return all(getattr(actual_message, field.name) == value
+               for field, value in message_class.FromString(expected.value).ListFields())
+
+
+def apply_clients(api: XRayAPI, config: "XRayConfig", timeout: float = 30) -> Tuple[int, int]:
+    """
+    Changes the users of a running core to the clients of `config` over the API.
+    The users of each inbound are fetched from the core, and only the missing, changed and extra ones
+    are added or removed, so the clients of the others stay connected.
+    Returns how many users were added and removed.
+    """
+    added = removed = 0
+    for tag, inbound in config.inbounds_by_tag.items():
+        proxy_type = ProxyTypes(inbound['protocol'])
+        clients = {client['email']: client for client in config.get_inbound(tag)['settings'].get('clients') or []}
+        users = {user.email: user.account for user in api.get_inbound_users(tag, timeout=timeout)}
+
+        for email in users.keys() - clients.keys():
+            try:
+                api.remove_inbound_user(tag=tag, email=email, timeout=timeout)
+            except exc.EmailNotFoundError:
+                pass
+            removed += 1
+
+        for email, client in clients.items():
+            account = proxy_type.account_model(**client)
+            current = users.get(email)
+            if current is not None:
+                if _same_account(account.message, current):
+                    continue
+                try:
+                    api.remove_inbound_user(tag=tag, email=email, timeout=timeout)
+                except exc.EmailNotFoundError:
+                    pass
+                removed += 1
+            try:
+                api.add_inbound_user(tag=tag, user=account, timeout=timeout)
+            except exc.EmailExistsError:
+                pass
+            added += 1
+
+    return added, removed
+
+
+def _get_api(node_id: Optional[int]) -> Optional[XRayAPI]:
+    if node_id is None:
+        return xray.api
+
+    node = xray.nodes.get(node_id)
+    if node is None or not (node.connected and node.started):
+        return None
+    return node.api
+
+
+user_sync = UserSync()
@@ -0,0 +1,65 @@
+"""
+Time per clash and clash-meta subscription, built directly and through the YAML round trip it replaced,
+with few and many hosts per inbound and with ASCII and emoji remarks. Both give the same output.
+"""
+import argparse
+
+import yaml
+
+from benchmarks.common import best, get_bench_user, set_bench_hosts
+
+
+def round_trip(cls):
+    """`cls` rendering the subscription template to YAML text, then loading and dumping it again"""
+
+    class RoundTrip(cls):
+        def render(self, reverse=False):
+            from app.subscription.clash import CLASH_SUBSCRIPTION_TEMPLATE
+            from app.templates import render_template
+
+            if reverse:
+                self.data['proxies'].reverse()
+
+            return yaml.dump(
+                yaml.load(
+                    render_template(
+                        CLASH_SUBSCRIPTION_TEMPLATE,
+                        {"conf": self.data, "proxy_remarks": self.proxy_remarks}
+                    ),
+                    Loader=yaml.SafeLoader
+                ),
+                sort_keys=False,
+                allow_unicode=True,
+            )
+
+    return RoundTrip
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hosts", type=int, nargs="+", default=[1, 50], help="hosts per inbound")
+    parser.add_argument("--user", help="username, the first user with proxies by default")
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    from app.subscription.clash import ClashConfiguration, ClashMetaConfiguration
+    from app.subscription.share import process_inbounds_and_tags, setup_format_variables
+
+    for hosts in args.hosts:
+        for emoji in (False, True):
+            set_bench_hosts(hosts, emoji=emoji)
+            user = get_bench_user(args.user)
+            format_variables = setup_format_variables(user.__dict__)
+            for config_format, cls in (("clash", ClashConfiguration), ("clash-meta", ClashMetaConfiguration)):
+                def generate(cls=cls):
+                    return process_inbounds_and_tags(user.inbounds, user.proxies, format_variables, conf=cls())
+
+                assert generate() == generate(round_trip(cls))
+                before = best(lambda: generate(round_trip(cls)), number=args.number)
+                after = best(generate, number=args.number)
+                print(f"{config_format:10s} {hosts:3d} hosts, {'emoji' if emoji else 'ascii'} remarks "
+                      f"{before * 1000:9.2f} ms -> {after * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import gc
+import importlib.util
+import os
+import time
+import tracemalloc
+from typing import Callable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+JOBS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "jobs")
+
+
+def best(func: Callable[[], object], number: int = 1, repeat: int = 5) -> float:
+    """The best time of `repeat` runs of `number` calls, in seconds per call"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - started) / number)
+    return min(times)
+
+
+def measure(label: str, func: Callable[[], T]) -> T:
+    """Runs `func` once and prints its time and the peak memory traced meanwhile"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func()
+    finally:
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{label:36s} {elapsed * 1000:10.1f} ms  peak {peak / 2 ** 20:8.1f} MiB")
+    return result
+
+
+def load_job(name: str):
+    """
+    Loads a module of app/jobs by its file name, the way app.jobs does,
+    so its functions can be called without waiting for the scheduler
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(JOBS_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def set_bench_hosts(count: int, emoji: bool = False) -> Tuple[int, int]:
+    """
+    Replaces the hosts of every inbound with `count` hosts in memory, each with its own address and port,
+    a remark using format variables, and a SNI or a path on some of them.
+    Returns how many inbounds and hosts there are.
+    """
+    from app import xray
+
+    xray.hosts.update()
+    for tag in list(xray.config.inbounds_by_tag):
+        base = dict(xray.hosts[tag][0]) if xray.hosts.get(tag) else None
+        if base is None:
+            continue
+        hosts = []
+        for i in range(count):
+            host = dict(base)
+            host.update(
+                remark=("🚀 " if emoji else "") + f"{tag} {i} {{USERNAME}} [{{PROTOCOL}} - {{TRANSPORT}}] {{DATA_LEFT}}",
+                address=[f"h{i}.example.com"],
+                port=1000 + i,
+                sni=[f"s{i}.example.com"] if i % 2 else [],
+                host=[],
+                path=None if i % 3 else "/p{USERNAME}",
+            )
+            hosts.append(host)
+        dict.__setitem__(xray.hosts, tag, hosts)
+    xray.hosts.version += 1
+    return len(xray.hosts), sum(len(hosts) for hosts in xray.hosts.values())
+
+
+def get_bench_user(username: str = None):
+    """The UserResponse of `username`, or of the first user having proxies"""
+    from app.db import GetDB, crud
+    from app.db.models import Proxy
+    from app.models.user import UserResponse
+
+    with GetDB() as db:
+        if username:
+            dbuser = crud.get_user(db, username)
+        else:
+            dbuser = crud.get_user_by_id(db, db.query(Proxy.user_id).order_by(Proxy.user_id).limit(1).scalar())
+        if dbuser is None:
+            raise SystemExit("no user to benchmark, seed the database with `python -m benchmarks.seed`")
+        return UserResponse.model_validate(dbuser)
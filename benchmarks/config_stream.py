@@ -0,0 +1,52 @@
+"""
+Time and peak memory of encoding the xray config with its users for the core and for a REST node,
+as a whole string, the way it was sent before, and streamed in chunks, with and without gzip.
+Times are taken without tracemalloc, which slows the encoding down.
+"""
+import argparse
+import json
+import zlib
+
+from benchmarks.common import best, measure
+
+
+def consume(chunks):
+    for _ in chunks:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from app import xray
+    from app.xray.node import ReSTXRayNode, gzip_chunks
+
+    config = xray.config.include_db_users()
+    node = ReSTXRayNode.__new__(ReSTXRayNode)
+    node._session_id = "benchmark"
+
+    body = b"".join(node._config_body(config))
+    gzipped = b"".join(gzip_chunks(node._config_body(config)))
+    assert "".join(config.iter_json()) == config.to_json()
+    assert json.loads(json.loads(body)["config"]) == json.loads(config.to_json())
+    assert zlib.decompress(gzipped, wbits=31) == body
+    print(f"node body {len(body) / 2 ** 20:.1f} MiB, gzipped {len(gzipped) / 2 ** 20:.1f} MiB")
+
+    cases = {
+        "core: to_json": lambda: config.to_json(),
+        "core: iter_json": lambda: consume(config.iter_json()),
+        "node: double encoded body": lambda: json.dumps({"session_id": "benchmark",
+                                                         "config": config.to_json()}).encode(),
+        "node: streamed body": lambda: consume(node._config_body(config)),
+        "node: streamed gzip body": lambda: consume(gzip_chunks(node._config_body(config))),
+    }
+    for label, func in cases.items():
+        measure(label, func)
+    for label, func in cases.items():
+        print(f"{label:36s} {best(func, repeat=args.repeat) * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
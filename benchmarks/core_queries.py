@@ -0,0 +1,62 @@
+"""
+Time of a usage sweep querying the user stats of many cores, run by `python -m benchmarks.fake_cores`,
+concurrently over grpc.aio on the jobs loop, against a thread pool opened per sweep and a stub
+made per query, as they were before, kept inline.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+
+from benchmarks.common import load_job
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cores", type=int, default=50)
+    parser.add_argument("--sweeps", type=int, default=10)
+    parser.add_argument("--port", type=int, default=21000)
+    args = parser.parse_args()
+
+    from app.utils.concurrency import jobs_loop
+    from app.utils.usage import parse_user_stats
+    from xray_api import XRay
+    from xray_api.exceptions import RelatedError
+    from xray_api.proto.app.stats.command import command_pb2, command_pb2_grpc
+
+    record_usages = load_job("record_usages")
+    apis = {i: XRay("127.0.0.1", args.port + i) for i in range(args.cores)}
+
+    def query(api: XRay) -> bytes:
+        stub = command_pb2_grpc.StatsServiceStub(api._channel)
+        try:
+            response = stub.QueryStats(command_pb2.QueryStatsRequest(pattern="user>>>", reset=True), timeout=30)
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+        return response.SerializeToString()
+
+    def threads_sweep():
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            futures = {i: executor.submit(query, api) for i, api in apis.items()}
+        return {i: parse_user_stats(future.result()) for i, future in futures.items()}
+
+    def aio_sweep():
+        data = jobs_loop.run(record_usages.gather_stats(record_usages.get_users_stats, apis))
+        return {i: parse_user_stats(stats) for i, stats in data.items()}
+
+    for label, sweep in (("threads", threads_sweep), ("aio", aio_sweep)):
+        sweep()  # connects
+        times = []
+        for _ in range(args.sweeps):
+            started = time.perf_counter()
+            stats = sweep()
+            times.append(time.perf_counter() - started)
+        assert all(len(user_ids) for user_ids, _ in stats.values()), "a core answered no stats"
+        print(f"{label:8s} {args.cores} cores, median {statistics.median(times) * 1000:6.0f} ms, "
+              f"max {max(times) * 1000:6.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Memory of the user directory and time of the queries it answers for the usage and review jobs,
+against the database queries they replaced, kept inline.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+
+from sqlalchemy import and_, or_
+
+from benchmarks.common import best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--flushed", type=int, default=5000, help="users of a usage flush")
+    parser.add_argument("--retracked", type=int, default=1000, help="users of a retrack")
+    args = parser.parse_args()
+
+    from app.db import GetDB
+    from app.db.crud import get_user_queryset
+    from app.db.models import User
+    from app.models.user import UserStatus
+    from app.utils.directory import user_directory
+
+    reviewable_columns = (User.id, User.status, User.expire, User.data_limit, User.used_traffic,
+                          User.on_hold_timeout, User.online_at, User.edit_at, User.created_at)
+    reviewable_statuses = [UserStatus.active, UserStatus.on_hold]
+    expire_before = int(time.time()) + 4 * 86400
+
+    with GetDB() as db:
+        user_ids = [user_id for (user_id,) in db.query(User.id)]
+        usages = {user_id: random.randint(1, 10 ** 6)
+                  for user_id in random.sample(user_ids, min(args.flushed, len(user_ids)))}
+        retracked = user_ids[:args.retracked]
+
+        def admin_usage():
+            user_admin_map = dict(db.query(User.id, User.admin_id).all())
+            usage = defaultdict(int)
+            for user_id, value in usages.items():
+                admin_id = user_admin_map.get(user_id)
+                if admin_id:
+                    usage[admin_id] += value
+            return usage
+
+        def reviewable(ids=None):
+            query = db.query(*reviewable_columns).filter(User.status.in_(reviewable_statuses))
+            if ids is not None:
+                query = query.filter(User.id.in_(ids))
+            return query.all()
+
+        def near_limits():
+            return get_user_queryset(db).filter(
+                User.status == UserStatus.active,
+                or_(
+                    and_(User.data_limit > 0, User.used_traffic * 100 >= User.data_limit * 70),
+                    and_(User.expire > 0, User.expire <= expire_before),
+                )
+            ).all()
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        user_directory.sync(db)
+        elapsed = time.perf_counter() - started
+        traced, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{len(user_directory)} users loaded in {elapsed:.2f} s, {traced / 2 ** 20:.1f} MiB traced, "
+              f"{user_directory.memory_usage() / 2 ** 20:.1f} MiB of columns")
+
+        assert admin_usage() == user_directory.admin_usage(usages)
+        cases = (
+            (f"admin usage, {len(usages)} users", admin_usage, lambda: user_directory.admin_usage(usages)),
+            ("deadline rebuild source", reviewable, user_directory.reviewable),
+            (f"retrack, {len(retracked)} users",
+             lambda: reviewable(retracked), lambda: user_directory.reviewable(retracked)),
+            ("notification candidates", near_limits, lambda: user_directory.near_limits(70, expire_before)),
+        )
+        for label, before, after in cases:
+            print(f"{label:28s} {best(before, repeat=3) * 1000:9.1f} ms -> {best(after) * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
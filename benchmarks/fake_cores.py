@@ -0,0 +1,55 @@
+"""
+Simulated xray cores for core_queries: one grpc.aio StatsService per port from --port on,
+answering QueryStats with the same stats of every user after a random latency.
+"""
+import argparse
+import asyncio
+import random
+
+import grpc
+
+from xray_api.proto.app.stats.command import command_pb2, command_pb2_grpc
+
+
+class StatsService(command_pb2_grpc.StatsServiceServicer):
+    def __init__(self, response: command_pb2.QueryStatsResponse, latency: float):
+        self.response = response
+        self.latency = latency
+
+    async def QueryStats(self, request, context):
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        return self.response
+
+    async def GetSysStats(self, request, context):
+        return command_pb2.SysStatsResponse(Uptime=1)
+
+
+async def serve(cores: int, port: int, response: command_pb2.QueryStatsResponse, latency: float):
+    servers = []
+    for i in range(cores):
+        server = grpc.aio.server()
+        command_pb2_grpc.add_StatsServiceServicer_to_server(StatsService(response, latency), server)
+        server.add_insecure_port(f"127.0.0.1:{port + i}")
+        await server.start()
+        servers.append(server)
+    print(f"{cores} cores on ports {port}-{port + cores - 1}", flush=True)
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cores", type=int, default=50)
+    parser.add_argument("--users", type=int, default=2000, help="users per core")
+    parser.add_argument("--latency", type=float, default=0.1, help="mean latency in seconds, +-50%%")
+    parser.add_argument("--port", type=int, default=21000)
+    args = parser.parse_args()
+
+    response = command_pb2.QueryStatsResponse()
+    for uid in range(1, args.users + 1):
+        for link in ("uplink", "downlink"):
+            response.stat.add(name=f"user>>>{uid}.user{uid}>>>traffic>>>{link}", value=random.randint(1, 10 ** 7))
+    asyncio.run(serve(args.cores, args.port, response, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Time and peak memory of building the xray config of the main core with the users of the database,
+the first time, when the client index is built, and the next times, then with its JSON encoding.
+On the parent commit of the client index, every call is a first one.
+"""
+import argparse
+
+from benchmarks.common import measure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    from app import xray
+
+    config = measure("first include_db_users", xray.config.include_db_users)
+    clients = sum(len(inbound.get("settings", {}).get("clients", [])) for inbound in config["inbounds"])
+    print(f"{clients} clients")
+    del config
+
+    for _ in range(args.repeat):
+        measure("next include_db_users", xray.config.include_db_users)
+    measure("next include_db_users + to_json", lambda: xray.config.include_db_users().to_json())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Time and size of the JSON of v2ray-json and sing-box subscriptions and of a page of the users list,
+encoded by json_dumps and FastJSONResponse and by the standard library, as they were before.
+The backend is orjson or msgspec, whichever is installed.
+"""
+import argparse
+import json
+
+from benchmarks.common import best, get_bench_user, set_bench_hosts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hosts", type=int, default=50, help="hosts per inbound")
+    parser.add_argument("--user", help="username, the first user with proxies by default")
+    parser.add_argument("--users", type=int, default=5000, help="users of the list page")
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    from app.db import GetDB, crud
+    from app.models.user import UserListItem, UsersResponse
+    from app.subscription.share import generate_subscription
+    from app.utils import helpers
+    from app.utils.helpers import FastJSONResponse, UUIDEncoder, json_dumps
+
+    print(f"backend: {'orjson' if helpers.orjson else 'msgspec' if helpers.msgspec else 'json'}")
+
+    set_bench_hosts(args.hosts)
+    user = get_bench_user(args.user)
+    for config_format in ("v2ray-json", "sing-box"):
+        document = json.loads(generate_subscription(user, config_format, False, False))
+        outbounds = len(document) if isinstance(document, list) else len(document.get("outbounds", []))
+        print(f"{config_format} ({outbounds} outbounds)")
+        cases = {
+            "stdlib indent 4": lambda: json.dumps(document, indent=4, cls=UUIDEncoder),
+            "json_dumps indent 2": lambda: json_dumps(document, indent=2),
+            "json_dumps compact": lambda: json_dumps(document),
+        }
+        for label, func in cases.items():
+            assert json.loads(func()) == document
+            elapsed = best(func, number=args.number)
+            print(f"  {label:22s} {elapsed * 1000:8.3f} ms {len(func().encode()):9d} B")
+
+    with GetDB() as db:
+        users = crud.get_users(db, limit=args.users)
+        content = jsonable_encoder(UsersResponse(users=[UserListItem.model_validate(u) for u in users],
+                                                 total=len(users)))
+    assert json.loads(JSONResponse(content).body) == json.loads(FastJSONResponse(content).body)
+    print(f"{len(users)} users list")
+    for cls in (JSONResponse, FastJSONResponse):
+        elapsed = best(lambda: cls(content), number=10)
+        print(f"  {cls.__name__:22s} {elapsed * 1000:8.2f} ms {len(cls(content).body):9d} B")
+
+
+if __name__ == "__main__":
+    main()
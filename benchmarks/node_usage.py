@@ -0,0 +1,68 @@
+"""
+Rows per second written by record_user_stats and record_node_stats for a node,
+with the single statement upsert and with the select/insert/update path it replaced,
+into a new hourly bucket and into an existing one.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+
+from benchmarks.common import load_job
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10000)
+    args = parser.parse_args()
+
+    from app.db import GetDB
+    from app.db.models import Node, NodeUsage, NodeUserUsage, User
+
+    record_usages = load_job("record_usages")
+    upsert = record_usages.get_upsert_stmt
+
+    with GetDB() as db:
+        node = db.query(Node).filter(Node.name == "benchmark").first()
+        if node is None:
+            node = Node(name="benchmark", address="127.0.0.1", port=62050, api_port=62051)
+            db.add(node)
+            db.commit()
+        node_id = node.id
+        uids = db.execute(select(User.id).order_by(User.id).limit(args.users)).scalars().all()
+    if not uids:
+        raise SystemExit("no users, seed the database with `python -m benchmarks.seed`")
+
+    params = [{"uid": str(uid), "value": 1000} for uid in uids]
+    node_params = [{"up": 1000, "down": 2000}] * 10
+    # a bucket of its own per run, far from the ones the panel writes
+    created_at = datetime(2000, 1, 1)
+
+    for label, get_upsert_stmt in (("select/insert/update", lambda *args: None), ("upsert", upsert)):
+        record_usages.get_upsert_stmt = get_upsert_stmt
+        created_at += timedelta(hours=1)
+        for round_ in ("insert", "update"):
+            started = time.perf_counter()
+            record_usages.record_user_stats(params, node_id, created_at=created_at)
+            elapsed = time.perf_counter() - started
+            print(f"{label:22s} user stats, {round_:6s} {len(params) / elapsed:12,.0f} rows/s")
+
+        record_usages.get_hour_bucket = lambda: created_at
+        started = time.perf_counter()
+        for _ in range(100):
+            record_usages.record_node_stats(node_params, node_id)
+        elapsed = time.perf_counter() - started
+        print(f"{label:22s} node stats            {100 / elapsed:12,.0f} calls/s")
+
+    with GetDB() as db:
+        written = db.execute(select(func.count()).select_from(NodeUserUsage)
+                             .where(NodeUserUsage.node_id == node_id)).scalar()
+        assert written == 2 * len(params), written
+        db.execute(delete(NodeUserUsage).where(NodeUserUsage.node_id == node_id))
+        db.execute(delete(NodeUsage).where(NodeUsage.node_id == node_id))
+        db.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Seeds an empty database with users for the benchmarks, each with a VLESS and a Shadowsocks proxy
+and one of a few admins, like the bench database the figures in the commit messages come from.
+"""
+import argparse
+import uuid
+
+from sqlalchemy import func, insert
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--admins", type=int, default=10)
+    args = parser.parse_args()
+
+    from app.db import GetDB
+    from app.db.models import Admin, Proxy, User
+
+    with GetDB() as db:
+        if db.query(func.count(User.id)).scalar():
+            raise SystemExit("the database already has users, seed an empty one")
+
+        db.execute(insert(Admin), [
+            {"id": i, "username": f"bench{i}", "hashed_password": "", "is_sudo": i == 1}
+            for i in range(1, args.admins + 1)
+        ])
+        db.execute(insert(User), [
+            {"id": i, "username": f"user{i}", "status": "active", "used_traffic": 0,
+             "data_limit_reset_strategy": "no_reset", "admin_id": i % args.admins + 1 if args.admins else None}
+            for i in range(1, args.users + 1)
+        ])
+        db.execute(insert(Proxy), [
+            {"user_id": i, "type": "VLESS", "settings": {"id": str(uuid.uuid4()), "flow": "xtls-rprx-vision"}}
+            for i in range(1, args.users + 1)
+        ] + [
+            {"user_id": i, "type": "Shadowsocks",
+             "settings": {"password": uuid.uuid4().hex, "method": "chacha20-ietf-poly1305"}}
+            for i in range(1, args.users + 1)
+        ])
+        db.commit()
+
+    print(f"seeded {args.users} users and {args.admins} admins")
+
+
+if __name__ == "__main__":
+    main()
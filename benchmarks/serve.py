@@ -0,0 +1,25 @@
+"""
+Serves the panel for the HTTP benchmarks, without starting the cores:
+the startup and shutdown handlers are dropped, the scheduler still runs the jobs.
+"""
+import argparse
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    from app import app, scheduler
+
+    app.router.on_startup.clear()
+    app.router.on_shutdown.clear()
+    scheduler.start()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
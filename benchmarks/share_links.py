@@ -0,0 +1,55 @@
+"""
+Time per user of turning the hosts into links, with a configuration that renders nothing,
+and of whole subscriptions, with many hosts per inbound.
+Run on the parent commit of the precompiled hosts, it gives the baseline.
+"""
+import argparse
+import time
+
+from benchmarks.common import get_bench_user, set_bench_hosts
+
+
+class NullConfiguration:
+    """Takes the links and drops them, so only processing the hosts is timed"""
+
+    def add(self, **kwargs):
+        pass
+
+    def render(self, reverse=False):
+        return ""
+
+
+def per_call(func, number: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - started) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hosts", type=int, default=50, help="hosts per inbound")
+    parser.add_argument("--user", help="username, the first user with proxies by default")
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--formats", nargs="+", default=["v2ray", "sing-box", "clash-meta"])
+    args = parser.parse_args()
+
+    from app.subscription.share import generate_subscription, process_inbounds_and_tags, setup_format_variables
+
+    inbounds, hosts = set_bench_hosts(args.hosts)
+    print(f"{hosts} hosts on {inbounds} inbounds")
+    user = get_bench_user(args.user)
+
+    format_variables = setup_format_variables(user.__dict__)
+    elapsed = per_call(lambda: process_inbounds_and_tags(user.inbounds, user.proxies, format_variables,
+                                                         conf=NullConfiguration()), args.number * 10)
+    print(f"{'hosts processing':16s} {elapsed * 1e6:10.1f} us per user")
+
+    for config_format in args.formats:
+        elapsed = per_call(lambda: generate_subscription(user, config_format, False, False), args.number)
+        print(f"{config_format:16s} {elapsed * 1000:10.2f} ms per user")
+
+
+if __name__ == "__main__":
+    main()
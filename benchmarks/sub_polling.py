@@ -0,0 +1,65 @@
+"""
+Throughput and latency of many subscription clients polling the panel at once, each fetching its v2ray links
+a few times over its own connection. Serve the panel with `python -m benchmarks.serve` on the same database.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def poll(client: httpx.AsyncClient, path: str, rounds: int, latencies: list) -> int:
+    errors = 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        try:
+            response = await client.get(path, headers={"user-agent": "v2rayNG/1.8.5"})
+            failed = response.status_code != 200
+        except httpx.HTTPError:
+            failed = True
+        latencies.append(time.perf_counter() - started)
+        errors += failed
+    return errors
+
+
+async def run(url: str, paths: list, rounds: int):
+    latencies = []
+    limits = httpx.Limits(max_connections=len(paths), max_keepalive_connections=len(paths))
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300) as client:
+        await client.get(paths[0])
+        started = time.perf_counter()
+        errors = await asyncio.gather(*(poll(client, path, rounds, latencies) for path in paths))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[int(p * (len(latencies) - 1))] * 1000
+
+    print(f"{len(paths)} pollers x {rounds}: {len(latencies) / elapsed:.0f} req/s  p50 {percentile(.5):.0f} ms  "
+          f"p95 {percentile(.95):.0f} ms  p99 {percentile(.99):.0f} ms  errors {sum(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--pollers", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=2)
+    args = parser.parse_args()
+
+    from sqlalchemy import select
+
+    from app.db import GetDB
+    from app.db.models import User
+    from app.utils.jwt import create_subscription_token
+    from config import XRAY_SUBSCRIPTION_PATH
+
+    with GetDB() as db:
+        usernames = db.execute(select(User.username).order_by(User.id).limit(args.pollers)).scalars().all()
+    paths = [f"/{XRAY_SUBSCRIPTION_PATH}/{create_subscription_token(username)}" for username in usernames]
+    asyncio.run(run(args.url, paths, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Cost of constructing the subscription generators, which parse their templates, and of whole subscriptions.
+Run on the parent commit of the template cache, it gives the baseline.
+"""
+import argparse
+
+from benchmarks.common import best, get_bench_user, set_bench_hosts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hosts", type=int, default=1, help="hosts per inbound")
+    parser.add_argument("--user", help="username, the first user with proxies by default")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    from app.subscription.clash import ClashConfiguration, ClashMetaConfiguration
+    from app.subscription.share import generate_subscription
+    from app.subscription.singbox import SingBoxConfiguration
+    from app.subscription.v2ray import V2rayJsonConfig
+
+    for cls in (ClashConfiguration, ClashMetaConfiguration, SingBoxConfiguration, V2rayJsonConfig):
+        elapsed = best(cls, number=args.number)
+        print(f"{cls.__name__:24s} {elapsed * 1e6:10.1f} us per instance")
+
+    set_bench_hosts(args.hosts)
+    user = get_bench_user(args.user)
+    for config_format in ("v2ray-json", "sing-box", "clash", "clash-meta"):
+        elapsed = best(lambda: generate_subscription(user, config_format, False, False), number=args.number // 20)
+        print(f"{config_format:24s} {elapsed * 1000:10.2f} ms per subscription")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Time of aggregating the user stats of the cores into the usage accumulator,
+parsed and summed in bulk, with NumPy when it's installed, against the per stat path it replaced, kept inline.
+The stats are generated, no core or database is used.
+"""
+import argparse
+import random
+from collections import defaultdict
+from datetime import datetime
+from operator import attrgetter
+
+from benchmarks.common import best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--nodes", type=int, default=5, help="cores, the main one included")
+    parser.add_argument("--no-numpy", action="store_true", help="use the fallback even if NumPy is installed")
+    args = parser.parse_args()
+
+    from app.utils import usage
+    from app.utils.usage import UsageAccumulator, parse_user_stats, sum_user_stats
+    from xray_api.proto.app.stats.command import command_pb2
+    from xray_api.stats import StatResponse
+
+    if args.no_numpy:
+        usage.np = None
+
+    random.seed(1)
+    responses = {}
+    for node_id in [None, *range(1, args.nodes)]:
+        response = command_pb2.QueryStatsResponse()
+        for uid in range(1, args.users + 1):
+            for link in ("uplink", "downlink"):
+                response.stat.add(name=f"user>>>{uid}.user{uid}>>>traffic>>>{link}",
+                                  value=random.choice([0, random.randint(1, 10 ** 7)]))
+        responses[node_id] = response.SerializeToString()
+    usage_coefficient = {node_id: 1 if node_id is None else 1.5 for node_id in responses}
+    created_at = datetime.utcnow()
+
+    def query_stats(data: bytes):
+        """What Stats.query_stats yields for a response"""
+        for stat in command_pb2.QueryStatsResponse.FromString(data).stat:
+            type, name, _, link = stat.name.split('>>>')
+            yield StatResponse(name, type, link, stat.value)
+
+    def before(record_node_usage: bool):
+        users, node_users = defaultdict(int), defaultdict(int)
+        api_params = {}
+        for node_id, data in responses.items():
+            params = defaultdict(int)
+            for stat in filter(attrgetter('value'), query_stats(data)):
+                params[stat.name.split('.', 1)[0]] += stat.value
+            api_params[node_id] = list({"uid": uid, "value": value} for uid, value in params.items())
+        for node_id, params in api_params.items():
+            coefficient = usage_coefficient.get(node_id, 1)
+            node_usage = defaultdict(int)
+            for param in params:
+                node_usage[int(param['uid'])] += int(param['value'] * coefficient)
+            for uid, value in node_usage.items():
+                users[uid] += value
+                if record_node_usage:
+                    node_users[(node_id, created_at, uid)] += value
+        return dict(users), dict(node_users)
+
+    def after(record_node_usage: bool):
+        accumulator = UsageAccumulator()
+        node_stats = {node_id: parse_user_stats(data) for node_id, data in responses.items()}
+        users, nodes = sum_user_stats(node_stats, usage_coefficient)
+        accumulator.add(users, nodes, created_at, record_node_usage=record_node_usage)
+        return accumulator.drain()
+
+    stats = args.users * 2 * len(responses)
+    print(f"{stats} stats, {'NumPy' if usage.np is not None else 'fallback'}")
+    for record_node_usage in (False, True):
+        users, node_users = before(record_node_usage)
+        snapshot = after(record_node_usage)
+        assert snapshot.users == users and snapshot.node_users == node_users
+
+        elapsed_before = best(lambda: before(record_node_usage), repeat=3)
+        elapsed_after = best(lambda: after(record_node_usage), repeat=3)
+        print(f"{'node usage' if record_node_usage else 'no node usage':14s} {elapsed_before * 1000:8.0f} ms -> "
+              f"{elapsed_after * 1000:6.0f} ms ({elapsed_before / elapsed_after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
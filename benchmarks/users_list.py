@@ -0,0 +1,40 @@
+"""
+Time of listing a page of users over the API with and without their links.
+Before the links parameter, the links were always generated.
+"""
+import argparse
+import time
+
+from benchmarks.common import set_bench_hosts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--limit", type=int, default=10000)
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--hosts", type=int, default=1, help="hosts per inbound")
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    from app import app
+    from app.models.admin import Admin
+
+    set_bench_hosts(args.hosts)
+    app.dependency_overrides[Admin.get_current] = lambda: Admin(username="benchmark", is_sudo=True)
+    client = TestClient(app)
+
+    for _ in range(args.repeat):
+        for links in ("true", "false"):
+            started = time.perf_counter()
+            response = client.get("/api/users", params={"offset": args.offset, "limit": args.limit, "links": links})
+            elapsed = time.perf_counter() - started
+            assert response.status_code == 200, response.text
+            users = response.json()["users"]
+            print(f"links={links:5s} {elapsed:8.2f} s  {len(users)} users, "
+                  f"{len(users[0]['links']) if users else 0} links each, {len(response.content)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,9 @@ load_dotenv()
 SQLALCHEMY_DATABASE_URL = config("SQLALCHEMY_DATABASE_URL", default="sqlite:///db.sqlite3")
 SQLALCHEMY_POOL_SIZE = config("SQLALCHEMY_POOL_SIZE", cast=int, default=10)
 SQLIALCHEMY_MAX_OVERFLOW = config("SQLIALCHEMY_MAX_OVERFLOW", cast=int, default=30)
+# async driver URL of the same database for the subscription endpoints, e.g. mysql+aiomysql://,
+# postgresql+asyncpg:// or sqlite+aiosqlite://, they use the threadpool when it's not set
+SQLALCHEMY_ASYNC_DATABASE_URL = config("SQLALCHEMY_ASYNC_DATABASE_URL", default="")
 
 UVICORN_HOST = config("UVICORN_HOST", default="0.0.0.0")
 UVICORN_PORT = config("UVICORN_PORT", cast=int, default=8000)
@@ -14,6 +17,10 @@ UVICORN_UDS = config("UVICORN_UDS", default=None)
 UVICORN_SSL_CERTFILE = config("UVICORN_SSL_CERTFILE", default=None)
 UVICORN_SSL_KEYFILE = config("UVICORN_SSL_KEYFILE", default=None)
 UVICORN_SSL_CA_TYPE = config("UVICORN_SSL_CA_TYPE", default="public").lower()
+UVICORN_WORKERS = config("UVICORN_WORKERS", cast=int, default=1)
+# with more than one worker, the worker which locks CONTROLLER_SOCKET + ".lock" runs the xray core,
+# the nodes and the jobs, the other workers send it the xray operations through this unix socket
+CONTROLLER_SOCKET = config("CONTROLLER_SOCKET", default="marzban-controller.socket")
 DASHBOARD_PATH = config("DASHBOARD_PATH", default="/dashboard/")
 
 DEBUG = config("DEBUG", default=False, cast=bool)
@@ -35,6 +42,26 @@ XRAY_EXCLUDE_INBOUND_TAGS = config("XRAY_EXCLUDE_INBOUND_TAGS", default='').spli
 XRAY_SUBSCRIPTION_URL_PREFIX = config("XRAY_SUBSCRIPTION_URL_PREFIX", default="").strip("/")
 XRAY_SUBSCRIPTION_PATH = config("XRAY_SUBSCRIPTION_PATH", default="sub").strip("/")
 
+# users are added to and removed from the cores through per core queues served by this many threads
+XRAY_SYNC_WORKERS = config("XRAY_SYNC_WORKERS", cast=int, default=8)
+XRAY_SYNC_BATCH_SIZE = config("XRAY_SYNC_BATCH_SIZE", cast=int, default=100)
+# callers wait when this many users are pending for a core
+XRAY_SYNC_MAX_PENDING = config("XRAY_SYNC_MAX_PENDING", cast=int, default=10000)
+# seconds a caller waits for room in a full queue, the user is then left to the reconcile_users job
+XRAY_SYNC_PUT_TIMEOUT = config("XRAY_SYNC_PUT_TIMEOUT", cast=float, default=5)
+XRAY_SYNC_RETRIES = config("XRAY_SYNC_RETRIES", cast=int, default=3)
+# gzip the config sent to REST nodes, the nodes must accept gzip encoded request bodies
+NODE_CONFIG_GZIP = config("NODE_CONFIG_GZIP", cast=bool, default=False)
+# a node failing its checks is treated as down without a request until it's checked again,
+# after a backoff which doubles on every failure up to this many seconds
+NODE_BREAKER_MAX_BACKOFF = config("NODE_BREAKER_MAX_BACKOFF", cast=int, default=60)
+# deadline of the health check of each node, in seconds
+NODE_HEALTH_CHECK_TIMEOUT = config("NODE_HEALTH_CHECK_TIMEOUT", cast=float, default=2)
+# unhealthy nodes are reconnected after a jittered backoff which doubles up to this many seconds
+NODE_RECONNECT_MAX_BACKOFF = config("NODE_RECONNECT_MAX_BACKOFF", cast=int, default=300)
+# how many nodes may be sent a config to (re)start with at the same time
+NODE_CONFIG_PUSH_CONCURRENCY = config("NODE_CONFIG_PUSH_CONCURRENCY", cast=int, default=4)
+
 TELEGRAM_API_TOKEN = config("TELEGRAM_API_TOKEN", default="")
 TELEGRAM_ADMIN_ID = config(
     'TELEGRAM_ADMIN_ID',
@@ -131,10 +158,27 @@ NOTIFY_DAYS_LEFT = config(
 
 DISABLE_RECORDING_NODE_USAGE = config("DISABLE_RECORDING_NODE_USAGE", cast=bool, default=False)
 
+# pending usage which is not flushed to the database yet, and the flush in progress, is mirrored
+# to this file, so usage survives a restart, empty to disable
+USAGE_SPILL_FILE = config("USAGE_SPILL_FILE", default="usage_spill.json")
+
 # headers: profile-update-interval, support-url, profile-title
 SUB_UPDATE_INTERVAL = config("SUB_UPDATE_INTERVAL", default="12")
 SUB_SUPPORT_URL = config("SUB_SUPPORT_URL", default="https://t.me/")
 SUB_PROFILE_TITLE = config("SUB_PROFILE_TITLE", default="Subscription")
+# generated subscriptions are cached per user and client format, 0 disables the cache
+SUB_CACHE_SIZE = config("SUB_CACHE_SIZE", cast=int, default=1000)
+SUB_CACHE_TTL = config("SUB_CACHE_TTL", cast=int, default=600)
+# hosts with random SNI, host, address or user agent are generated on every request unless this is set
+SUB_CACHE_RANDOM_HOSTS = config("SUB_CACHE_RANDOM_HOSTS", cast=bool, default=False)
+# indent of sing-box and v2ray-json subscriptions, orjson (when installed) only serializes with an indent of 2
+SUB_JSON_INDENT = config("SUB_JSON_INDENT", cast=int, default=4)
+# verified subscription tokens, and the users they belong to for a few seconds, 0 disables each cache
+SUB_TOKEN_CACHE_SIZE = config("SUB_TOKEN_CACHE_SIZE", cast=int, default=10000)
+SUB_USER_CACHE_SIZE = config("SUB_USER_CACHE_SIZE", cast=int, default=10000)
+SUB_USER_CACHE_TTL = config("SUB_USER_CACHE_TTL", cast=int, default=5)
+# threads rendering subscriptions for the async subscription endpoints
+SUB_RENDER_WORKERS = config("SUB_RENDER_WORKERS", cast=int, default=4)
 
 # discord webhook log
 DISCORD_WEBHOOK_URL = config("DISCORD_WEBHOOK_URL", default="")
@@ -142,7 +186,17 @@ DISCORD_WEBHOOK_URL = config("DISCORD_WEBHOOK_URL", default="")
 
 # Interval jobs, all values are in seconds
 JOB_CORE_HEALTH_CHECK_INTERVAL = config("JOB_CORE_HEALTH_CHECK_INTERVAL", cast=int, default=10)
+# the cached connected/started state of the nodes is refreshed this often
+JOB_NODE_HEARTBEAT_INTERVAL = config("JOB_NODE_HEARTBEAT_INTERVAL", cast=int, default=5)
 JOB_RECORD_NODE_USAGES_INTERVAL = config("JOB_RECORD_NODE_USAGES_INTERVAL", cast=int, default=30)
 JOB_RECORD_USER_USAGES_INTERVAL = config("JOB_RECORD_USER_USAGES_INTERVAL", cast=int, default=10)
+# buffered users usage is written to the database on this interval, 0 writes it on every record
+JOB_FLUSH_USER_USAGES_INTERVAL = config("JOB_FLUSH_USER_USAGES_INTERVAL", cast=int, default=30)
+# subscription fetches (sub_updated_at and sub_last_user_agent) are written on this interval, 0 writes them on every fetch
+JOB_FLUSH_SUB_UPDATES_INTERVAL = config("JOB_FLUSH_SUB_UPDATES_INTERVAL", cast=int, default=10)
 JOB_REVIEW_USERS_INTERVAL = config("JOB_REVIEW_USERS_INTERVAL", cast=int, default=10)
+# the users directory and deadlines are reloaded from the database this often, to catch changes made outside of the API
+JOB_REVIEW_USERS_REBUILD_INTERVAL = config("JOB_REVIEW_USERS_REBUILD_INTERVAL", cast=int, default=600)
 JOB_SEND_NOTIFICATIONS_INTERVAL = config("JOB_SEND_NOTIFICATIONS_INTERVAL", cast=int, default=30)
+# the users of every core are compared with the database and repaired this often, 0 disables it
+JOB_RECONCILE_USERS_INTERVAL = config("JOB_RECONCILE_USERS_INTERVAL", cast=int, default=300)
@@ -9,7 +9,7 @@ from cryptography.hazmat.backends import default_backend
 
 from app import app, logger
 from config import (DEBUG, UVICORN_HOST, UVICORN_PORT, UVICORN_SSL_CERTFILE,
-                    UVICORN_SSL_KEYFILE, UVICORN_SSL_CA_TYPE, UVICORN_UDS)
+                    UVICORN_SSL_KEYFILE, UVICORN_SSL_CA_TYPE, UVICORN_UDS, UVICORN_WORKERS)
 
 
 def validate_cert_and_key(cert_file_path, key_file_path, ca_type):
@@ -45,8 +45,8 @@ Self-signed CAs are useful in testing or internal use cases, they’re not suita
 
 
 if __name__ == "__main__":
-    # Do NOT change workers count for now
-    # multi-workers support isn't implemented yet for APScheduler and XRay module
+    # with more than one worker, one of them is elected as the controller which runs
+    # APScheduler and the XRay module, see app.utils.controller
 
     bind_args = {}
     if UVICORN_SSL_CA_TYPE not in ["public", "private"]:
@@ -96,7 +96,7 @@ Then, navigate to {click.style(f'http://127.0.0.1:{UVICORN_PORT}', bold=True)} o
         uvicorn.run(
             "main:app",
             **bind_args,
-            workers=1,
+            workers=UVICORN_WORKERS,
             reload=DEBUG,
             log_level=logging.DEBUG if DEBUG else logging.INFO
         )
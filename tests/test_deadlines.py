@@ -0,0 +1,97 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.models.user import UserStatus
+from app.utils.deadlines import UserDeadlines
+
+CREATED_AT = datetime(2026, 1, 1)
+
+
+def make_user(user_id, status=UserStatus.active, expire=None, data_limit=None, used_traffic=0,
+              on_hold_timeout=None, online_at=None, edit_at=None):
+    return SimpleNamespace(id=user_id, status=status, expire=expire, data_limit=data_limit,
+                           used_traffic=used_traffic, on_hold_timeout=on_hold_timeout,
+                           online_at=online_at, edit_at=edit_at, created_at=CREATED_AT)
+
+
+def test_users_are_due_once_their_deadline_passes():
+    deadlines = UserDeadlines()
+    deadlines.rebuild([make_user(1, expire=300), make_user(2, expire=100), make_user(3, expire=200),
+                       make_user(4)])
+
+    assert deadlines.pop_due(50) == set()
+    assert deadlines.pop_due(150) == {2}
+    assert deadlines.pop_due(250) == {3}
+    # popped users aren't due again
+    assert deadlines.pop_due(1000) == {1}
+    assert deadlines.pop_due(1000) == set()
+
+
+def test_a_changed_deadline_replaces_the_old_one():
+    deadlines = UserDeadlines()
+    deadlines.rebuild([make_user(1, expire=100), make_user(2, expire=100)])
+
+    deadlines.track(make_user(1, expire=500))
+    deadlines.discard(2)
+
+    assert deadlines.pop_due(200) == set()
+    assert deadlines.pop_due(500) == {1}
+
+
+def test_an_earlier_deadline_is_due_before_the_old_one():
+    deadlines = UserDeadlines()
+    deadlines.rebuild([make_user(1, expire=500)])
+
+    deadlines.track(make_user(1, expire=100))
+
+    assert deadlines.pop_due(100) == {1}
+    assert deadlines.pop_due(500) == set()
+
+
+def test_users_are_due_when_their_usage_crosses_the_data_limit():
+    deadlines = UserDeadlines()
+    deadlines.rebuild([make_user(1, data_limit=100, used_traffic=40), make_user(2, data_limit=100)])
+
+    deadlines.add_usage({1: 50, 2: 10, 3: 1000})
+    assert deadlines.pop_due(0) == set()
+
+    deadlines.add_usage({1: 10})
+    assert deadlines.pop_due(0) == {1}
+
+
+def test_users_over_their_data_limit_are_due_right_away():
+    deadlines = UserDeadlines()
+    deadlines.track(make_user(1, data_limit=100, used_traffic=100))
+
+    assert deadlines.pop_due(0) == {1}
+
+
+def test_on_hold_users_are_due_on_any_usage_or_their_timeout():
+    deadlines = UserDeadlines()
+    deadlines.rebuild([make_user(1, status=UserStatus.on_hold),
+                       make_user(2, status=UserStatus.on_hold, on_hold_timeout=datetime.fromtimestamp(100))])
+
+    deadlines.add_usage({1: 1})
+    assert deadlines.pop_due(0) == {1}
+    assert deadlines.pop_due(100) == {2}
+
+
+def test_on_hold_users_connected_since_their_last_edit_are_due():
+    deadlines = UserDeadlines()
+    deadlines.track(make_user(1, status=UserStatus.on_hold, online_at=datetime(2026, 1, 3),
+                              edit_at=datetime(2026, 1, 2)))
+    deadlines.track(make_user(2, status=UserStatus.on_hold, online_at=datetime(2026, 1, 2),
+                              edit_at=datetime(2026, 1, 3)))
+
+    assert deadlines.pop_due(0) == {1}
+
+
+def test_due_users_stay_due_across_a_rebuild():
+    deadlines = UserDeadlines()
+    deadlines.track(make_user(1, data_limit=100))
+    deadlines.add_usage({1: 100})
+
+    deadlines.rebuild([make_user(2, expire=100)])
+
+    assert deadlines.pop_due(0) == {1}
+    assert len(deadlines) == 1
@@ -0,0 +1,78 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.models.user import UserStatus
+from app.utils.directory import UserDirectory
+
+CREATED_AT = datetime(2026, 1, 1)
+
+
+def make_user(user_id, status=UserStatus.active, admin_id=None, expire=None, data_limit=None,
+              used_traffic=0, on_hold_timeout=None, online_at=None):
+    return SimpleNamespace(id=user_id, status=status, admin_id=admin_id, expire=expire, data_limit=data_limit,
+                           used_traffic=used_traffic, on_hold_timeout=on_hold_timeout, online_at=online_at,
+                           edit_at=None, created_at=CREATED_AT)
+
+
+def make_directory(*users) -> UserDirectory:
+    directory = UserDirectory()
+    for user in users:
+        directory.track(user)
+    return directory
+
+
+def test_admin_usage_sums_the_usage_of_users_by_admin():
+    directory = make_directory(make_user(1, admin_id=1), make_user(2, admin_id=1), make_user(3, admin_id=2),
+                               make_user(4))
+
+    assert directory.admin_usage({1: 10, 2: 5, 3: 7, 4: 100, 5: 100}) == {1: 15, 2: 7}
+
+
+def test_usage_is_added_to_the_tracked_users():
+    directory = make_directory(make_user(1, data_limit=100, used_traffic=50), make_user(2, data_limit=100))
+
+    directory.add_usage({1: 40, 3: 10}, {1: datetime(2026, 1, 2)})
+
+    assert directory.near_limits(90, 0) == [1]
+    assert {user.id: user.used_traffic for user in directory.reviewable()} == {1: 90, 2: 0}
+
+
+def test_near_limits_returns_active_users_near_their_data_limit_or_expire():
+    directory = make_directory(
+        make_user(1, data_limit=100, used_traffic=80),
+        make_user(2, data_limit=100, used_traffic=79),
+        make_user(3, expire=1000),
+        make_user(4, expire=2000),
+        make_user(5, status=UserStatus.disabled, data_limit=100, used_traffic=100),
+        make_user(6),
+    )
+
+    assert sorted(directory.near_limits(80, 1500)) == [1, 3]
+
+
+def test_reviewable_returns_active_and_on_hold_users():
+    on_hold_timeout = datetime(2026, 2, 1)
+    directory = make_directory(
+        make_user(1, expire=1000),
+        make_user(2, status=UserStatus.on_hold, on_hold_timeout=on_hold_timeout),
+        make_user(3, status=UserStatus.expired),
+        make_user(4, status=UserStatus.limited),
+    )
+
+    users = {user.id: user for user in directory.reviewable()}
+    assert set(users) == {1, 2}
+    assert users[1].expire == 1000 and users[1].created_at is None
+    assert users[2].on_hold_timeout == on_hold_timeout and users[2].created_at == CREATED_AT
+
+    assert [user.id for user in directory.reviewable([2, 3, 5])] == [2]
+
+
+def test_discarded_users_are_left_out():
+    directory = make_directory(make_user(1, admin_id=1), make_user(2, admin_id=1))
+
+    directory.discard(1)
+    directory.track(make_user(3, admin_id=2))
+
+    assert len(directory) == 2
+    assert sorted(user.id for user in directory.reviewable()) == [2, 3]
+    assert directory.admin_usage({1: 10, 2: 5, 3: 1}) == {1: 5, 2: 1}
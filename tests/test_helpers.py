@@ -0,0 +1,42 @@
+from uuid import UUID
+
+import pytest
+
+from app.utils import helpers
+from app.utils.helpers import json_dumps
+
+OBJ = {
+    "remark": "Тест ✓ 🚀",
+    "id": UUID("8c2a0f5e-4b3d-4e1a-9f6c-2d7b8e9a0c1d"),
+    "inbounds": [1, 2, {"tags": [], "settings": {}}],
+    "ratio": 1.5,
+    "none": None,
+    "escaped": "a\"b\\c\n\t\u0001",
+}
+
+
+def _backends():
+    yield "json", None, None
+    if helpers.orjson is not None:
+        yield "orjson", helpers.orjson, None
+    if helpers.msgspec is not None:
+        yield "msgspec", None, helpers.msgspec
+
+
+@pytest.mark.parametrize("indent", [None, 2, 4])
+def test_json_dumps_is_the_same_with_every_backend(monkeypatch, indent):
+    outputs = {}
+    for name, orjson, msgspec in _backends():
+        monkeypatch.setattr(helpers, "orjson", orjson)
+        monkeypatch.setattr(helpers, "msgspec", msgspec)
+        outputs[name] = json_dumps(OBJ, indent=indent)
+
+    assert set(outputs.values()) == {outputs["json"]}
+
+
+def test_json_dumps_leaves_non_ascii_unescaped(monkeypatch):
+    monkeypatch.setattr(helpers, "orjson", None)
+    monkeypatch.setattr(helpers, "msgspec", None)
+
+    assert json_dumps({"remark": "Тест"}) == '{"remark":"Тест"}'
+    assert json_dumps({"remark": "Тест"}, indent=2) == '{\n  "remark": "Тест"\n}'
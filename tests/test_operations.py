@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.xray import operations
+
+CONFIG = SimpleNamespace(base_hash="base")
+
+
+class FakeNode:
+    def __init__(self, config_hash=None, connected=True, started=True):
+        self.config_hash = config_hash
+        self.connected = connected
+        self.started = started
+        self.api = object()
+        self.calls = []
+
+    def connect(self):
+        self.calls.append("connect")
+        self.connected = True
+
+    def start(self, config):
+        self.calls.append("start")
+
+    def restart(self, config):
+        self.calls.append("restart")
+
+
+@pytest.fixture
+def applied(monkeypatch):
+    """The nodes whose users were changed over the API"""
+    nodes = []
+
+    def apply_clients(api, config):
+        nodes.append(api)
+        return 1, 1
+
+    monkeypatch.setattr(operations, "apply_clients", apply_clients)
+    return nodes
+
+
+def test_a_core_running_the_same_base_only_gets_its_users_changed(applied):
+    node = FakeNode(config_hash="base")
+
+    assert operations._push_config(node, CONFIG, "node", restart=True) is True
+    assert node.calls == []
+    assert applied == [node.api]
+
+
+def test_a_disconnected_node_is_connected_before_its_users_are_changed(applied):
+    node = FakeNode(config_hash="base", connected=False)
+
+    assert operations._push_config(node, CONFIG, "node") is True
+    assert node.calls == ["connect"]
+
+
+@pytest.mark.parametrize("config_hash", [None, "other"])
+def test_a_core_running_another_base_is_restarted(applied, config_hash):
+    node = FakeNode(config_hash=config_hash)
+
+    assert operations._push_config(node, CONFIG, "node", restart=True) is False
+    assert node.calls == ["restart"]
+    assert applied == []
+
+
+def test_a_stopped_core_is_started(applied):
+    node = FakeNode(config_hash="base", started=False)
+
+    assert operations._push_config(node, CONFIG, "node") is False
+    assert node.calls == ["start"]
+    assert applied == []
+
+
+def test_force_restarts_a_core_running_the_same_base(applied):
+    node = FakeNode(config_hash="base")
+
+    assert operations._push_config(node, CONFIG, "node", restart=True, force=True) is False
+    assert node.calls == ["restart"]
+    assert applied == []
+
+
+def test_a_core_is_restarted_when_changing_its_users_fails(monkeypatch):
+    def apply_clients(api, config):
+        raise RuntimeError("unsupported")
+
+    monkeypatch.setattr(operations, "apply_clients", apply_clients)
+    node = FakeNode(config_hash="base")
+
+    assert operations._push_config(node, CONFIG, "node", restart=True) is False
+    assert node.calls == ["restart"]
@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.xray import sync
+from app.xray.sync import ADD, ALTER, REMOVE, UserOperation, UserSyncQueue
+
+
+@pytest.mark.parametrize("actions, expected", [
+    ((ADD,), ADD),
+    ((REMOVE,), REMOVE),
+    ((ADD, ADD), ADD),
+    ((ADD, REMOVE), REMOVE),
+    # the user may still exist on the core with its old settings
+    ((REMOVE, ADD), ALTER),
+    ((ALTER, ADD), ALTER),
+    ((ADD, REMOVE, ADD), ALTER),
+])
+def test_merge_coalesces_the_actions_of_an_inbound(actions, expected):
+    operation = UserOperation("1.user")
+    for action in actions:
+        operation.merge("inbound", action, None)
+
+    assert operation.inbounds["inbound"][0] == expected
+
+
+def test_merge_keeps_the_latest_account_of_each_inbound():
+    operation = UserOperation("1.user")
+    operation.merge("a", ADD, "old")
+    operation.merge("a", ADD, "new")
+    operation.merge("b", REMOVE)
+
+    assert operation.inbounds == {"a": (ADD, "new"), "b": (REMOVE, None)}
+
+
+@pytest.fixture
+def blocked_executor():
+    """An executor whose only worker is busy until the test ends"""
+    executor = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    executor.submit(release.wait)
+    yield executor
+    release.set()
+    executor.shutdown(wait=True)
+
+
+def test_operations_of_a_user_are_coalesced_while_pending(blocked_executor):
+    queue = UserSyncQueue("core", lambda: None, blocked_executor)
+    queue.put("1.user", [("a", REMOVE, None)])
+    queue.put("1.user", [("a", ADD, None), ("b", ADD, None)])
+    queue.put("2.user", [("a", ADD, None)])
+
+    assert queue.stats()["depth"] == 2
+
+
+def test_put_drops_the_operation_when_the_queue_stays_full(monkeypatch, blocked_executor):
+    monkeypatch.setattr(sync, "XRAY_SYNC_MAX_PENDING", 2)
+    monkeypatch.setattr(sync, "XRAY_SYNC_PUT_TIMEOUT", 0.05)
+    queue = UserSyncQueue("core", lambda: None, blocked_executor)
+
+    for email in ("1.a", "2.b", "3.c"):
+        queue.put(email, [("a", ADD, None)])
+    # pending users still get their changes merged
+    queue.put("1.a", [("a", REMOVE, None)])
+
+    stats = queue.stats()
+    assert stats["depth"] == 2
+    assert stats["dropped"] == 1
+
+
+def test_operations_for_a_disconnected_core_are_dropped():
+    executor = ThreadPoolExecutor(max_workers=1)
+    queue = UserSyncQueue("core", lambda: None, executor)
+    queue.put("1.a", [("a", ADD, None)])
+    queue.put("2.b", [("a", ADD, None)])
+    executor.shutdown(wait=True)
+
+    stats = queue.stats()
+    assert stats["depth"] == 0
+    assert stats["sent"] == 0
+    assert stats["dropped"] == 2
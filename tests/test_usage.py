@@ -0,0 +1,153 @@
+from datetime import datetime
+
+from app.utils.usage import SpillingUsageAccumulator, UsageAccumulator
+
+HOUR = datetime(2026, 1, 1, 10)
+
+
+def test_drain_takes_the_pending_usage():
+    accumulator = UsageAccumulator()
+    accumulator.add({1: 10, 2: 5}, {None: {1: 4, 2: 5}, 3: {1: 6}}, HOUR)
+    accumulator.add({1: 1}, {None: {1: 1}}, HOUR)
+
+    snapshot = accumulator.drain()
+    assert snapshot.users == {1: 11, 2: 5}
+    assert snapshot.node_users == {(None, HOUR, 1): 5, (None, HOUR, 2): 5, (3, HOUR, 1): 6}
+    assert set(snapshot.online_at) == {1, 2}
+
+    assert not accumulator.drain()
+    assert len(accumulator) == 0
+
+
+def test_node_usage_is_left_out_when_not_recorded():
+    accumulator = UsageAccumulator()
+    accumulator.add({1: 10}, {None: {1: 10}}, HOUR, record_node_usage=False)
+
+    snapshot = accumulator.drain()
+    assert snapshot.users == {1: 10}
+    assert snapshot.node_users == {}
+
+
+def test_restore_merges_with_the_usage_recorded_meanwhile():
+    accumulator = UsageAccumulator()
+    accumulator.add({1: 10}, {None: {1: 10}}, HOUR)
+    snapshot = accumulator.drain()
+
+    accumulator.add({1: 3, 2: 2}, {None: {1: 3, 2: 2}}, HOUR)
+    accumulator.restore(snapshot)
+
+    restored = accumulator.drain()
+    assert restored.users == {1: 13, 2: 2}
+    assert restored.node_users == {(None, HOUR, 1): 13, (None, HOUR, 2): 2}
+    # the latest online time wins over the one of the snapshot
+    assert restored.online_at[1] >= snapshot.online_at[1]
+    assert set(restored.online_at) == {1, 2}
+
+
+def test_restoring_a_written_snapshot_adds_nothing():
+    accumulator = UsageAccumulator()
+    accumulator.add({1: 10}, {None: {1: 10}}, HOUR)
+    snapshot = accumulator.drain()
+
+    # what write_user_usages leaves of a snapshot once the users are written
+    snapshot.users, snapshot.online_at = {}, {}
+    accumulator.restore(snapshot)
+
+    restored = accumulator.drain()
+    assert restored.users == {}
+    assert restored.node_users == {(None, HOUR, 1): 10}
+
+
+def test_spilled_usage_survives_a_restart(tmp_path):
+    path = str(tmp_path / "usage.json")
+    accumulator = SpillingUsageAccumulator(path)
+    accumulator.add({1: 10, 2: 5}, {None: {1: 4, 2: 5}, 3: {1: 6}}, HOUR)
+    accumulator.persist()
+    pending = accumulator.drain()
+
+    restored = SpillingUsageAccumulator(path).drain()
+    assert restored.users == pending.users
+    assert restored.online_at == pending.online_at
+    assert restored.node_users == pending.node_users
+
+
+def test_a_failed_flush_is_put_back(tmp_path):
+    path = str(tmp_path / "usage.json")
+    accumulator = SpillingUsageAccumulator(path)
+    accumulator.add({1: 10}, {None: {1: 10}}, HOUR)
+    snapshot = accumulator.begin_flush()
+    accumulator.add({1: 1}, {None: {1: 1}}, HOUR)
+
+    accumulator.end_flush(snapshot)
+
+    assert SpillingUsageAccumulator(path).drain().users == {1: 11}
+    assert accumulator.begin_flush().users == {1: 11}
+
+
+def test_the_written_part_of_a_flush_is_not_put_back(tmp_path):
+    path = str(tmp_path / "usage.json")
+    accumulator = SpillingUsageAccumulator(path)
+    accumulator.add({1: 10}, {None: {1: 10}}, HOUR)
+    snapshot = accumulator.begin_flush()
+
+    snapshot.users, snapshot.online_at = {}, {}
+    accumulator.end_flush(snapshot)
+
+    restored = SpillingUsageAccumulator(path)
+    assert restored.begin_flush().node_users == {(None, HOUR, 1): 10}
+
+
+def test_a_flush_cut_off_by_a_crash_is_replayed_first(tmp_path):
+    path = str(tmp_path / "usage.json")
+    accumulator = SpillingUsageAccumulator(path)
+    accumulator.add({1: 10}, {None: {1: 10}}, HOUR)
+    snapshot = accumulator.begin_flush()
+    accumulator.add({2: 5}, {None: {2: 5}}, HOUR)
+    accumulator.persist()
+
+    restarted = SpillingUsageAccumulator(path)
+    replayed = restarted.begin_flush()
+    assert replayed.flush_id == snapshot.flush_id
+    assert replayed.users == {1: 10}
+    assert replayed.online_at == snapshot.online_at
+    assert replayed.node_users == {(None, HOUR, 1): 10}
+    # until the replayed flush ends, it's the one to flush
+    assert restarted.begin_flush() is replayed
+
+    replayed.users, replayed.online_at, replayed.node_users = {}, {}, {}
+    restarted.end_flush(replayed)
+    following = restarted.begin_flush()
+    assert following.flush_id != snapshot.flush_id
+    assert following.users == {2: 5}
+
+
+def test_an_empty_flush_is_not_kept_in_flight(tmp_path):
+    accumulator = SpillingUsageAccumulator(str(tmp_path / "usage.json"))
+    assert not accumulator.begin_flush()
+
+    accumulator.add({1: 10}, {None: {1: 10}}, HOUR)
+    assert accumulator.begin_flush().users == {1: 10}
+
+
+def test_the_elected_controller_takes_over_the_usage_in_memory(tmp_path):
+    path = str(tmp_path / "usage.json")
+    previous = SpillingUsageAccumulator(path)
+    previous.add({1: 10}, {None: {1: 10}}, HOUR)
+    previous.persist()
+
+    in_memory = UsageAccumulator()
+    in_memory.add({1: 1, 2: 2}, {None: {1: 1, 2: 2}}, HOUR)
+
+    # what load_usage_spill does when the process is elected
+    spilling = SpillingUsageAccumulator(path)
+    spilling.restore(in_memory.drain())
+
+    assert SpillingUsageAccumulator(path).drain().users == {1: 11, 2: 2}
+    assert spilling.drain().node_users == {(None, HOUR, 1): 11, (None, HOUR, 2): 2}
+
+
+def test_an_unreadable_spill_file_is_ignored(tmp_path):
+    path = tmp_path / "usage.json"
+    path.write_text("{not json")
+
+    assert not SpillingUsageAccumulator(str(path)).drain()
@@ -0,0 +1,97 @@
+from importlib import import_module
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+from app.db.models import NodeGroup, Proxy, User
+from app.models.proxy import ProxyTypes
+from app.models.user import UserStatus
+from app.xray.config import XRayConfig, clients_digest
+
+# the module, app.xray.config is the loaded config once app.xray is imported
+xray_config = import_module("app.xray.config")
+
+CONFIG = {
+    "inbounds": [
+        {
+            "tag": "Shadowsocks TCP",
+            "port": 1080,
+            "protocol": "shadowsocks",
+            "settings": {"clients": [{"email": "static", "password": "static"}], "network": "tcp,udp"}
+        }
+    ],
+    "outbounds": [{"protocol": "freedom", "tag": "DIRECT"}]
+}
+TAG = "Shadowsocks TCP"
+
+
+@pytest.fixture
+def config(monkeypatch):
+    """A config whose users are loaded from an in-memory database"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)
+
+    with session() as db:
+        db.add_all([NodeGroup(id=1, name="EU"), NodeGroup(id=2, name="US")])
+        for user_id, status, node_group_id in [(1, UserStatus.active, None),
+                                               (2, UserStatus.active, 1),
+                                               (3, UserStatus.on_hold, 1),
+                                               (4, UserStatus.active, 2),
+                                               (5, UserStatus.disabled, 1)]:
+            db.add(User(id=user_id, username=f"user{user_id}", status=status, node_group_id=node_group_id,
+                        proxies=[Proxy(type=ProxyTypes.Shadowsocks, settings={"password": f"pass{user_id}"})]))
+        db.commit()
+
+    monkeypatch.setattr(xray_config, "GetDB", session)
+    return XRayConfig(CONFIG)
+
+
+def emails(config: XRayConfig) -> set:
+    return {client["email"] for client in config.get_inbound(TAG)["settings"]["clients"]}
+
+
+def test_cores_without_a_group_carry_every_user(config):
+    assert emails(config.include_db_users()) == {"static", "1.user1", "2.user2", "3.user3", "4.user4"}
+    assert set(config.get_inbound_clients(TAG)) == {"static", "1.user1", "2.user2", "3.user3", "4.user4"}
+
+
+def test_cores_of_a_group_carry_the_users_of_the_group_only(config):
+    assert emails(config.include_db_users(node_group_id=1)) == {"static", "2.user2", "3.user3"}
+    assert set(config.get_inbound_clients(TAG, node_group_id=2)) == {"static", "4.user4"}
+    assert config.get_group_size(1) == 2
+    assert config.get_group_size(3) == 0
+    assert emails(config.include_db_users(node_group_id=3)) == {"static"}
+
+
+def test_moving_a_user_to_another_group(config):
+    config.include_db_users()
+
+    previous_group_id = config.set_user_clients("2.user2", {TAG: {"password": "pass2"}}, node_group_id=2)
+
+    assert previous_group_id == 1
+    assert set(config.get_inbound_clients(TAG, node_group_id=1)) == {"static", "3.user3"}
+    assert set(config.get_inbound_clients(TAG, node_group_id=2)) == {"static", "2.user2", "4.user4"}
+    assert "2.user2" in config.get_inbound_clients(TAG)
+
+
+def test_removed_users_leave_their_group(config):
+    config.include_db_users()
+
+    assert config.remove_user_clients("3.user3") == 1
+    assert config.get_group_size(1) == 1
+    assert "3.user3" not in config.get_inbound_clients(TAG)
+
+
+def test_clients_digests_follow_the_clients_of_each_group(config):
+    config.include_db_users()
+    config.set_user_clients("2.user2", {TAG: {"password": "pass2"}}, node_group_id=2)
+    config.set_user_clients("6.user6", {TAG: {"password": "pass6"}}, node_group_id=1)
+    config.remove_user_clients("1.user1")
+
+    for node_group_id in (None, 1, 2):
+        expected = clients_digest(config.get_inbound_clients(TAG, node_group_id))
+        assert config.get_clients_digest(TAG, node_group_id) == expected
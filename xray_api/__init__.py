@@ -1,15 +1,22 @@
 from . import exceptions
 from . import exceptions as exc
 from . import types
+from .aio import AsyncXRay
 from .proxyman import Proxyman
 from .stats import Stats
 
 
 class XRay(Proxyman, Stats):
-    pass
+    @property
+    def aio(self) -> AsyncXRay:
+        """The asyncio API of the same core, see `AsyncXRayBase` for the event loop it can be used from"""
+        if getattr(self, "_aio", None) is None:
+            self._aio = AsyncXRay(self.address, self.port, self.ssl_cert, self.ssl_target_name)
+        return self._aio
 
 
 __all__ = [
+    "AsyncXRay",
     "XRay",
     "exceptions",
     "exc",
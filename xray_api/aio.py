@@ -0,0 +1,171 @@
+import typing
+
+import grpc
+import grpc.aio
+
+from .base import CHANNEL_OPTIONS
+from .exceptions import RelatedError
+from .proto.app.proxyman.command import command_pb2 as proxyman_pb2
+from .proto.app.proxyman.command import command_pb2_grpc as proxyman_pb2_grpc
+from .proto.app.stats.command import command_pb2 as stats_pb2
+from .proto.app.stats.command import command_pb2_grpc as stats_pb2_grpc
+from .proto.common.protocol import user_pb2
+from .stats import RawStatsServiceStub, StatResponse, SysStatsResponse
+from .types.account import Account
+from .types.message import Message, TypedMessage
+
+
+class AsyncXRayBase(object):
+    """
+    Base of the asyncio API, on grpc.aio.
+
+    A grpc.aio channel belongs to the event loop it's made in, so the channel is made
+    on the first call and every call has to be made from that same loop.
+    Calls without a timeout use `timeout` as their deadline.
+    """
+
+    def __init__(self, address: str, port: int, ssl_cert: bytes = None, ssl_target_name: str = None,
+                 timeout: float = None):
+        self.address = address
+        self.port = port
+        self.ssl_cert = ssl_cert
+        self.ssl_target_name = ssl_target_name
+        self.timeout = timeout
+        self._channel = None
+        self._stubs = {}
+
+    @property
+    def channel(self) -> grpc.aio.Channel:
+        if self._channel is None:
+            if self.ssl_cert is None:
+                self._channel = grpc.aio.insecure_channel(f"{self.address}:{self.port}", options=CHANNEL_OPTIONS)
+            else:
+                creds = grpc.ssl_channel_credentials(root_certificates=self.ssl_cert)
+                opts = CHANNEL_OPTIONS
+                if self.ssl_target_name is not None:
+                    opts += (('grpc.ssl_target_name_override', self.ssl_target_name,),)
+                self._channel = grpc.aio.secure_channel(f"{self.address}:{self.port}",
+                                                        credentials=creds,
+                                                        options=opts)
+        return self._channel
+
+    async def close(self):
+        if self._channel is not None:
+            channel, self._channel = self._channel, None
+            self._stubs.clear()
+            await channel.close()
+
+    def _stub(self, stub_class):
+        stub = self._stubs.get(stub_class)
+        if stub is None:
+            stub = self._stubs[stub_class] = stub_class(self.channel)
+        return stub
+
+    def _timeout(self, timeout: typing.Optional[float]) -> typing.Optional[float]:
+        return self.timeout if timeout is None else timeout
+
+
+class AsyncStats(AsyncXRayBase):
+    async def get_sys_stats(self, timeout: float = None) -> SysStatsResponse:
+        try:
+            stub = self._stub(stats_pb2_grpc.StatsServiceStub)
+            r = await stub.GetSysStats(stats_pb2.SysStatsRequest(), timeout=self._timeout(timeout))
+
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+        return SysStatsResponse(
+            num_goroutine=r.NumGoroutine,
+            num_gc=r.NumGC,
+            alloc=r.Alloc,
+            total_alloc=r.TotalAlloc,
+            sys=r.Sys,
+            mallocs=r.Mallocs,
+            frees=r.Frees,
+            live_objects=r.LiveObjects,
+            pause_total_ns=r.PauseTotalNs,
+            uptime=r.Uptime
+        )
+
+    async def query_stats(self, pattern: str, reset: bool = False, timeout: float = None) -> typing.List[StatResponse]:
+        try:
+            stub = self._stub(stats_pb2_grpc.StatsServiceStub)
+            r = await stub.QueryStats(stats_pb2.QueryStatsRequest(pattern=pattern, reset=reset),
+                                      timeout=self._timeout(timeout))
+
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+        stats = []
+        for stat in r.stat:
+            type, name, _, link = stat.name.split('>>>')
+            stats.append(StatResponse(name, type, link, stat.value))
+        return stats
+
+    async def query_stats_data(self, pattern: str, reset: bool = False, timeout: float = None) -> bytes:
+        """Returns the serialized QueryStatsResponse, for callers which parse many stats in bulk"""
+        try:
+            stub = self._stub(RawStatsServiceStub)
+            return await stub.QueryStats(stats_pb2.QueryStatsRequest(pattern=pattern, reset=reset),
+                                         timeout=self._timeout(timeout))
+
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+    async def get_users_stats(self, reset: bool = False, timeout: float = None) -> typing.List[StatResponse]:
+        return await self.query_stats("user>>>", reset=reset, timeout=timeout)
+
+    async def get_inbounds_stats(self, reset: bool = False, timeout: float = None) -> typing.List[StatResponse]:
+        return await self.query_stats("inbound>>>", reset=reset, timeout=timeout)
+
+    async def get_outbounds_stats(self, reset: bool = False, timeout: float = None) -> typing.List[StatResponse]:
+        return await self.query_stats("outbound>>>", reset=reset, timeout=timeout)
+
+
+class AsyncProxyman(AsyncXRayBase):
+    async def get_inbound_users(self, tag: str, timeout: float = None) -> typing.List[user_pb2.User]:
+        try:
+            stub = self._stub(proxyman_pb2_grpc.HandlerServiceStub)
+            r = await stub.GetInboundUsers(proxyman_pb2.GetInboundUserRequest(tag=tag),
+                                           timeout=self._timeout(timeout))
+
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+        return list(r.users)
+
+    async def alter_inbound(self, tag: str, operation: TypedMessage, timeout: float = None) -> bool:
+        stub = self._stub(proxyman_pb2_grpc.HandlerServiceStub)
+        try:
+            await stub.AlterInbound(proxyman_pb2.AlterInboundRequest(tag=tag, operation=operation),
+                                    timeout=self._timeout(timeout))
+            return True
+
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+    async def add_inbound_user(self, tag: str, user: Account, timeout: float = None) -> bool:
+        return await self.alter_inbound(
+            tag=tag,
+            operation=Message(
+                proxyman_pb2.AddUserOperation(
+                    user=user_pb2.User(
+                        level=user.level,
+                        email=user.email,
+                        account=user.message
+                    )
+                )
+            ), timeout=timeout)
+
+    async def remove_inbound_user(self, tag: str, email: str, timeout: float = None) -> bool:
+        return await self.alter_inbound(
+            tag=tag,
+            operation=Message(
+                proxyman_pb2.RemoveUserOperation(
+                    email=email
+                )
+            ), timeout=timeout)
+
+
+class AsyncXRay(AsyncProxyman, AsyncStats):
+    pass
@@ -1,19 +1,37 @@
 import grpc
 
+# xray's grpc server drops clients which ping more often than every 5 minutes,
+# and a QueryStats response of every user easily exceeds the default 4MB limit
+CHANNEL_OPTIONS = (
+    ('grpc.keepalive_time_ms', 300_000),
+    ('grpc.keepalive_timeout_ms', 20_000),
+    ('grpc.max_receive_message_length', -1),
+)
+
 
 class XRayBase(object):
     def __init__(self, address: str, port: int, ssl_cert: str = None, ssl_target_name: str = None):
+        self.address = address
+        self.port = port
+        self.ssl_cert = ssl_cert
+        self.ssl_target_name = ssl_target_name
+        self._stubs = {}
+
         if ssl_cert is None:
-            self.address = address
-            self.port = port
-            self._channel = grpc.insecure_channel(f"{address}:{port}")
+            self._channel = grpc.insecure_channel(f"{address}:{port}", options=CHANNEL_OPTIONS)
 
         else:
-            self.address = address
-            self.port = port
             creds = grpc.ssl_channel_credentials(root_certificates=ssl_cert)
+            opts = CHANNEL_OPTIONS
             if ssl_target_name is not None:
-                opts = (('grpc.ssl_target_name_override', ssl_target_name,),)
+                opts += (('grpc.ssl_target_name_override', ssl_target_name,),)
             self._channel = grpc.secure_channel(f"{address}:{port}",
                                                 credentials=creds,
                                                 options=opts)
+
+    def _stub(self, stub_class):
+        """Returns the stub of a service, stubs are made once per channel"""
+        stub = self._stubs.get(stub_class)
+        if stub is None:
+            stub = self._stubs[stub_class] = stub_class(self._channel)
+        return stub
@@ -1,3 +1,5 @@
+import typing
+
 import grpc
 
 from .base import XRayBase
@@ -15,7 +17,7 @@ except ModuleNotFoundError:
 
 class Proxyman(XRayBase):
     def alter_inbound(self, tag: str, operation: TypedMessage, timeout: int = None) -> bool:
-        stub = command_pb2_grpc.HandlerServiceStub(self._channel)
+        stub = self._stub(command_pb2_grpc.HandlerServiceStub)
         try:
             stub.AlterInbound(command_pb2.AlterInboundRequest(tag=tag, operation=operation), timeout=timeout)
             return True
@@ -24,7 +26,7 @@ class Proxyman(XRayBase):
             raise RelatedError(e)
 
     def alter_outbound(self, tag: str, operation: TypedMessage, timeout: int = None) -> bool:
-        stub = command_pb2_grpc.HandlerServiceStub(self._channel)
+        stub = self._stub(command_pb2_grpc.HandlerServiceStub)
         try:
             stub.AlterInbound(command_pb2.AlterOutboundRequest(tag=tag, operation=operation), timeout=timeout)
             return True
@@ -32,6 +34,23 @@ class Proxyman(XRayBase):
         except grpc.RpcError as e:
             raise RelatedError(e)
 
+    def get_inbound_users(self, tag: str, timeout: int = None) -> typing.List[user_pb2.User]:
+        """Returns the users of an inbound, as the core has them. Needs Xray v25 or later"""
+        stub = self._stub(command_pb2_grpc.HandlerServiceStub)
+        try:
+            return list(stub.GetInboundUsers(command_pb2.GetInboundUserRequest(tag=tag), timeout=timeout).users)
+
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+    def get_inbound_users_count(self, tag: str, timeout: int = None) -> int:
+        stub = self._stub(command_pb2_grpc.HandlerServiceStub)
+        try:
+            return stub.GetInboundUsersCount(command_pb2.GetInboundUserRequest(tag=tag), timeout=timeout).count
+
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
     def add_inbound_user(self, tag: str, user: Account, timeout: int = None) -> bool:
         return self.alter_inbound(
             tag=tag,
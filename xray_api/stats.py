@@ -51,10 +51,20 @@ class OutboundStatsResponse:
     downlink: int
 
 
+class RawStatsServiceStub(object):
+    """StatsService stub which returns the QueryStats response serialized"""
+
+    def __init__(self, channel):
+        self.QueryStats = channel.unary_unary(
+            '/xray.app.stats.command.StatsService/QueryStats',
+            request_serializer=command_pb2.QueryStatsRequest.SerializeToString,
+        )
+
+
 class Stats(XRayBase):
     def get_sys_stats(self, timeout: int = None) -> SysStatsResponse:
         try:
-            stub = command_pb2_grpc.StatsServiceStub(self._channel)
+            stub = self._stub(command_pb2_grpc.StatsServiceStub)
             r = stub.GetSysStats(command_pb2.SysStatsRequest(), timeout=timeout)
 
         except grpc.RpcError as e:
@@ -75,7 +85,7 @@ class Stats(XRayBase):
 
     def query_stats(self, pattern: str, reset: bool = False, timeout: int = None) -> typing.Iterable[StatResponse]:
         try:
-            stub = command_pb2_grpc.StatsServiceStub(self._channel)
+            stub = self._stub(command_pb2_grpc.StatsServiceStub)
             r = stub.QueryStats(command_pb2.QueryStatsRequest(pattern=pattern, reset=reset), timeout=timeout)
 
         except grpc.RpcError as e:
@@ -85,6 +95,15 @@ class Stats(XRayBase):
             type, name, _, link = stat.name.split('>>>')
             yield StatResponse(name, type, link, stat.value)
 
+    def query_stats_data(self, pattern: str, reset: bool = False, timeout: int = None) -> bytes:
+        """Returns the serialized QueryStatsResponse, for callers which parse many stats in bulk"""
+        try:
+            stub = self._stub(RawStatsServiceStub)
+            return stub.QueryStats(command_pb2.QueryStatsRequest(pattern=pattern, reset=reset), timeout=timeout)
+
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
     def get_users_stats(self, reset: bool = False, timeout: int = None) -> typing.Iterable[StatResponse]:
         return self.query_stats("user>>>", reset=reset, timeout=timeout)
 